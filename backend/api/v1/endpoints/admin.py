@@ -6,8 +6,11 @@ import os
 import signal
 import sys
 from pathlib import Path
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from backend.core.logging import logger
+from backend.services.batch_stages import STAGES as BATCH_STAGES
 
 router = APIRouter()
 
@@ -19,6 +22,7 @@ DATA_DIR = PROJECT_ROOT / "backend" / "data"
 STATUS_FILE = DATA_DIR / "batch_status.json"
 LOG_FILE = DATA_DIR / "batch_log.txt"
 PID_FILE = DATA_DIR / "batch.pid"
+PIPELINE_FILE = DATA_DIR / "batch_work" / "pipeline.json"
 
 
 def ensure_data_dir():
@@ -148,8 +152,24 @@ async def batch_logs():
     }
 
 
+@router.get("/batch/pipeline")
+async def batch_pipeline():
+    """获取批处理各阶段的完成情况（没有未完成的流水线时 completed 为空）"""
+    completed = []
+    if PIPELINE_FILE.exists():
+        with open(PIPELINE_FILE, 'r', encoding='utf-8') as f:
+            completed = json.load(f).get('completed', [])
+    return {
+        "stages": [{"name": stage, "completed": stage in completed} for stage in BATCH_STAGES]
+    }
+
+
 @router.post("/batch/start")
-async def start_batch():
+async def start_batch(
+    full: bool = Query(False, description="忽略增量状态，全量重算"),
+    stage: Optional[str] = Query(None, pattern=f"^({'|'.join(BATCH_STAGES)})$",
+                                 description="只执行指定阶段")
+):
     """启动批处理任务"""
     ensure_data_dir()
     
@@ -180,11 +200,15 @@ async def start_batch():
             "updated_at": None
         })
         
+        command = [sys.executable, str(spark_script)] + (['--full'] if full else [])
+        if stage:
+            command += ['--stage', stage]
+        
         # 启动子进程运行批处理，设置正确的工作目录
         if sys.platform == 'win32':
             # Windows: 使用 CREATE_NEW_PROCESS_GROUP
             process = subprocess.Popen(
-                [sys.executable, str(spark_script)],
+                command,
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
                 cwd=str(project_root),
@@ -193,7 +217,7 @@ async def start_batch():
         else:
             # Unix/Linux
             process = subprocess.Popen(
-                [sys.executable, str(spark_script)],
+                command,
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
                 cwd=str(project_root),
@@ -248,7 +272,7 @@ async def stop_batch():
 
 @router.post("/index/reload")
 async def reload_index():
-    """重新加载电影索引"""
+    """重新加载电影索引（同时清空电影缓存）"""
     try:
         from backend.services.movie_service import MovieIndexService
         index_service = MovieIndexService()
@@ -257,3 +281,16 @@ async def reload_index():
     except Exception as e:
         logger.error(f"重载索引失败: {e}")
         raise HTTPException(status_code=500, detail=f"重载失败: {str(e)}")
+
+
+@router.get("/export/movies")
+async def export_movies():
+    """流式导出 movies 表（NDJSON，每行一部电影）"""
+    from backend.services.movie_service import MovieService
+    movie_service = MovieService()
+    
+    async def lines():
+        async for movie in movie_service.export_movies():
+            yield json.dumps(movie, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -2,25 +2,38 @@
 
 from fastapi import APIRouter
 from backend.models.schemas import HealthResponse
-from backend.db.hbase import hbase_connection
+from backend.db.hbase import hbase_pool
+from backend.db.executor import hbase_executor
+from backend.db.repositories.movie_repository import movie_cache
 
 router = APIRouter()
 
 
+def _ping_hbase():
+    """租借一个连接并执行一次轻量请求"""
+    with hbase_pool.connection() as conn:
+        conn.tables()
+
+
 @router.get("/", response_model=HealthResponse)
 async def health_check():
     """健康检查接口"""
     try:
-        hbase_connection.connect()
+        await hbase_executor.run(_ping_hbase)
         return HealthResponse(
             status="ok",
             hbase_connected=True,
-            version="1.0.0"
+            version="1.0.0",
+            hbase_pool=hbase_pool.stats(),
+            hbase_executor=hbase_executor.stats(),
+            movie_cache=movie_cache.stats()
         )
     except Exception:
         return HealthResponse(
             status="error",
             hbase_connected=False,
-            version="1.0.0"
+            version="1.0.0",
+            hbase_pool=hbase_pool.stats(),
+            hbase_executor=hbase_executor.stats(),
+            movie_cache=movie_cache.stats()
         )
-
@@ -2,7 +2,11 @@
 
 from fastapi import APIRouter, HTTPException, Query
 from backend.services.movie_service import MovieService
-from backend.models.schemas import MovieListResponse, MovieSchema, SearchResponse
+from backend.models.schemas import (
+    BatchMovieResponse, MovieListResponse, MovieSchema, SearchResponse,
+    RatingListResponse, RatingSchema, RatingStatsSchema,
+)
+from backend.core.config import settings
 from backend.core.logging import logger
 
 router = APIRouter()
@@ -15,7 +19,7 @@ async def get_featured_movies(
 ):
     """获取固定推荐电影（ID 1-x）"""
     try:
-        movies = movie_service.get_featured_movies(count)
+        movies = await movie_service.get_featured_movies(count)
         return {
             "movies": [MovieSchema.model_validate(m.__dict__) for m in movies],
             "total": len(movies)
@@ -28,11 +32,13 @@ async def get_featured_movies(
 @router.get("", response_model=MovieListResponse)
 async def list_movies(
     page: int = Query(1, ge=1, description="页码"),
-    page_size: int = Query(20, ge=1, le=100, description="每页数量")
+    page_size: int = Query(20, ge=1, le=100, description="每页数量"),
+    sort: str = Query("rating", pattern="^(rating|rating_count|title|year|id)$",
+                      description="排序方式：rating / rating_count / title / year / id")
 ):
     """获取电影列表（分页）"""
     try:
-        movies, total, total_pages = movie_service.get_movies_list(page, page_size)
+        movies, total, total_pages = await movie_service.get_movies_list(page, page_size, sort)
         
         return MovieListResponse(
             movies=[MovieSchema.model_validate(m.__dict__) for m in movies],
@@ -65,11 +71,31 @@ async def search_movies(
         raise HTTPException(status_code=500, detail="搜索失败")
 
 
+@router.get("/batch", response_model=BatchMovieResponse)
+async def get_movies_batch(
+    ids: str = Query(..., min_length=1, description="逗号分隔的电影ID，如 1,2,3")
+):
+    """批量获取电影（按请求顺序返回，一次往返）"""
+    movie_ids = [movie_id.strip() for movie_id in ids.split(',') if movie_id.strip()]
+    if len(movie_ids) > settings.max_page_size:
+        raise HTTPException(status_code=400, detail=f"一次最多查询 {settings.max_page_size} 部电影")
+    
+    try:
+        movies, missing = await movie_service.get_movies_by_ids(movie_ids)
+        return BatchMovieResponse(
+            movies=[MovieSchema.model_validate(m.__dict__) for m in movies],
+            missing=missing
+        )
+    except Exception as e:
+        logger.error(f"批量获取电影失败: {e}")
+        raise HTTPException(status_code=500, detail="批量获取电影失败")
+
+
 @router.get("/{movie_id}")
 async def get_movie(movie_id: str):
     """获取电影详情"""
     try:
-        movie = movie_service.get_movie_basic_info(movie_id)
+        movie = await movie_service.get_movie_basic_info(movie_id)
         if not movie:
             raise HTTPException(status_code=404, detail="电影不存在")
         
@@ -85,3 +111,36 @@ async def get_movie(movie_id: str):
     except Exception as e:
         logger.error(f"获取电影详情失败: {e}")
         raise HTTPException(status_code=500, detail="获取电影详情失败")
+
+
+@router.get("/{movie_id}/ratings", response_model=RatingListResponse)
+async def get_movie_ratings(
+    movie_id: str,
+    page: int = Query(1, ge=1, description="页码"),
+    page_size: int = Query(20, ge=1, le=100, description="每页数量")
+):
+    """获取电影评分列表（分页，最新的在前）"""
+    try:
+        ratings, total, total_pages = await movie_service.get_movie_ratings(movie_id, page, page_size)
+        
+        return RatingListResponse(
+            ratings=[RatingSchema.model_validate(r.__dict__) for r in ratings],
+            total=total,
+            page=page,
+            page_size=page_size,
+            total_pages=total_pages
+        )
+    except Exception as e:
+        logger.error(f"获取电影评分列表失败: {e}")
+        raise HTTPException(status_code=500, detail="获取电影评分列表失败")
+
+
+@router.get("/{movie_id}/stats", response_model=RatingStatsSchema)
+async def get_rating_stats(movie_id: str):
+    """获取电影评分统计（含半星粒度的评分分布）"""
+    try:
+        stats = await movie_service.get_rating_stats(movie_id)
+        return RatingStatsSchema(**stats)
+    except Exception as e:
+        logger.error(f"获取评分统计失败: {e}")
+        raise HTTPException(status_code=500, detail="获取评分统计失败")
@@ -0,0 +1,114 @@
+"""进程内缓存"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# get() 未命中时返回的哨兵，与缓存的 None（负缓存）区分
+MISSING = object()
+
+
+class TTLCache:
+    """线程安全的 LRU + TTL 缓存
+
+    超过 maxsize 时淘汰最久未访问的条目，条目在 ttl 秒后过期。
+    值为 None 的条目表示"不存在"（负缓存），使用单独的 negative_ttl。
+
+    clear() 会推进代数（generation）：读取前记下代数、写入时传回，
+    可以丢弃在清空之前就已开始的查询结果，避免把旧数据写回缓存。
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+        self._clears = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    @property
+    def generation(self) -> int:
+        """当前代数，每次 clear() 加一"""
+        return self._generation
+
+    def get(self, key: Hashable) -> Any:
+        """读取缓存，未命中或已过期返回 MISSING"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._expired += 1
+                self._misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            if value is None:
+                self._negative_hits += 1
+            else:
+                self._hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        """写入缓存
+
+        Args:
+            key: 键
+            value: 值，None 表示负缓存
+            generation: 读取数据前记下的代数，与当前代数不一致时放弃写入
+        """
+        if not self.enabled:
+            return
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """删除单个条目"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存并推进代数"""
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+            self._clears += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        """缓存命中统计"""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self._hits,
+                'negative_hits': self._negative_hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'expired': self._expired,
+                'clears': self._clears,
+            }
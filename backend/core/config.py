@@ -13,9 +13,28 @@ class Settings(BaseSettings):
     hbase_host: str = "192.168.98.88"
     hbase_port: int = 9090
     
+    # HBase连接池配置
+    hbase_pool_size: int = 10
+    hbase_pool_timeout: float = 10.0  # 租借连接的等待超时（秒）
+    hbase_pool_recycle: float = 3600.0  # 连接最长存活时间（秒），0 表示不回收
+    hbase_pool_validate_idle: float = 30.0  # 空闲超过该秒数的连接租出前先校验
+    hbase_executor_workers: int = 0  # HBase 线程池大小，0 表示与连接池大小一致
+    
     # 数据库表名
     movies_table: str = "movies"
     ratings_table: str = "ratings"
+    ratings_by_movie_table: str = "ratings_by_movie"
+    ratings_salt_buckets: int = 0  # ratings 行键的盐桶数，0 表示不加盐（须与导入时一致）
+    key_encoding: str = "string"  # 行键编码：string / binary（须与导入时一致）
+    ratings_by_user_table: str = "ratings_by_user"
+    user_wide_rows: bool = False  # 从每用户一行的宽行表读取用户评分（须导入时已写入该表）
+    
+    # 电影缓存配置（find_by_id 读穿缓存）
+    movie_cache_size: int = 10000  # 最大条目数，0 表示关闭缓存
+    movie_cache_ttl: float = 300.0  # 条目有效期（秒）
+    movie_cache_negative_ttl: float = 30.0  # 不存在的电影 ID 的缓存时间（秒）
+    movie_cache_prewarm: int = 0  # 启动时预热评分人数最多的前 N 部电影，0 表示不预热
+    index_check_interval: float = 5.0  # 检查索引文件是否被批处理更新的最小间隔（秒）
     
     # 服务器配置
     server_host: str = "0.0.0.0"
@@ -33,6 +52,11 @@ class Settings(BaseSettings):
     max_search_limit: int = 100
     max_scan_rows: int = 10000
     
+    # 扫描配置
+    scan_caching: int = 1000  # 扫描器每次 RPC 取回的行数
+    scan_page_size: int = 1000  # 流式扫描每页的行数（决定内存占用上限）
+    multi_get_chunk: int = 500  # 批量读取（table.rows）每次请求的行数
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -56,11 +80,29 @@ def load_config_from_yaml(config_path: str = "config.yaml") -> Settings:
     return Settings(
         hbase_host=config_data.get('hbase', {}).get('host', '192.168.98.88'),
         hbase_port=config_data.get('hbase', {}).get('port', 9090),
+        hbase_pool_size=config_data.get('hbase', {}).get('pool', {}).get('size', 10),
+        hbase_pool_timeout=config_data.get('hbase', {}).get('pool', {}).get('timeout', 10.0),
+        hbase_pool_recycle=config_data.get('hbase', {}).get('pool', {}).get('recycle', 3600.0),
+        hbase_pool_validate_idle=config_data.get('hbase', {}).get('pool', {}).get('validate_idle', 30.0),
+        hbase_executor_workers=config_data.get('hbase', {}).get('executor_workers', 0),
         movies_table=config_data.get('database', {}).get('movies_table', 'movies'),
         ratings_table=config_data.get('database', {}).get('ratings_table', 'ratings'),
+        ratings_by_movie_table=config_data.get('database', {}).get('ratings_by_movie_table', 'ratings_by_movie'),
+        ratings_salt_buckets=config_data.get('database', {}).get('ratings_salt_buckets', 0),
+        key_encoding=config_data.get('database', {}).get('key_encoding', 'string'),
+        ratings_by_user_table=config_data.get('database', {}).get('ratings_by_user_table', 'ratings_by_user'),
+        user_wide_rows=config_data.get('database', {}).get('user_wide_rows', False),
+        movie_cache_size=config_data.get('cache', {}).get('movie_size', 10000),
+        movie_cache_ttl=config_data.get('cache', {}).get('movie_ttl', 300.0),
+        movie_cache_negative_ttl=config_data.get('cache', {}).get('movie_negative_ttl', 30.0),
+        movie_cache_prewarm=config_data.get('cache', {}).get('prewarm', 0),
+        index_check_interval=config_data.get('cache', {}).get('index_check_interval', 5.0),
         server_host=config_data.get('server', {}).get('host', '0.0.0.0'),
         server_port=config_data.get('server', {}).get('port', 8000),
         debug=config_data.get('server', {}).get('debug', True),
+        scan_caching=config_data.get('scan', {}).get('caching', 1000),
+        scan_page_size=config_data.get('scan', {}).get('page_size', 1000),
+        multi_get_chunk=config_data.get('scan', {}).get('multi_get_chunk', 500),
     )
 
 
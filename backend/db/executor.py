@@ -0,0 +1,78 @@
+"""HBase 专用线程池
+
+happybase 是同步阻塞的 Thrift 客户端，直接在 async 端点中调用会阻塞事件循环。
+所有 HBase 访问都通过这里的有界线程池执行，事件循环只负责等待结果。
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from backend.core.config import settings
+
+
+class HBaseExecutor:
+    """有界的 HBase 访问线程池
+
+    工作线程数默认与连接池大小一致，保证每个线程最多持有一个连接，
+    不会出现线程在连接池上排队等待的情况。
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="hbase"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        self._completed = 0
+        self._max_queue_depth = 0
+
+    def _invoke(self, func: Callable, *args, **kwargs) -> Any:
+        """在工作线程中执行任务并维护计数"""
+        with self._lock:
+            self._pending -= 1
+            self._active += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """在 HBase 线程池中执行同步函数并等待结果"""
+        with self._lock:
+            self._pending += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._pending)
+        future = self._executor.submit(self._invoke, func, *args, **kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 尚未开始执行的任务被取消后不会再进入 _invoke，需要在这里出队
+            if future.cancel():
+                with self._lock:
+                    self._pending -= 1
+            raise
+
+    def stats(self) -> dict:
+        """线程池运行状态"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'active': self._active,
+                'queue_depth': max(self._pending, 0),
+                'max_queue_depth': self._max_queue_depth,
+                'completed': self._completed,
+            }
+
+    def shutdown(self):
+        """关闭线程池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局线程池实例
+hbase_executor = HBaseExecutor(max_workers=settings.hbase_executor_workers or settings.hbase_pool_size)
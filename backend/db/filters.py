@@ -0,0 +1,43 @@
+"""HBase 过滤器语言（Filter Language）字符串构造
+
+scan(filter=...) 的过滤条件在 RegionServer 上执行，只有匹配的行和单元格
+经 Thrift 传回客户端。
+"""
+
+from typing import Union
+
+
+def quote(value: Union[str, bytes]) -> str:
+    """过滤器参数的单引号字符串，内部的单引号写成两个"""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return "'" + value.replace("'", "''") + "'"
+
+
+def column_substring(family: str, qualifier: str, substring: str) -> str:
+    """某列的值包含 substring（SubstringComparator，不区分大小写）
+
+    缺少该列的行被过滤掉，只比较最新版本
+    """
+    return (f"SingleColumnValueFilter({quote(family)}, {quote(qualifier)}, =, "
+            f"{quote('substring:' + substring)}, true, true)")
+
+
+def key_only() -> str:
+    """只返回行键和列名，值置空"""
+    return "KeyOnlyFilter()"
+
+
+def first_key_only() -> str:
+    """每行只返回第一个单元格"""
+    return "FirstKeyOnlyFilter()"
+
+
+def any_of(*filters: str) -> str:
+    """多个过滤器取或"""
+    return ' OR '.join(f"({f})" for f in filters)
+
+
+def all_of(*filters: str) -> str:
+    """多个过滤器取与"""
+    return ' AND '.join(f"({f})" for f in filters)
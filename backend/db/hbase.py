@@ -1,25 +1,74 @@
 """HBase连接管理"""
 
+import socket
+import threading
+import time
+import queue
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
 import happybase
-from typing import Optional
+from thriftpy2.thrift import TException
+
 from backend.core.config import settings
 from backend.core.logging import logger
 
 
-class HBaseConnection:
-    """HBase连接管理器（单例模式）- 支持自动重连"""
-    
-    _instance: Optional['HBaseConnection'] = None
-    _connection: Optional[happybase.Connection] = None
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
-    
+class NoConnectionsAvailable(RuntimeError):
+    """连接池在租借超时时间内没有可用连接"""
+
+
+class _PoolEntry:
+    """连接池中的一个槽位，记录连接及其生命周期信息"""
+
+    __slots__ = ('connection', 'created_at', 'last_used')
+
+    def __init__(self, connection: Optional[happybase.Connection] = None):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class HBaseConnectionPool:
+    """线程安全的 HBase Thrift 连接池
+
+    - 连接数量有上限（size），连接按需懒创建
+    - 租借时可设置超时，超时抛出 NoConnectionsAvailable
+    - 空闲超过 validate_idle 秒的连接在租出前先校验
+    - 存活超过 recycle 秒的连接在租出前回收重建
+    - 同一线程内嵌套租借复用同一个连接
+    """
+
+    def __init__(
+        self,
+        size: int = 10,
+        timeout: float = 10.0,
+        recycle: float = 3600.0,
+        validate_idle: float = 30.0,
+    ):
+        if size < 1:
+            raise ValueError("连接池大小必须大于 0")
+
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.validate_idle = validate_idle
+
+        self._queue: "queue.LifoQueue[_PoolEntry]" = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._queue.put(_PoolEntry())
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._created = 0
+        self._recycled = 0
+        self._discarded = 0
+        self._wait_timeouts = 0
+
     def _create_connection(self) -> happybase.Connection:
         """创建新的HBase连接"""
-        return happybase.Connection(
+        connection = happybase.Connection(
             host=settings.hbase_host,
             port=settings.hbase_port,
             timeout=30000,  # 30秒超时
@@ -30,82 +79,139 @@ class HBaseConnection:
             transport='buffered',
             protocol='binary'
         )
-    
-    def _test_connection(self) -> bool:
+        with self._lock:
+            self._created += 1
+        return connection
+
+    def _test_connection(self, connection: happybase.Connection) -> bool:
         """测试连接是否有效"""
-        if self._connection is None:
-            return False
         try:
             # 尝试列出表来测试连接
-            self._connection.tables()
+            connection.tables()
             return True
         except Exception as e:
             logger.warning(f"连接测试失败: {e}")
             return False
-    
-    def connect(self) -> happybase.Connection:
-        """建立或重连HBase连接
-        
-        Returns:
-            happybase.Connection: HBase连接对象
-        """
-        # 如果连接不存在或已失效，重新创建
-        if not self._test_connection():
-            try:
-                # 关闭旧连接
-                if self._connection:
-                    try:
-                        self._connection.close()
-                    except:
-                        pass
-                    self._connection = None
-                
-                # 创建新连接
-                self._connection = self._create_connection()
-                logger.info(f"HBase连接成功: {settings.hbase_host}:{settings.hbase_port}")
-            except Exception as e:
-                logger.error(f"HBase连接失败: {e}")
-                raise
-        
-        return self._connection
-    
-    def get_connection(self) -> happybase.Connection:
-        """获取HBase连接（自动重连）
-        
-        Returns:
-            happybase.Connection: HBase连接对象
-        """
-        return self.connect()
-    
-    def get_movies_table(self) -> happybase.Table:
-        """获取movies表（自动重连）
-        
-        Returns:
-            happybase.Table: movies表对象
-        """
-        conn = self.connect()
-        return conn.table(settings.movies_table)
-    
-    def get_ratings_table(self) -> happybase.Table:
-        """获取ratings表（自动重连）
-        
-        Returns:
-            happybase.Table: ratings表对象
+
+    @staticmethod
+    def _close_quietly(connection: Optional[happybase.Connection]):
+        """关闭连接，忽略关闭时的异常"""
+        if connection is None:
+            return
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _prepare(self, entry: _PoolEntry):
+        """租出前的检查：回收过旧连接、校验空闲连接、补建缺失连接"""
+        now = time.monotonic()
+
+        if entry.connection is not None and self.recycle and now - entry.created_at > self.recycle:
+            self._close_quietly(entry.connection)
+            entry.connection = None
+            with self._lock:
+                self._recycled += 1
+
+        if (entry.connection is not None and self.validate_idle is not None
+                and now - entry.last_used > self.validate_idle
+                and not self._test_connection(entry.connection)):
+            self._close_quietly(entry.connection)
+            entry.connection = None
+            with self._lock:
+                self._discarded += 1
+
+        if entry.connection is None:
+            entry.connection = self._create_connection()
+            entry.created_at = time.monotonic()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[happybase.Connection]:
+        """租借一个连接，退出上下文时自动归还
+
+        Args:
+            timeout: 等待可用连接的秒数，None 使用连接池默认值
+
+        Raises:
+            NoConnectionsAvailable: 超时仍没有空闲连接
         """
-        conn = self.connect()
-        return conn.table(settings.ratings_table)
-    
+        # 同一线程嵌套租借时直接复用，避免自身死锁
+        entry = getattr(self._local, 'entry', None)
+        if entry is not None:
+            yield entry.connection
+            return
+
+        wait = self.timeout if timeout is None else timeout
+        try:
+            entry = self._queue.get(block=True, timeout=wait)
+        except queue.Empty:
+            with self._lock:
+                self._wait_timeouts += 1
+            raise NoConnectionsAvailable(f"等待 HBase 连接超时 ({wait} 秒)")
+
+        with self._lock:
+            self._in_use += 1
+
+        try:
+            self._prepare(entry)
+            self._local.entry = entry
+            yield entry.connection
+        except (TException, socket.error):
+            # 连接级错误：丢弃这个连接，下次租借时重建
+            logger.warning("HBase 连接异常，丢弃该连接")
+            self._close_quietly(entry.connection)
+            entry.connection = None
+            with self._lock:
+                self._discarded += 1
+            raise
+        finally:
+            self._local.entry = None
+            entry.last_used = time.monotonic()
+            with self._lock:
+                self._in_use -= 1
+            self._queue.put(entry)
+
+    def connect(self):
+        """预热：建立一个连接并验证可用性"""
+        with self.connection() as conn:
+            conn.tables()
+        logger.info(f"HBase连接成功: {settings.hbase_host}:{settings.hbase_port} (连接池大小 {self.size})")
+
+    def stats(self) -> dict:
+        """连接池运行状态"""
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': self.size - self._in_use,
+                'created': self._created,
+                'recycled': self._recycled,
+                'discarded': self._discarded,
+                'wait_timeouts': self._wait_timeouts,
+            }
+
     def close(self):
-        """关闭HBase连接"""
-        if self._connection:
+        """关闭连接池中所有空闲连接"""
+        closed = 0
+        entries = []
+        while True:
             try:
-                self._connection.close()
-            except:
-                pass
-            self._connection = None
-            logger.info("HBase连接已关闭")
-
+                entries.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for entry in entries:
+            if entry.connection is not None:
+                self._close_quietly(entry.connection)
+                entry.connection = None
+                closed += 1
+            self._queue.put(entry)
+        logger.info(f"HBase连接池已关闭 ({closed} 个连接)")
 
-# 全局连接实例
-hbase_connection = HBaseConnection()
 
+# 全局连接池实例
+hbase_pool = HBaseConnectionPool(
+    size=settings.hbase_pool_size,
+    timeout=settings.hbase_pool_timeout,
+    recycle=settings.hbase_pool_recycle,
+    validate_idle=settings.hbase_pool_validate_idle,
+)
@@ -0,0 +1,110 @@
+"""按电影累计评分统计（numpy 向量化）
+
+导入脚本的 arrow 引擎和批处理任务的 Pandas 路径共用。以电影 ID 为下标的
+定长数组保存评分总和与半星直方图，每个数据块用两次 bincount 合并，
+最后一次性转换为 {movie_id: {'avg', 'count', 'hist'}}。
+数组可以保存为 .npz 文件，供批处理任务增量累加；自创建或加载以来
+有新评分的电影会被标记，只输出这些电影的统计。
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from backend.db.schema import RATING_BUCKETS
+
+
+class ArrayRatingStats:
+    """按数据块累计评分统计：以电影 ID 为下标的 numpy 数组，用 bincount 聚合"""
+    
+    def __init__(self):
+        self._sum = np.zeros(0, dtype=np.float64)
+        self._hist = np.zeros((0, len(RATING_BUCKETS)), dtype=np.int64)
+        self._changed = np.zeros(0, dtype=bool)
+    
+    def _grow(self, size: int):
+        if size <= len(self._sum):
+            return
+        size = max(size, len(self._sum) * 2)
+        self._sum = np.concatenate([self._sum, np.zeros(size - len(self._sum))])
+        self._hist = np.concatenate([
+            self._hist, np.zeros((size - len(self._hist), len(RATING_BUCKETS)), dtype=np.int64)
+        ])
+        self._changed = np.concatenate([self._changed, np.zeros(size - len(self._changed), dtype=bool)])
+    
+    def add(self, movie_ids: np.ndarray, ratings: np.ndarray):
+        if len(movie_ids) == 0:
+            return
+        movie_ids = movie_ids.astype(np.int64, copy=False)
+        self._grow(int(movie_ids.max()) + 1)
+        size = len(self._sum)
+        self._sum += np.bincount(movie_ids, weights=ratings, minlength=size)
+        # 与 schema.rating_bucket 相同的半星档位
+        buckets = np.clip(np.rint(ratings * 2).astype(np.int64) - 1, 0, len(RATING_BUCKETS) - 1)
+        flat = np.bincount(movie_ids * len(RATING_BUCKETS) + buckets, minlength=size * len(RATING_BUCKETS))
+        self._hist += flat.reshape(size, len(RATING_BUCKETS))
+        self._changed[movie_ids] = True
+    
+    def add_histograms(self, histograms: Dict[str, List[int]]):
+        """按电影合并直方图增量（可以为负，例如覆盖旧评分），评分总和由档位精确还原"""
+        if not histograms:
+            return
+        movie_ids = np.array([int(movie_id) for movie_id in histograms], dtype=np.int64)
+        deltas = np.array(list(histograms.values()), dtype=np.int64)
+        self._grow(int(movie_ids.max()) + 1)
+        np.add.at(self._hist, movie_ids, deltas)
+        np.add.at(self._sum, movie_ids, deltas @ np.array(RATING_BUCKETS))
+        self._changed[movie_ids] = True
+    
+    @classmethod
+    def from_result(cls, results: Dict[str, Dict]) -> 'ArrayRatingStats':
+        """由 result() 形式的字典重建（例如 Spark 引擎的聚合结果）"""
+        stats = cls()
+        if not results:
+            return stats
+        movie_ids = np.array([int(movie_id) for movie_id in results], dtype=np.int64)
+        stats._grow(int(movie_ids.max()) + 1)
+        stats._sum[movie_ids] = [s['avg'] * s['count'] for s in results.values()]
+        stats._hist[movie_ids] = [s['hist'] for s in results.values()]
+        stats._changed[movie_ids] = True
+        return stats
+    
+    def result(self, changed_only: bool = False) -> Dict[str, Dict]:
+        """{movie_id: {'avg', 'count', 'hist'}}
+        
+        changed_only 为 True 时只包含创建或加载以来有新评分的电影
+        """
+        counts = self._hist.sum(axis=1)
+        present = counts > 0
+        if changed_only:
+            present &= self._changed
+        return {
+            str(movie_id): {
+                'avg': float(self._sum[movie_id] / counts[movie_id]),
+                'count': int(counts[movie_id]),
+                'hist': self._hist[movie_id].tolist()
+            }
+            for movie_id in np.flatnonzero(present)
+        }
+    
+    def save(self, path: Path, meta: dict):
+        """保存数组和元数据（先写临时文件再替换，中途失败不会损坏旧文件）"""
+        path = Path(path)
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(temp_path, 'wb') as f:
+            np.savez(f, sum=self._sum, hist=self._hist, meta=np.array(json.dumps(meta)))
+        os.replace(temp_path, path)
+    
+    @classmethod
+    def load(cls, path: Path) -> Tuple['ArrayRatingStats', dict]:
+        """读取 save() 保存的文件，返回 (统计, 元数据)；加载后所有电影都视为未变化"""
+        with np.load(path) as data:
+            stats = cls()
+            stats._sum = data['sum']
+            stats._hist = data['hist']
+            stats._changed = np.zeros(len(stats._sum), dtype=bool)
+            meta = json.loads(str(data['meta']))
+        return stats, meta
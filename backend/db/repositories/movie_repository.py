@@ -1,11 +1,28 @@
 """电影数据仓库"""
 
-from typing import List, Optional, Tuple
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 from functools import wraps
-from backend.db.hbase import hbase_connection
+from backend.db.hbase import hbase_pool
+from backend.db.executor import hbase_executor
+from backend.db import filters
+from backend.db.schema import HISTOGRAM_COLUMNS, RowKeyCodec, histogram_from_row, histogram_to_distribution
+from backend.core.cache import MISSING, TTLCache
 from backend.core.config import settings
 from backend.core.logging import logger
 
+# 列表和搜索结果只需要的列（不含直方图）
+LIST_COLUMNS = [b'info:title', b'info:genres', b'info:avg_rating', b'info:rating_count']
+
+# 电影详情（find_by_id / find_by_ids）需要的列
+DETAIL_COLUMNS = LIST_COLUMNS + HISTOGRAM_COLUMNS
+
+# 按电影 ID 缓存 find_by_id 的结果（含不存在的 ID），索引文件更新时整体清空
+movie_cache = TTLCache(
+    maxsize=settings.movie_cache_size,
+    ttl=settings.movie_cache_ttl,
+    negative_ttl=settings.movie_cache_negative_ttl
+)
+
 
 def retry_on_connection_error(max_retries=2):
     """连接错误时自动重试的装饰器"""
@@ -15,9 +32,7 @@ def retry_on_connection_error(max_retries=2):
             last_error = None
             for attempt in range(max_retries):
                 try:
-                    # 每次重试前刷新表连接
-                    if hasattr(self, '_refresh_table'):
-                        self._refresh_table()
+                    # 失效连接已被连接池丢弃，重试时会租到新连接
                     return func(self, *args, **kwargs)
                 except Exception as e:
                     last_error = e
@@ -38,61 +53,205 @@ class MovieRepository:
     """电影数据访问对象"""
     
     def __init__(self):
-        self.table = None
-        self._refresh_table()
-    
-    def _refresh_table(self):
-        """刷新表连接"""
-        self.table = hbase_connection.get_movies_table()
+        self.table_name = settings.movies_table
+        self.keys = RowKeyCodec(settings.key_encoding, settings.ratings_salt_buckets)
     
-    @retry_on_connection_error(max_retries=2)
     def find_by_id(self, movie_id: str) -> Optional[dict]:
-        """根据ID查找电影
+        """根据ID查找电影（读穿缓存）
         
         Args:
             movie_id: 电影ID
             
         Returns:
-            Optional[dict]: 电影数据字典，不存在返回None
+            Optional[dict]: 电影数据字典（含评分分布），不存在返回None
         """
+        cached = movie_cache.get(movie_id)
+        if cached is not MISSING:
+            return cached
+        
+        # 查询期间缓存被清空（批处理更新）时不写回旧数据
+        generation = movie_cache.generation
+        movie = self._fetch_by_id(movie_id)
+        movie_cache.set(movie_id, movie, generation=generation)
+        return movie
+    
+    @retry_on_connection_error(max_retries=2)
+    def _fetch_by_id(self, movie_id: str) -> Optional[dict]:
+        """从 HBase 读取单部电影"""
         try:
-            row = self.table.row(movie_id.encode('utf-8'))
-            if not row:
-                return None
-            
-            return {
-                'id': movie_id,
-                'title': row.get(b'info:title', b'').decode('utf-8'),
-                'genres': row.get(b'info:genres', b'').decode('utf-8'),
-                'avg_rating': row.get(b'info:avg_rating', b'0').decode('utf-8'),
-                'rating_count': row.get(b'info:rating_count', b'0').decode('utf-8')
-            }
+            row_key = self.keys.movie_key(movie_id)
+        except ValueError:
+            return None  # 无法编码为行键的 ID 不可能存在
+        
+        try:
+            with hbase_pool.connection() as conn:
+                row = conn.table(self.table_name).row(row_key, columns=DETAIL_COLUMNS)
+            return self._to_detail(movie_id, row) if row else None
         except Exception as e:
             logger.error(f"查询电影失败 ID={movie_id}: {e}")
             raise
     
+    @staticmethod
+    def _to_detail(movie_id: str, row: dict) -> dict:
+        """movies 表的一行转为电影数据字典（含评分分布）"""
+        return {
+            'id': movie_id,
+            'title': row.get(b'info:title', b'').decode('utf-8'),
+            'genres': row.get(b'info:genres', b'').decode('utf-8'),
+            'avg_rating': row.get(b'info:avg_rating', b'0').decode('utf-8'),
+            'rating_count': row.get(b'info:rating_count', b'0').decode('utf-8'),
+            'rating_distribution': histogram_to_distribution(histogram_from_row(row))
+        }
+    
+    def find_by_ids(self, movie_ids: List[str]) -> List[Optional[dict]]:
+        """批量查找电影（读穿缓存），结果与 movie_ids 一一对应，不存在的为 None
+        
+        缓存未命中的 ID 去重后按 settings.multi_get_chunk 分块，
+        每块用一次 table.rows() 读取，结果写回缓存
+        
+        Args:
+            movie_ids: 电影ID列表
+            
+        Returns:
+            List[Optional[dict]]: 电影数据字典列表
+        """
+        found: Dict[str, Optional[dict]] = {}
+        misses = []
+        for movie_id in dict.fromkeys(movie_ids):
+            cached = movie_cache.get(movie_id)
+            if cached is MISSING:
+                misses.append(movie_id)
+            else:
+                found[movie_id] = cached
+        
+        if misses:
+            generation = movie_cache.generation
+            fetched = self._fetch_by_ids(misses)
+            for movie_id in misses:
+                movie = fetched.get(movie_id)
+                movie_cache.set(movie_id, movie, generation=generation)
+                found[movie_id] = movie
+        
+        return [found[movie_id] for movie_id in movie_ids]
+    
+    @retry_on_connection_error(max_retries=2)
+    def _fetch_by_ids(self, movie_ids: List[str]) -> Dict[str, dict]:
+        """从 HBase 分块批量读取电影，返回存在的电影 {movie_id: 电影数据}"""
+        keys = {}
+        for movie_id in movie_ids:
+            try:
+                keys[self.keys.movie_key(movie_id)] = movie_id
+            except ValueError:
+                pass  # 无法编码为行键的 ID 不可能存在
+        
+        row_keys = list(keys)
+        chunk = max(1, settings.multi_get_chunk)
+        movies = {}
+        try:
+            with hbase_pool.connection() as conn:
+                table = conn.table(self.table_name)
+                for i in range(0, len(row_keys), chunk):
+                    for key, row in table.rows(row_keys[i:i + chunk], columns=DETAIL_COLUMNS):
+                        movie_id = keys[key]
+                        movies[movie_id] = self._to_detail(movie_id, row)
+            return movies
+        except Exception as e:
+            logger.error(f"批量查询电影失败 ({len(movie_ids)} 个ID): {e}")
+            raise
+    
+    def prewarm(self, movie_ids: List[str]) -> int:
+        """预热缓存（批量读取），返回缓存中存在的电影数量"""
+        return sum(1 for movie in self.find_by_ids(movie_ids) if movie is not None)
+    
+    @staticmethod
+    def _to_summary(movie_id: str, data: dict) -> dict:
+        """列表/搜索结果的一行转为电影字典（未读取的列取默认值）"""
+        return {
+            'id': movie_id,
+            'title': data.get(b'info:title', b'').decode('utf-8'),
+            'genres': data.get(b'info:genres', b'').decode('utf-8'),
+            'avg_rating': data.get(b'info:avg_rating', b'0').decode('utf-8'),
+            'rating_count': data.get(b'info:rating_count', b'0').decode('utf-8')
+        }
+    
     @retry_on_connection_error(max_retries=2)
-    def find_all(self, limit: Optional[int] = None) -> List[dict]:
-        """查找所有电影
+    def _scan_page(self, row_start: Optional[bytes], page_size: int, columns: Optional[List[bytes]],
+                   caching: Optional[int]) -> Tuple[List[dict], Optional[bytes]]:
+        """从 row_start 开始读取一页电影
+        
+        每页是一次独立的扫描，读完即归还连接。
+        
+        Returns:
+            tuple: (电影列表, 下一页的起始行键)，没有下一页时为 None
+        """
+        with hbase_pool.connection() as conn:
+            rows = list(conn.table(self.table_name).scan(
+                row_start=row_start,
+                columns=columns or LIST_COLUMNS,
+                limit=page_size,
+                batch_size=min(caching or settings.scan_caching, page_size),
+            ))
+        next_start = rows[-1][0] + b'\x00' if len(rows) == page_size else None
+        return [self._to_summary(self.keys.parse_movie_key(key), data) for key, data in rows], next_start
+    
+    def _iter_pages(self, limit: Optional[int], columns: Optional[List[bytes]],
+                    page_size: Optional[int], caching: Optional[int]) -> Iterator[List[dict]]:
+        """按行键顺序逐页产出电影，每取一页执行一次 _scan_page"""
+        page_size = page_size or settings.scan_page_size
+        row_start = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            movies, row_start = self._scan_page(row_start, size, columns, caching)
+            yield movies
+            if remaining is not None:
+                remaining -= len(movies)
+            if row_start is None:
+                break
+    
+    def iter_all(self, limit: Optional[int] = None, columns: Optional[List[bytes]] = None,
+                 page_size: Optional[int] = None, caching: Optional[int] = None) -> Iterator[dict]:
+        """按行键顺序逐个产出电影，内存占用只与页大小有关
+        
+        按页扫描：每页从上一页最后一个行键之后开始，用一次扫描读取 page_size 行，
+        页与页之间不占用连接，调用方处理得慢也不会拖住连接池。
+        
+        Args:
+            limit: 最多产出的数量，None 表示全部
+            columns: 读取的列，默认为列表需要的四列
+            page_size: 每页行数，默认 settings.scan_page_size
+            caching: 扫描器每次 RPC 取回的行数，默认 settings.scan_caching
+        """
+        for movies in self._iter_pages(limit, columns, page_size, caching):
+            yield from movies
+    
+    async def iter_all_async(self, limit: Optional[int] = None, columns: Optional[List[bytes]] = None,
+                             page_size: Optional[int] = None,
+                             caching: Optional[int] = None) -> AsyncIterator[dict]:
+        """iter_all 的异步版本，每一页在 HBase 线程池中读取"""
+        pages = self._iter_pages(limit, columns, page_size, caching)
+        while True:
+            movies = await hbase_executor.run(next, pages, None)
+            if movies is None:
+                break
+            for movie in movies:
+                yield movie
+    
+    def find_all(self, limit: Optional[int] = None, columns: Optional[List[bytes]] = None) -> List[dict]:
+        """查找所有电影（一次性返回列表，大表请用 iter_all）
+        
+        只读取 columns 指定的列，默认为列表需要的四列；
+        例如只需要 ID 和评分时传 [b'info:avg_rating', b'info:rating_count']
         
         Args:
             limit: 限制返回数量
+            columns: 读取的列
             
         Returns:
             List[dict]: 电影列表
         """
-        movies = []
         try:
-            scan_kwargs = {'limit': limit} if limit else {}
-            for key, data in self.table.scan(**scan_kwargs):
-                movies.append({
-                    'id': key.decode('utf-8'),
-                    'title': data.get(b'info:title', b'').decode('utf-8'),
-                    'genres': data.get(b'info:genres', b'').decode('utf-8'),
-                    'avg_rating': data.get(b'info:avg_rating', b'0').decode('utf-8'),
-                    'rating_count': data.get(b'info:rating_count', b'0').decode('utf-8')
-                })
-            return movies
+            return list(self.iter_all(limit=limit or None, columns=columns))
         except Exception as e:
             logger.error(f"查询电影列表失败: {e}")
             raise
@@ -101,6 +260,10 @@ class MovieRepository:
     def search_by_text(self, query: str, limit: int = 100) -> List[dict]:
         """文本搜索电影
         
+        标题或类型包含关键词（不区分大小写）的判断下推到 RegionServer
+        （SingleColumnValueFilter + SubstringComparator），只传回匹配的行，
+        且只读取列表需要的四列
+        
         Args:
             query: 搜索关键词
             limit: 返回结果限制
@@ -109,33 +272,42 @@ class MovieRepository:
             List[dict]: 匹配的电影列表
         """
         query_lower = query.lower().strip()
-        matched_movies = []
-        scan_count = 0
-        max_scan = settings.max_scan_rows
+        if not query_lower:
+            return []
         
+        scan_filter = filters.any_of(
+            filters.column_substring('info', 'title', query_lower),
+            filters.column_substring('info', 'genres', query_lower),
+        )
         try:
-            for key, data in self.table.scan():
-                if scan_count >= max_scan:
-                    break
-                scan_count += 1
-                
-                title = data.get(b'info:title', b'').decode('utf-8').lower()
-                genres = data.get(b'info:genres', b'').decode('utf-8').lower()
-                
-                if query_lower in title or query_lower in genres:
-                    matched_movies.append({
-                        'id': key.decode('utf-8'),
-                        'title': data.get(b'info:title', b'').decode('utf-8'),
-                        'genres': data.get(b'info:genres', b'').decode('utf-8'),
-                        'avg_rating': data.get(b'info:avg_rating', b'0').decode('utf-8'),
-                        'rating_count': data.get(b'info:rating_count', b'0').decode('utf-8')
-                    })
-                    
-                    if len(matched_movies) >= limit:
-                        break
-            
-            return matched_movies
+            with hbase_pool.connection() as conn:
+                table = conn.table(self.table_name)
+                return [
+                    self._to_summary(self.keys.parse_movie_key(key), data)
+                    for key, data in table.scan(columns=LIST_COLUMNS, filter=scan_filter, limit=limit,
+                                                batch_size=min(settings.scan_caching, limit))
+                ]
         except Exception as e:
             logger.error(f"搜索电影失败 query={query}: {e}")
             raise
-
+    
+    async def find_by_id_async(self, movie_id: str) -> Optional[dict]:
+        """find_by_id 的异步版本，在 HBase 线程池中执行"""
+        return await hbase_executor.run(self.find_by_id, movie_id)
+    
+    async def find_by_ids_async(self, movie_ids: List[str]) -> List[Optional[dict]]:
+        """find_by_ids 的异步版本，在 HBase 线程池中执行"""
+        return await hbase_executor.run(self.find_by_ids, movie_ids)
+    
+    async def prewarm_async(self, movie_ids: List[str]) -> int:
+        """prewarm 的异步版本，在 HBase 线程池中执行"""
+        return await hbase_executor.run(self.prewarm, movie_ids)
+    
+    async def find_all_async(self, limit: Optional[int] = None,
+                             columns: Optional[List[bytes]] = None) -> List[dict]:
+        """find_all 的异步版本，在 HBase 线程池中执行"""
+        return await hbase_executor.run(self.find_all, limit, columns)
+    
+    async def search_by_text_async(self, query: str, limit: int = 100) -> List[dict]:
+        """search_by_text 的异步版本，在 HBase 线程池中执行"""
+        return await hbase_executor.run(self.search_by_text, query, limit)
@@ -1,11 +1,33 @@
 """评分数据仓库"""
 
-from typing import List, Dict
+import heapq
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
 from collections import defaultdict
 from functools import wraps
-from backend.db.hbase import hbase_connection
+from backend.db.hbase import hbase_pool
+from backend.db.executor import hbase_executor
+from backend.db.schema import (
+    HISTOGRAM_COLUMNS,
+    RowKeyCodec,
+    histogram_from_row,
+    histogram_to_distribution,
+    unpack_user_rating,
+)
+from backend.core.config import settings
 from backend.core.logging import logger
 
+# ratings 表中评分记录需要的列
+RATING_COLUMNS = [b'data:rating', b'data:timestamp']
+
+# 全表扫描时并行扫描各个盐桶的线程池。每个任务各自从连接池租用连接，
+# 调用方（hbase_executor 中的线程）等待期间不持有连接
+_scan_executor = ThreadPoolExecutor(
+    max_workers=max(1, min(settings.ratings_salt_buckets, settings.hbase_pool_size)),
+    thread_name_prefix="hbase-scan"
+)
+
 
 def retry_on_connection_error(max_retries=2):
     """连接错误时自动重试的装饰器"""
@@ -15,9 +37,7 @@ def retry_on_connection_error(max_retries=2):
             last_error = None
             for attempt in range(max_retries):
                 try:
-                    # 每次重试前刷新表连接
-                    if hasattr(self, '_refresh_table'):
-                        self._refresh_table()
+                    # 失效连接已被连接池丢弃，重试时会租到新连接
                     return func(self, *args, **kwargs)
                 except Exception as e:
                     last_error = e
@@ -38,51 +58,58 @@ class RatingRepository:
     """评分数据访问对象"""
     
     def __init__(self):
-        self.table = None
-        self._refresh_table()
+        self.table_name = settings.ratings_table
+        self.by_movie_table_name = settings.ratings_by_movie_table
+        self.by_user_table_name = settings.ratings_by_user_table
+        self.user_wide_rows = settings.user_wide_rows
+        self.keys = RowKeyCodec(settings.key_encoding, settings.ratings_salt_buckets)
     
-    def _refresh_table(self):
-        """刷新表连接"""
-        self.table = hbase_connection.get_ratings_table()
+    def _to_rating(self, key: bytes, data: dict) -> dict:
+        """ratings 表的一行转为评分记录"""
+        user_id, movie_id = self.keys.parse_rating_key(key)
+        return {
+            'user_id': user_id,
+            'movie_id': movie_id,
+            'rating': data.get(b'data:rating', b'0').decode('utf-8'),
+            'timestamp': data.get(b'data:timestamp', b'').decode('utf-8')
+        }
     
     @retry_on_connection_error(max_retries=2)
-    def find_by_movie_id(self, movie_id: str, limit: int = None, max_scan_rows: int = 50000) -> List[dict]:
-        """查找电影的评分记录
+    def find_by_movie_id(self, movie_id: str, limit: int = 20, offset: int = 0) -> List[dict]:
+        """查找电影的评分记录（最新的在前）
+        
+        在 ratings_by_movie 索引表上做前缀范围扫描，只读取 offset + limit 行的 data:rating 列
         
         Args:
             movie_id: 电影ID
-            limit: 返回数量限制，None表示返回全部（但受max_scan_rows限制）
-            max_scan_rows: 最大扫描行数，防止全表扫描导致假死
+            limit: 返回数量限制
+            offset: 跳过的记录数（用于分页）
             
         Returns:
             List[dict]: 评分记录列表
         """
+        try:
+            prefix = self.keys.by_movie_prefix(movie_id)
+        except ValueError:
+            return []  # 无法编码为行键的 ID 不可能存在
+        
         ratings = []
-        scan_count = 0
         try:
-            for key, data in self.table.scan():
-                scan_count += 1
-                
-                # 防止无限扫描导致假死
-                if scan_count > max_scan_rows:
-                    logger.warning(f"扫描行数超过限制 {max_scan_rows}，停止扫描")
-                    break
-                
-                key_str = key.decode('utf-8')
-                parts = key_str.split('_')
-                
-                if len(parts) == 2:
-                    user_id, mid = parts
-                    if mid == movie_id:
-                        ratings.append({
-                            'user_id': user_id,
-                            'movie_id': movie_id,
-                            'rating': data.get(b'data:rating', b'0').decode('utf-8'),
-                            'timestamp': data.get(b'data:timestamp', b'').decode('utf-8')
-                        })
-                        
-                        if limit and len(ratings) >= limit:
-                            break
+            with hbase_pool.connection() as conn:
+                table = conn.table(self.by_movie_table_name)
+                scanned = 0
+                for key, data in table.scan(row_prefix=prefix, columns=[b'data:rating'], limit=offset + limit):
+                    scanned += 1
+                    if scanned <= offset:
+                        continue
+                    
+                    _, timestamp, user_id = self.keys.parse_by_movie_key(key)
+                    ratings.append({
+                        'user_id': user_id,
+                        'movie_id': movie_id,
+                        'rating': data.get(b'data:rating', b'0').decode('utf-8'),
+                        'timestamp': timestamp
+                    })
             
             return ratings
         except Exception as e:
@@ -102,9 +129,15 @@ class RatingRepository:
             dict: 评分统计信息
         """
         try:
-            # 从电影表获取预计算的统计数据，避免全表扫描评分表
-            movies_table = hbase_connection.get_movies_table()
-            row = movies_table.row(movie_id.encode('utf-8'))
+            # 从电影表获取预计算的统计数据（含导入/批处理时计算的精确直方图），单行读取
+            columns = [b'info:avg_rating', b'info:rating_count'] + HISTOGRAM_COLUMNS
+            try:
+                row_key = self.keys.movie_key(movie_id)
+            except ValueError:
+                row = None
+            else:
+                with hbase_pool.connection() as conn:
+                    row = conn.table(settings.movies_table).row(row_key, columns=columns)
             
             if not row:
                 return {
@@ -116,76 +149,132 @@ class RatingRepository:
             avg_rating = float(row.get(b'info:avg_rating', b'0').decode('utf-8') or '0')
             rating_count = int(row.get(b'info:rating_count', b'0').decode('utf-8') or '0')
             
-            # 评分分布使用估算值（基于平均评分和总数）
-            # 如果需要精确分布，应该在导入数据时预计算并存储
-            rating_distribution = {}
-            if rating_count > 0:
-                # 简单估算：假设正态分布，以平均评分为中心
-                rating_distribution = self._estimate_distribution(avg_rating, rating_count)
-            
             return {
                 'avg_rating': avg_rating,
                 'total_count': rating_count,
-                'rating_distribution': rating_distribution
+                'rating_distribution': histogram_to_distribution(histogram_from_row(row))
             }
         except Exception as e:
             logger.error(f"获取评分统计失败 movie_id={movie_id}: {e}")
             raise
     
-    def _estimate_distribution(self, avg_rating: float, total_count: int) -> dict:
-        """估算评分分布
+    @retry_on_connection_error(max_retries=2)
+    def find_by_user_id(self, user_id: str, limit: Optional[int] = 10, offset: int = 0) -> List[dict]:
+        """查找用户的评分记录（按 movieId 行键顺序）
+        
+        启用宽行时读取 ratings_by_user 表中该用户的一行；否则同一用户的评分
+        位于同一个盐桶内且行键相邻，按（带盐的）用户前缀扫描一次即可
         
-        基于平均评分估算分布，用于前端展示
+        Args:
+            user_id: 用户ID
+            limit: 返回数量限制，None 表示全部
+            offset: 跳过的记录数（用于分页）
+            
+        Returns:
+            List[dict]: 评分记录列表
         """
-        # 简单的分布估算，实际项目中应该在数据导入时预计算
-        distribution = {}
+        try:
+            if self.user_wide_rows:
+                return self._find_by_user_wide(user_id, limit, offset)
+            
+            try:
+                prefix = self.keys.rating_user_prefix(user_id)
+            except ValueError:
+                return []
+            
+            scan_limit = None if limit is None else offset + limit
+            with hbase_pool.connection() as conn:
+                table = conn.table(self.table_name)
+                rows = table.scan(row_prefix=prefix, columns=RATING_COLUMNS, limit=scan_limit)
+                return [self._to_rating(key, data) for key, data in islice(rows, offset, None)]
+        except Exception as e:
+            logger.error(f"查询用户评分失败 user_id={user_id}: {e}")
+            raise
+    
+    def _find_by_user_wide(self, user_id: str, limit: Optional[int], offset: int) -> List[dict]:
+        """从宽行表读取用户评分
+        
+        读取全部评分时只做一次 row()；分页时用 ColumnPaginationFilter 在服务端
+        截取该行的列，评分很多的用户也只传输当前页
+        """
+        try:
+            user_key = self.keys.user_key(user_id)
+        except ValueError:
+            return []
         
-        # 根据平均评分估算各评分段的比例
-        avg = avg_rating
-        for score in [1, 2, 3, 4, 5]:
-            # 使用简单的距离权重
-            distance = abs(score - avg)
-            weight = max(0.05, 1.0 - distance * 0.25)
-            count = int(total_count * weight / 5)  # 大致分配
-            if count > 0:
-                distribution[str(score)] = count
+        with hbase_pool.connection() as conn:
+            table = conn.table(self.by_user_table_name)
+            if limit is None and offset == 0:
+                row = table.row(user_key)
+            else:
+                page_size = (2 ** 31 - 1) if limit is None else limit
+                rows = list(table.scan(
+                    row_start=user_key,
+                    row_stop=user_key + b'\x00',
+                    filter=f"ColumnPaginationFilter({page_size}, {offset})",
+                    limit=1,
+                ))
+                row = rows[0][1] if rows else {}
         
-        return distribution
+        ratings = []
+        for column, value in sorted(row.items()):
+            rating, timestamp = unpack_user_rating(value)
+            ratings.append({
+                'user_id': user_id,
+                'movie_id': self.keys.parse_movie_key(column.split(b':', 1)[1]),
+                'rating': rating,
+                'timestamp': timestamp
+            })
+        return ratings
+    
+    def _scan_bucket(self, prefix: bytes, limit: Optional[int]) -> List[tuple]:
+        """扫描一个盐桶，返回 (去盐行键, 评分记录) 列表（按行键有序）"""
+        rows = []
+        with hbase_pool.connection() as conn:
+            table = conn.table(self.table_name)
+            for key, data in table.scan(row_prefix=prefix or None, columns=RATING_COLUMNS, limit=limit):
+                rating = self._to_rating(key, data)
+                rows.append((key[len(prefix):], rating))
+        return rows
     
     @retry_on_connection_error(max_retries=2)
-    def find_by_user_id(self, user_id: str, limit: int = 10) -> List[dict]:
-        """查找用户的评分记录
+    def scan_all(self, limit: Optional[int] = None) -> List[dict]:
+        """按 userId_movieId 顺序扫描评分表
+        
+        加盐时并行扫描所有盐桶（每个桶最多取 limit 行），再按去盐后的行键
+        归并，结果顺序与不加盐的表一致。
         
         Args:
-            user_id: 用户ID
-            limit: 返回数量限制
+            limit: 返回数量限制，None 表示全部
             
         Returns:
             List[dict]: 评分记录列表
         """
-        ratings = []
         try:
-            # 使用前缀扫描优化查询
-            start_row = f"{user_id}_".encode('utf-8')
-            stop_row = f"{user_id}_~".encode('utf-8')
+            prefixes = self.keys.rating_salt_prefixes()
+            if len(prefixes) == 1:
+                return [rating for _, rating in self._scan_bucket(prefixes[0], limit)]
             
-            for key, data in self.table.scan(row_start=start_row, row_stop=stop_row):
-                key_str = key.decode('utf-8')
-                parts = key_str.split('_')
-                
-                if len(parts) == 2:
-                    uid, movie_id = parts
-                    ratings.append({
-                        'user_id': uid,
-                        'movie_id': movie_id,
-                        'rating': data.get(b'data:rating', b'0').decode('utf-8'),
-                        'timestamp': data.get(b'data:timestamp', b'').decode('utf-8')
-                    })
-                    
-                    if len(ratings) >= limit:
-                        break
-            
-            return ratings
+            futures = [_scan_executor.submit(self._scan_bucket, prefix, limit) for prefix in prefixes]
+            buckets = [future.result() for future in futures]
+            merged = heapq.merge(*buckets, key=lambda row: row[0])
+            return [rating for _, rating in islice(merged, limit)]
         except Exception as e:
-            logger.error(f"查询用户评分失败 user_id={user_id}: {e}")
+            logger.error(f"扫描评分表失败: {e}")
             raise
+    
+    async def find_by_movie_id_async(self, movie_id: str, limit: int = 20, offset: int = 0) -> List[dict]:
+        """find_by_movie_id 的异步版本，在 HBase 线程池中执行"""
+        return await hbase_executor.run(self.find_by_movie_id, movie_id, limit, offset)
+    
+    async def get_rating_stats_async(self, movie_id: str) -> dict:
+        """get_rating_stats 的异步版本，在 HBase 线程池中执行"""
+        return await hbase_executor.run(self.get_rating_stats, movie_id)
+    
+    async def find_by_user_id_async(self, user_id: str, limit: Optional[int] = 10, offset: int = 0) -> List[dict]:
+        """find_by_user_id 的异步版本，在 HBase 线程池中执行"""
+        return await hbase_executor.run(self.find_by_user_id, user_id, limit, offset)
+    
+    async def scan_all_async(self, limit: Optional[int] = None) -> List[dict]:
+        """scan_all 的异步版本，在 HBase 线程池中执行"""
+        return await hbase_executor.run(self.scan_all, limit)
@@ -0,0 +1,280 @@
+"""HBase 表结构与行键约定
+
+导入脚本、批处理任务和后端仓库共用这里的行键规则，保证读写两端一致。
+本模块与同目录的 filters / table_spec / rating_stats 以及 services.index_file
+都不依赖配置和 happybase，可以被独立脚本直接导入。
+
+行键有两种编码（database.key_encoding）：
+
+- string：十进制文本加下划线分隔，如 ratings 行键 b"123_456"
+- binary：大端定宽无符号整数，如 ratings 行键为 4 字节 userId + 4 字节 movieId。
+  行键更短、按数值排序（可以做数值范围扫描），解析只需一次 struct.unpack。
+  要求 ID 和时间戳是 0 ~ 2^32-1 的整数
+
+可选的 ratings_by_user 宽行表（database.user_wide_rows）每个用户一行，行键与
+ratings 表的用户前缀相同（去掉末尾分隔符），每部电影一列：列名为 movies 表行键，
+值为打包的 (半星评分 u8, 时间戳 u32)，读取用户全部评分只需一次 row()。
+"""
+
+import struct
+import zlib
+from typing import Dict, List, Sequence, Tuple
+
+# 评分时间戳（秒）的上界，用于生成倒序时间戳
+MAX_TIMESTAMP = 9999999999
+
+# 支持的行键编码
+KEY_ENCODINGS = ('string', 'binary')
+
+# 二进制行键中单个字段（4 字节大端无符号整数）的上界
+BINARY_KEY_MAX = 0xFFFFFFFF
+_U32 = struct.Struct('>I')
+_U32_PAIR = struct.Struct('>II')
+_U32_TRIPLE = struct.Struct('>III')
+_USER_RATING = struct.Struct('>BI')
+
+# 半星粒度的评分档位：0.5, 1.0, ..., 5.0
+RATING_BUCKETS = [i / 2 for i in range(1, 11)]
+
+
+def rating_salt(user_id: str, salt_buckets: int) -> int:
+    """用户所在的盐桶：crc32(userId) % salt_buckets"""
+    return zlib.crc32(user_id.encode('utf-8')) % salt_buckets
+
+
+def rating_salt_prefix(salt: int, salt_buckets: int) -> bytes:
+    """盐桶前缀：定宽十进制加分隔符，如 16 个桶时 7 号桶为 07_"""
+    width = len(str(salt_buckets - 1))
+    return f"{salt:0{width}d}_".encode('utf-8')
+
+
+def rating_salt_prefixes(salt_buckets: int) -> List[bytes]:
+    """所有盐桶的前缀；未启用加盐时返回 [b'']（整表一个范围）"""
+    if salt_buckets <= 0:
+        return [b'']
+    return [rating_salt_prefix(salt, salt_buckets) for salt in range(salt_buckets)]
+
+
+def rating_row_key(user_id: str, movie_id: str, salt_buckets: int = 0) -> bytes:
+    """ratings 表行键：userId_movieId
+
+    salt_buckets > 0 时在前面加上用户的盐桶前缀（salt_userId_movieId），
+    把按用户排序的顺序写入分散到多个 region。同一用户的评分仍然相邻。
+    """
+    key = f"{user_id}_{movie_id}".encode('utf-8')
+    if salt_buckets > 0:
+        return rating_salt_prefix(rating_salt(user_id, salt_buckets), salt_buckets) + key
+    return key
+
+
+def rating_user_prefix(user_id: str, salt_buckets: int = 0) -> bytes:
+    """ratings 表中某个用户所有评分的行键前缀"""
+    return rating_row_key(user_id, '', salt_buckets)
+
+
+def parse_rating_row_key(key: bytes, salt_buckets: int = 0) -> Tuple[str, str]:
+    """解析 ratings 行键
+
+    Returns:
+        tuple: (user_id, movie_id)
+    """
+    parts = key.decode('utf-8').split('_')
+    if salt_buckets > 0:
+        parts = parts[1:]
+    user_id, movie_id = parts
+    return user_id, movie_id
+
+
+def rating_by_movie_row_key(movie_id: str, timestamp: str, user_id: str) -> bytes:
+    """ratings_by_movie 表行键：movieId_倒序时间戳_userId
+
+    倒序时间戳固定 10 位，保证同一电影下最新的评分排在最前面。
+    """
+    reversed_ts = MAX_TIMESTAMP - int(timestamp)
+    return f"{movie_id}_{reversed_ts:010d}_{user_id}".encode('utf-8')
+
+
+def rating_by_movie_prefix(movie_id: str) -> bytes:
+    """ratings_by_movie 表中某部电影所有评分的行键前缀"""
+    return f"{movie_id}_".encode('utf-8')
+
+
+def parse_rating_by_movie_row_key(key: bytes) -> Tuple[str, str, str]:
+    """解析 ratings_by_movie 行键
+
+    Returns:
+        tuple: (movie_id, timestamp, user_id)
+    """
+    movie_id, reversed_ts, user_id = key.decode('utf-8').split('_')
+    return movie_id, str(MAX_TIMESTAMP - int(reversed_ts)), user_id
+
+
+def _u32(value: str) -> bytes:
+    """ID / 时间戳编码为 4 字节大端整数"""
+    number = int(value)
+    if not 0 <= number <= BINARY_KEY_MAX:
+        raise ValueError(f"超出二进制行键范围的值: {value}")
+    return _U32.pack(number)
+
+
+class RowKeyCodec:
+    """按配置的编码方式生成和解析各表行键
+
+    string 编码与上面的模块级函数完全一致；binary 编码的布局::
+
+        movies            movieId(u32)
+        ratings           [salt(u8)] userId(u32) movieId(u32)
+        ratings_by_movie  movieId(u32) 倒序时间戳(u32, 2^32-1-ts) userId(u32)
+    """
+
+    def __init__(self, encoding: str = 'string', salt_buckets: int = 0):
+        if encoding not in KEY_ENCODINGS:
+            raise ValueError(f"不支持的行键编码: {encoding}")
+        if encoding == 'binary' and salt_buckets > 256:
+            raise ValueError("binary 行键的盐桶数不能超过 256")
+        self.encoding = encoding
+        self.salt_buckets = max(0, int(salt_buckets))
+
+    @property
+    def binary(self) -> bool:
+        return self.encoding == 'binary'
+
+    def movie_key(self, movie_id: str) -> bytes:
+        """movies 表行键"""
+        return _u32(movie_id) if self.binary else movie_id.encode('utf-8')
+
+    def parse_movie_key(self, key: bytes) -> str:
+        """解析 movies 表行键，返回 movie_id"""
+        return str(_U32.unpack(key)[0]) if self.binary else key.decode('utf-8')
+
+    def salt_prefix(self, salt: int) -> bytes:
+        """盐桶前缀"""
+        return bytes([salt]) if self.binary else rating_salt_prefix(salt, self.salt_buckets)
+
+    def rating_salt_prefixes(self) -> List[bytes]:
+        """所有盐桶的前缀；未启用加盐时返回 [b'']"""
+        if self.salt_buckets <= 0:
+            return [b'']
+        return [self.salt_prefix(salt) for salt in range(self.salt_buckets)]
+
+    def rating_key(self, user_id: str, movie_id: str) -> bytes:
+        """ratings 表行键"""
+        if not self.binary:
+            return rating_row_key(user_id, movie_id, self.salt_buckets)
+        return self.rating_user_prefix(user_id) + _u32(movie_id)
+
+    def rating_user_prefix(self, user_id: str) -> bytes:
+        """ratings 表中某个用户所有评分的行键前缀"""
+        if not self.binary:
+            return rating_user_prefix(user_id, self.salt_buckets)
+        prefix = _u32(user_id)
+        if self.salt_buckets > 0:
+            prefix = self.salt_prefix(rating_salt(user_id, self.salt_buckets)) + prefix
+        return prefix
+
+    def parse_rating_key(self, key: bytes) -> Tuple[str, str]:
+        """解析 ratings 行键，返回 (user_id, movie_id)"""
+        if not self.binary:
+            return parse_rating_row_key(key, self.salt_buckets)
+        user_id, movie_id = _U32_PAIR.unpack_from(key, 1 if self.salt_buckets > 0 else 0)
+        return str(user_id), str(movie_id)
+
+    def user_key(self, user_id: str) -> bytes:
+        """ratings_by_user 宽行表行键"""
+        prefix = self.rating_user_prefix(user_id)
+        return prefix if self.binary else prefix[:-1]
+
+    def parse_user_key(self, key: bytes) -> str:
+        """解析 ratings_by_user 行键，返回 user_id"""
+        if self.binary:
+            return str(_U32.unpack_from(key, 1 if self.salt_buckets > 0 else 0)[0])
+        text = key.decode('utf-8')
+        return text.split('_', 1)[1] if self.salt_buckets > 0 else text
+
+    def split_rating_key(self, key: bytes) -> Tuple[bytes, bytes]:
+        """ratings 行键拆为 (ratings_by_user 行键, 列名)，只做字节切分不解码"""
+        if self.binary:
+            return key[:-4], key[-4:]
+        separator = key.rindex(b'_')
+        return key[:separator], key[separator + 1:]
+
+    def by_movie_key(self, movie_id: str, timestamp: str, user_id: str) -> bytes:
+        """ratings_by_movie 表行键"""
+        if not self.binary:
+            return rating_by_movie_row_key(movie_id, timestamp, user_id)
+        return _u32(movie_id) + _U32.pack(BINARY_KEY_MAX - int(timestamp)) + _u32(user_id)
+
+    def by_movie_prefix(self, movie_id: str) -> bytes:
+        """ratings_by_movie 表中某部电影所有评分的行键前缀"""
+        return _u32(movie_id) if self.binary else rating_by_movie_prefix(movie_id)
+
+    def parse_by_movie_key(self, key: bytes) -> Tuple[str, str, str]:
+        """解析 ratings_by_movie 行键，返回 (movie_id, timestamp, user_id)"""
+        if not self.binary:
+            return parse_rating_by_movie_row_key(key)
+        movie_id, reversed_ts, user_id = _U32_TRIPLE.unpack(key)
+        return str(movie_id), str(BINARY_KEY_MAX - reversed_ts), str(user_id)
+
+
+def pack_user_rating(rating, timestamp) -> bytes:
+    """宽行表的单元格值：半星评分（u8）+ 时间戳（u32），共 5 字节"""
+    return _USER_RATING.pack(int(round(float(rating) * 2)), int(timestamp))
+
+
+def unpack_user_rating(value: bytes) -> Tuple[str, str]:
+    """解析宽行表的单元格值，返回 (rating, timestamp)"""
+    half_stars, timestamp = _USER_RATING.unpack(value)
+    return f"{half_stars / 2:.1f}", str(timestamp)
+
+
+def rating_bucket(rating: float) -> int:
+    """评分对应的直方图档位下标（0 对应 0.5 星，9 对应 5.0 星）"""
+    return min(max(int(round(float(rating) * 2)) - 1, 0), len(RATING_BUCKETS) - 1)
+
+
+def histogram_column(bucket: int) -> bytes:
+    """直方图档位在 movies 表 info 列族中的列名，如 info:hist_4.5"""
+    return f"info:hist_{RATING_BUCKETS[bucket]:.1f}".encode('utf-8')
+
+
+HISTOGRAM_COLUMNS = [histogram_column(i) for i in range(len(RATING_BUCKETS))]
+
+
+def empty_histogram() -> List[int]:
+    """全零直方图"""
+    return [0] * len(RATING_BUCKETS)
+
+
+def histogram_sum(histogram: Sequence[int]) -> float:
+    """由直方图精确还原评分总和"""
+    return sum(score * count for score, count in zip(RATING_BUCKETS, histogram))
+
+
+def histogram_to_distribution(histogram: Sequence[int]) -> Dict[str, int]:
+    """直方图转为 {"4.5": 数量} 形式的评分分布，省略数量为 0 的档位"""
+    return {
+        f"{score:.1f}": int(count)
+        for score, count in zip(RATING_BUCKETS, histogram)
+        if count
+    }
+
+
+def distribution_to_histogram(distribution: Dict[str, int]) -> List[int]:
+    """{"4.5": 数量} 形式的评分分布转回直方图"""
+    histogram = empty_histogram()
+    for score, count in distribution.items():
+        histogram[rating_bucket(float(score))] += int(count)
+    return histogram
+
+
+def histogram_cells(histogram: Sequence[int]) -> Dict[bytes, bytes]:
+    """直方图编码为 movies 表的列值"""
+    return {
+        column: str(int(count)).encode('utf-8')
+        for column, count in zip(HISTOGRAM_COLUMNS, histogram)
+    }
+
+
+def histogram_from_row(row: Dict[bytes, bytes]) -> List[int]:
+    """从 movies 表的行数据中解码直方图，缺失的列按 0 处理"""
+    return [int(row.get(column, b'0') or b'0') for column in HISTOGRAM_COLUMNS]
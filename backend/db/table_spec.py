@@ -0,0 +1,194 @@
+"""声明式 HBase 表定义
+
+config.yaml 的 tables 段按逻辑表名（movies / ratings / ratings_by_movie）描述
+列族选项和预分区数量::
+
+    tables:
+      ratings:
+        regions: 16
+        families:
+          data: {compression: GZ, bloom_filter: ROW, in_memory: false, max_versions: 1, blocksize: 65536}
+
+预分区的切分点通过对输入 CSV 抽样、按行键字节序取分位数得到。
+Thrift1（happybase）的 createTable 不支持切分点和 BLOCKSIZE，所以优先通过
+`hbase shell` 建表；本机没有 hbase 命令或执行失败时回退到 happybase，
+只应用它支持的列族选项，并打印等价的 shell 命令供手动预分区。
+"""
+
+import os
+import random
+import shutil
+import subprocess
+from typing import Callable, Dict, Iterable, List, Optional
+
+# 默认列族选项
+DEFAULT_FAMILY_OPTIONS = {
+    'compression': 'NONE',
+    'bloom_filter': 'ROW',
+    'in_memory': False,
+    'max_versions': 1,
+    'blocksize': 65536,
+}
+
+# 抽样的行数
+DEFAULT_SAMPLE_SIZE = 100000
+
+
+class TableSpec:
+    """单张表的定义：列族选项和预分区数量"""
+
+    def __init__(self, name: str, families: Dict[str, dict], regions: int = 1):
+        self.name = name
+        self.families = {
+            family: dict(DEFAULT_FAMILY_OPTIONS, **(options or {}))
+            for family, options in families.items()
+        }
+        self.regions = max(1, int(regions))
+
+    @classmethod
+    def from_config(cls, config: dict, logical_name: str, table_name: str,
+                    default_families: Dict[str, dict]) -> 'TableSpec':
+        """从 config.yaml 的 tables 段读取某张表的定义，缺省时使用 default_families"""
+        spec = (config.get('tables') or {}).get(logical_name) or {}
+        return cls(table_name, spec.get('families') or default_families, spec.get('regions', 1))
+
+    def happybase_families(self) -> Dict[str, dict]:
+        """happybase create_table 支持的列族选项（不含 blocksize）"""
+        return {
+            family: {
+                'max_versions': int(options['max_versions']),
+                'compression': str(options['compression']).upper(),
+                'in_memory': bool(options['in_memory']),
+                'bloom_filter_type': str(options['bloom_filter']).upper(),
+            }
+            for family, options in self.families.items()
+        }
+
+    def shell_command(self, split_keys: List[bytes]) -> str:
+        """等价的 hbase shell create 命令"""
+        families = ', '.join(
+            "{NAME => '%s', COMPRESSION => '%s', BLOOMFILTER => '%s', IN_MEMORY => '%s', "
+            "VERSIONS => %d, BLOCKSIZE => '%d'}" % (
+                family,
+                str(options['compression']).upper(),
+                str(options['bloom_filter']).upper(),
+                'true' if options['in_memory'] else 'false',
+                int(options['max_versions']),
+                int(options['blocksize']),
+            )
+            for family, options in self.families.items()
+        )
+        command = f"create '{self.name}', {families}"
+        if split_keys:
+            command += ", SPLITS => [" + ', '.join(_ruby_string(key) for key in split_keys) + "]"
+        return command
+
+
+def _ruby_string(key: bytes) -> str:
+    """行键转为 hbase shell（JRuby）中的双引号字符串，不可打印字节用 \\xNN 表示"""
+    parts = []
+    for byte in key:
+        char = chr(byte)
+        if char in '"\\#':
+            parts.append('\\' + char)
+        elif 0x20 <= byte < 0x7f:
+            parts.append(char)
+        else:
+            parts.append('\\x%02x' % byte)
+    return '"' + ''.join(parts) + '"'
+
+
+def sample_csv_columns(path, columns: List[str], sample_size: int = DEFAULT_SAMPLE_SIZE) -> List[tuple]:
+    """随机定位抽样 CSV 数据行，返回指定列的取值元组
+
+    文件较小时直接读入全部行；否则在文件中随机 seek，丢弃半行后取下一整行，
+    大文件也只需要 sample_size 次随机读。只按逗号切分，所取的列必须位于
+    所有可能含逗号的带引号字段之前（如 movies.csv 的 movieId）。
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        header = header_line.decode('utf-8').strip().split(',')
+        indexes = [header.index(column) for column in columns]
+
+        def pick(line: bytes) -> tuple:
+            fields = line.decode('utf-8').rstrip('\r\n').split(',')
+            return tuple(fields[i] for i in indexes)
+
+        header_end = len(header_line)
+        if size - header_end <= sample_size * 64:
+            return [pick(line) for line in f if line.strip()]
+
+        rng = random.Random(0)
+        rows = []
+        for _ in range(sample_size):
+            f.seek(rng.randrange(header_end, size))
+            f.readline()
+            line = f.readline()
+            if line.strip():
+                rows.append(pick(line))
+        return rows
+
+
+def split_points(sample_keys: Iterable[bytes], regions: int) -> List[bytes]:
+    """按行键字节序取分位数，得到 regions - 1 个切分点"""
+    if regions <= 1:
+        return []
+    keys = sorted(sample_keys)
+    if not keys:
+        return []
+    points = []
+    for i in range(1, regions):
+        key = keys[i * len(keys) // regions]
+        if key and (not points or key > points[-1]):
+            points.append(key)
+    return points
+
+
+def create_table(
+    connection,
+    spec: TableSpec,
+    split_keys: Optional[List[bytes]] = None,
+    log: Callable[[str], None] = print,
+    use_shell: bool = True,
+) -> bool:
+    """按定义建表
+
+    Args:
+        connection: happybase 连接
+        spec: 表定义
+        split_keys: 预分区切分点
+        log: 输出函数
+        use_shell: 是否尝试通过 hbase shell 建表
+
+    Returns:
+        bool: 是否完整应用了预分区和全部列族选项
+    """
+    split_keys = split_keys or []
+    command = spec.shell_command(split_keys)
+
+    hbase = shutil.which('hbase') if use_shell else None
+    if hbase:
+        try:
+            result = subprocess.run(
+                [hbase, 'shell', '-n'],
+                input=command + '\n',
+                capture_output=True,
+                text=True,
+                timeout=600,
+            )
+            if result.returncode == 0 and spec.name.encode('utf-8') in connection.tables():
+                log(f"   ✓ 通过 hbase shell 建表: {spec.name}（{len(split_keys) + 1} 个分区）")
+                return True
+            log(f"   [警告] hbase shell 建表失败，改用 Thrift: {result.stderr.strip()[-500:]}")
+        except (OSError, subprocess.SubprocessError) as e:
+            log(f"   [警告] 无法执行 hbase shell，改用 Thrift: {e}")
+
+    connection.create_table(spec.name, spec.happybase_families())
+    if split_keys or any(
+            int(o['blocksize']) != DEFAULT_FAMILY_OPTIONS['blocksize'] for o in spec.families.values()):
+        log("   [提示] Thrift 建表不支持预分区和 BLOCKSIZE，已按单个分区创建。如需应用，"
+            "可在 hbase shell 中删除该表后执行以下命令，再用 --resume 导入:")
+        log(f"   {command}")
+        return False
+    return True
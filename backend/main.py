@@ -4,7 +4,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend.core.config import settings
 from backend.core.logging import logger
-from backend.db.hbase import hbase_connection
+from backend.db.hbase import hbase_pool
+from backend.db.executor import hbase_executor
+from backend.services.movie_service import MovieService
 from backend.api.v1 import api_router
 
 
@@ -39,7 +41,10 @@ def create_app() -> FastAPI:
     async def startup_event():
         """应用启动事件"""
         try:
-            hbase_connection.connect()
+            await hbase_executor.run(hbase_pool.connect)
+            if settings.movie_cache_prewarm > 0:
+                cached = await MovieService().prewarm_cache(settings.movie_cache_prewarm)
+                logger.info(f"电影缓存预热完成: {cached} 部电影")
             logger.info("应用启动成功")
         except Exception as e:
             logger.error(f"应用启动失败: {e}")
@@ -47,7 +52,8 @@ def create_app() -> FastAPI:
     @app.on_event("shutdown")
     async def shutdown_event():
         """应用关闭事件"""
-        hbase_connection.close()
+        hbase_executor.shutdown()
+        hbase_pool.close()
         logger.info("应用已关闭")
     
     return app
@@ -58,6 +58,12 @@ class MovieListResponse(BaseModel):
     total_pages: int
 
 
+class BatchMovieResponse(BaseModel):
+    """批量获取电影响应"""
+    movies: List[MovieSchema]
+    missing: List[str] = Field(default_factory=list, description="不存在的电影ID")
+
+
 class SearchResponse(BaseModel):
     """搜索响应"""
     movies: List[MovieSchema]
@@ -70,3 +76,6 @@ class HealthResponse(BaseModel):
     status: str
     hbase_connected: bool
     version: str = "1.0.0"
+    hbase_pool: Dict[str, int] = Field(default_factory=dict, description="连接池状态")
+    hbase_executor: Dict[str, int] = Field(default_factory=dict, description="HBase 线程池状态（含排队深度）")
+    movie_cache: Dict[str, int] = Field(default_factory=dict, description="电影缓存命中统计")
@@ -0,0 +1,12 @@
+"""批处理任务（spark_batch.py）的阶段定义
+
+批处理脚本按此顺序执行各阶段，后台管理接口据此校验和展示阶段。
+
+- aggregate：计算评分统计，结果（含水位和有变化的电影）保存为 aggregate.npz
+- movies：把有变化的电影写入 movies 表
+- ratings_by_movie：确保按电影检索评分的索引表存在
+- index：更新电影索引文件
+- commit：aggregate.npz 替换增量状态（推进水位），清理中间文件
+"""
+
+STAGES = ('aggregate', 'movies', 'ratings_by_movie', 'index', 'commit')
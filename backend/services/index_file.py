@@ -0,0 +1,416 @@
+"""电影索引二进制文件（movie_index.bin）
+
+替代 movie_index.json。文件由定长数值列、字符串池和持久化的倒排索引组成，
+API 进程通过 mmap 只读映射：多个 worker 共享同一份页缓存，启动时不需要解析。
+
+布局（小端）::
+
+    头部    magic(4s) version(u32) movie_count(u32) section_count(u32)
+    段目录  section_count × [name(16s) offset(u64) length(u64)]
+    段数据  按 8 字节对齐依次存放
+
+数值列按电影 ID 升序存放（行号 row），rank 段给出按评分排名的行号顺序，
+sort_* 段是其余排序方式的行号排列（段名见 _SORT_SECTIONS）；标题/类型倒排表中的文档编号是排名位置
+而不是行号。
+
+每次写出都生成新的代文件 movie_index.<代号>.bin，再原子替换指针文件
+movie_index.current 指向它；已映射旧文件的进程不受影响（Windows 上不能替换
+被映射的文件），重新加载后关闭旧映射，旧的代文件在下次写出时清理。
+没有指针文件时直接读取 movie_index.bin（早期生成的单文件索引）。
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from backend.db.schema import (
+    RATING_BUCKETS,
+    distribution_to_histogram,
+    histogram_to_distribution,
+)
+from backend.services.search_index import TokenIndex, build_postings
+
+MAGIC = b'MLIX'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sIII')
+_SECTION_NAME_SIZE = 16
+_SECTION = struct.Struct(f'<{_SECTION_NAME_SIZE}sQQ')
+_ALIGNMENT = 8
+_HIST_WIDTH = len(RATING_BUCKETS)
+
+# 电影列表支持的排序方式；rating 即 rank 段，id 即行号本身
+SORT_KEYS = ('rating', 'rating_count', 'title', 'year', 'id')
+
+# 其余排序方式的行号排列所在的段
+_SORT_SECTIONS = {'rating_count': 'sort_count', 'title': 'sort_title', 'year': 'sort_year'}
+
+_YEAR_RE = re.compile(r'\((\d{4})\)\s*$')
+
+if sys.byteorder != 'little':  # 数值列按本机字节序写入并直接 cast 读取
+    raise ImportError("电影索引文件仅支持小端平台")
+
+
+def _string_pool(strings: Iterable[str]) -> Tuple[array, bytes]:
+    """把字符串序列编码为 (偏移数组, UTF-8 字节池)，第 i 个字符串位于 [off[i], off[i+1])"""
+    offsets = array('I', [0])
+    pool = bytearray()
+    for text in strings:
+        pool += text.encode('utf-8')
+        offsets.append(len(pool))
+    return offsets, bytes(pool)
+
+
+def _flatten_postings(postings: Sequence[Sequence[int]]) -> Tuple[array, array]:
+    """倒排表列表拍平为 (偏移数组, 文档编号数组)"""
+    offsets = array('I', [0])
+    data = array('I')
+    for posting in postings:
+        data.extend(posting)
+        offsets.append(len(data))
+    return offsets, data
+
+
+def parse_year(title: str) -> int:
+    """从 "Toy Story (1995)" 形式的标题中解析年份，没有年份返回 0"""
+    match = _YEAR_RE.search(title)
+    return int(match.group(1)) if match else 0
+
+
+def rank_order(movies: Sequence[dict]) -> List[int]:
+    """按评分、评分人数降序排列的行号"""
+    return sorted(
+        range(len(movies)),
+        key=lambda i: (-float(movies[i]['avg_rating']), -int(movies[i]['rating_count']))
+    )
+
+
+def sort_permutations(
+    titles: Sequence[str],
+    avg_ratings: Sequence[float],
+    rating_counts: Sequence[int],
+) -> Dict[str, array]:
+    """计算 rating_count / title / year 三种排序的行号排列
+
+    rating_count、year 降序（年份相同按评分），title 按不区分大小写的字母序。
+    """
+    rows = range(len(titles))
+    years = [parse_year(title) for title in titles]
+    return {
+        'rating_count': array('I', sorted(rows, key=lambda i: (-rating_counts[i], -avg_ratings[i]))),
+        'title': array('I', sorted(rows, key=lambda i: titles[i].casefold())),
+        'year': array('I', sorted(rows, key=lambda i: (-years[i], -avg_ratings[i], -rating_counts[i]))),
+    }
+
+
+def _pointer_path(path: Path) -> Path:
+    return path.with_suffix('.current')
+
+
+def _generation_path(path: Path, generation: int) -> Path:
+    return path.with_name(f"{path.stem}.{generation}{path.suffix}")
+
+
+def current_index_file(path) -> Optional[Path]:
+    """索引的当前数据文件：指针文件指向的代文件，没有指针时为 path 本身；都不存在返回 None"""
+    path = Path(path)
+    try:
+        target = path.with_name(_pointer_path(path).read_text(encoding='ascii').strip())
+    except FileNotFoundError:
+        target = path
+    return target if target.exists() else None
+
+
+def _publish(pointer: Path, target: Path):
+    """原子替换指针文件；读取方正好打开指针时（Windows）稍后重试"""
+    tmp_pointer = pointer.with_name(pointer.name + '.tmp')
+    tmp_pointer.write_text(target.name, encoding='ascii')
+    for attempt in range(50):
+        try:
+            os.replace(tmp_pointer, pointer)
+            return
+        except PermissionError:
+            if attempt == 49:
+                raise
+            time.sleep(0.1)
+
+
+def _remove_stale_generations(path: Path, keep: Path):
+    """删除除 keep 以外的代文件和旧版单文件；仍被映射的文件（Windows）删除失败，留到下次"""
+    stale = [
+        p for p in path.parent.glob(f"{path.stem}.*{path.suffix}")
+        if p != keep and p.stem[len(path.stem) + 1:].isdigit()
+    ]
+    if path.exists():
+        stale.append(path)
+    for stale_path in stale:
+        try:
+            stale_path.unlink()
+        except OSError:
+            pass
+
+
+def write_movie_index(path, movies: Iterable[dict]) -> int:
+    """写出电影索引（新的代文件 + 原子替换指针文件）
+
+    Args:
+        path: 索引路径（movie_index.bin，代文件和指针文件与它同目录）
+        movies: 电影字典（id/title/genres/avg_rating/rating_count/rating_distribution）
+
+    Returns:
+        int: 写入的电影数量
+    """
+    movies = sorted(movies, key=lambda m: int(m['id']))
+    rank = rank_order(movies)
+
+    histogram = array('I')
+    for movie in movies:
+        histogram.extend(distribution_to_histogram(movie.get('rating_distribution') or {}))
+
+    title_offsets, titles = _string_pool(m['title'] for m in movies)
+    genre_offsets, genres = _string_pool(m['genres'] for m in movies)
+
+    sections = [
+        ('ids', array('I', (int(m['id']) for m in movies))),
+        ('avg_rating', array('f', (float(m['avg_rating']) for m in movies))),
+        ('rating_count', array('I', (int(m['rating_count']) for m in movies))),
+        ('histogram', histogram),
+        ('title_offsets', title_offsets),
+        ('titles', titles),
+        ('genre_offsets', genre_offsets),
+        ('genres', genres),
+        ('rank', array('I', rank)),
+    ]
+
+    permutations = sort_permutations(
+        [m['title'] for m in movies],
+        [float(m['avg_rating']) for m in movies],
+        [int(m['rating_count']) for m in movies],
+    )
+    sections += [(_SORT_SECTIONS[key], order) for key, order in permutations.items()]
+
+    # 倒排索引按排名顺序编号
+    for field in ('title', 'genres'):
+        vocabulary, postings = build_postings([movies[i][field] for i in rank])
+        vocab_offsets, vocab_pool = _string_pool(vocabulary)
+        post_offsets, post_data = _flatten_postings(postings)
+        name = field[:5]
+        sections += [
+            (f'{name}_vocab_off', vocab_offsets),
+            (f'{name}_vocab', vocab_pool),
+            (f'{name}_post_off', post_offsets),
+            (f'{name}_post', post_data),
+        ]
+
+    payloads = [(name, bytes(data)) for name, data in sections]
+    for name, _ in payloads:
+        if len(name.encode('ascii')) > _SECTION_NAME_SIZE:
+            raise ValueError(f"段名超过 {_SECTION_NAME_SIZE} 字节: {name}")
+    offset = _HEADER.size + _SECTION.size * len(payloads)
+    directory = []
+    for name, payload in payloads:
+        offset += -offset % _ALIGNMENT
+        directory.append((name, offset, len(payload)))
+        offset += len(payload)
+
+    path = Path(path)
+    current = current_index_file(path)
+    generation = 1
+    if current is not None and current != path:
+        generation = int(current.stem[len(path.stem) + 1:]) + 1
+    target = _generation_path(path, generation)
+    tmp_path = target.with_name(target.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(movies), len(payloads)))
+        for name, section_offset, length in directory:
+            f.write(_SECTION.pack(name.encode('ascii'), section_offset, length))
+        for (name, section_offset, _), (_, payload) in zip(directory, payloads):
+            f.write(b'\0' * (section_offset - f.tell()))
+            f.write(payload)
+    os.replace(tmp_path, target)
+    _publish(_pointer_path(path), target)
+    _remove_stale_generations(path, target)
+    return len(movies)
+
+
+class _StringColumn:
+    """字符串池上的只读序列视图"""
+
+    def __init__(self, offsets: memoryview, pool: memoryview):
+        self._offsets = offsets
+        self._pool = pool
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self._pool[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+
+class _PostingLists:
+    """拍平的倒排表上的只读序列视图，每项是一个 u32 memoryview"""
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> memoryview:
+        return self._data[self._offsets[i]:self._offsets[i + 1]]
+
+
+class _RankedColumn:
+    """按排名位置访问某一列"""
+
+    def __init__(self, column: Sequence, rank: memoryview):
+        self._column = column
+        self._rank = rank
+
+    def __len__(self) -> int:
+        return len(self._rank)
+
+    def __getitem__(self, doc_id: int):
+        return self._column[self._rank[doc_id]]
+
+
+class MovieIndexFile:
+    """mmap 映射的电影索引文件（只读）
+
+    path 为索引路径，打开其当前数据文件（见 current_index_file）。不再使用时调用
+    close() 释放映射，也可以用作上下文管理器。
+    """
+
+    def __init__(self, path):
+        self.path = current_index_file(path)
+        if self.path is None:
+            raise FileNotFoundError(f"电影索引文件不存在: {path}")
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # 创建的所有 memoryview，close() 时逐个释放后才能关闭映射
+        self._views: List[memoryview] = []
+        buf = self._view(memoryview(self._mmap))
+
+        magic, version, count, section_count = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是电影索引文件: {self.path}")
+        if version != VERSION:
+            raise ValueError(f"不支持的索引文件版本 {version}: {self.path}")
+
+        sections: Dict[str, memoryview] = {}
+        for i in range(section_count):
+            name, offset, length = _SECTION.unpack_from(buf, _HEADER.size + i * _SECTION.size)
+            sections[name.rstrip(b'\0').decode('ascii')] = self._view(buf[offset:offset + length])
+
+        def cast(name: str, fmt: str = 'I') -> memoryview:
+            return self._view(sections[name].cast(fmt))
+
+        self.count = count
+        self.ids = cast('ids')
+        self.avg_ratings = cast('avg_rating', 'f')
+        self.rating_counts = cast('rating_count')
+        self.histograms = cast('histogram')
+        self.titles = _StringColumn(cast('title_offsets'), sections['titles'])
+        self.genres = _StringColumn(cast('genre_offsets'), sections['genres'])
+        self.rank = cast('rank')
+
+        # 缺少排序段（早期生成的文件）时在加载时计算
+        self._sort_orders: Dict[str, Sequence[int]] = {'rating': self.rank, 'id': range(count)}
+        if all(name in sections for name in _SORT_SECTIONS.values()):
+            for key, name in _SORT_SECTIONS.items():
+                self._sort_orders[key] = cast(name)
+        else:
+            self._sort_orders.update(sort_permutations(
+                [self.titles[row] for row in range(count)], self.avg_ratings, self.rating_counts
+            ))
+
+        self.title_index = self._token_index(sections, cast, 'title', self.titles)
+        self.genre_index = self._token_index(sections, cast, 'genre', self.genres)
+
+    def _view(self, view: memoryview) -> memoryview:
+        self._views.append(view)
+        return view
+
+    def _token_index(self, sections: Dict[str, memoryview], cast, name: str, column: Sequence[str]) -> TokenIndex:
+        """在文件中持久化的倒排表上构建 TokenIndex 视图"""
+        vocabulary = _StringColumn(cast(f'{name}_vocab_off'), sections[f'{name}_vocab'])
+        postings = _PostingLists(cast(f'{name}_post_off'), cast(f'{name}_post'))
+        return TokenIndex(vocabulary, postings, _RankedColumn(column, self.rank))
+
+    def close(self):
+        """释放映射和文件句柄；调用方仍持有的切片会在被回收时释放"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def __enter__(self) -> 'MovieIndexFile':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def find_row(self, movie_id: str) -> Optional[int]:
+        """按电影 ID 二分查找行号，不存在返回 None"""
+        try:
+            key = int(movie_id)
+        except (TypeError, ValueError):
+            return None
+        row = bisect_left(self.ids, key)
+        if row < self.count and self.ids[row] == key:
+            return row
+        return None
+
+    def sort_order(self, key: str) -> Sequence[int]:
+        """某种排序方式下的行号排列（见 SORT_KEYS）"""
+        if key not in self._sort_orders:
+            raise ValueError(f"不支持的排序方式: {key}")
+        return self._sort_orders[key]
+
+    def histogram(self, row: int) -> List[int]:
+        """某一行的评分直方图"""
+        return list(self.histograms[row * _HIST_WIDTH:(row + 1) * _HIST_WIDTH])
+
+    def movie(self, row: int) -> dict:
+        """按行号读取电影，字段与原 JSON 索引一致"""
+        return {
+            'id': str(self.ids[row]),
+            'title': self.titles[row],
+            'genres': self.genres[row],
+            'avg_rating': round(self.avg_ratings[row], 2),
+            'rating_count': self.rating_counts[row],
+            'rating_distribution': histogram_to_distribution(self.histogram(row)),
+        }
+
+    def movies(self) -> Iterator[dict]:
+        """按 ID 顺序遍历所有电影"""
+        for row in range(self.count):
+            yield self.movie(row)
+
+
+def read_movie_index(path) -> List[dict]:
+    """读取索引文件中的所有电影"""
+    with MovieIndexFile(path) as index:
+        return list(index.movies())
+
+
+def convert_json_index(json_path, bin_path) -> int:
+    """把旧版 movie_index.json 转换为二进制索引文件"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        movies = json.load(f)
+    return write_movie_index(bin_path, movies)
@@ -1,21 +1,30 @@
 """电影业务逻辑服务"""
 
-import json
+import heapq
+import os
+import time
 from pathlib import Path
-from typing import List, Optional, Tuple
-from backend.db.repositories.movie_repository import MovieRepository
+from typing import AsyncIterator, List, Optional, Tuple
+from backend.db.repositories.movie_repository import MovieRepository, movie_cache
 from backend.db.repositories.rating_repository import RatingRepository
 from backend.models.domain import Movie, Rating, MovieDetail
+from backend.services.index_file import MovieIndexFile, convert_json_index, current_index_file, parse_year
+from backend.services.search_index import parse_query
 from backend.core.config import settings
 from backend.core.logging import logger
 
 
 class MovieIndexService:
-    """电影索引服务 - 使用 JSON 索引文件进行快速搜索"""
+    """电影索引服务 - mmap 映射二进制索引文件，使用持久化的倒排索引进行快速搜索"""
     
     _instance = None
-    _movies_index: List[dict] = []
-    _movies_by_id: dict = {}
+    _index: Optional[MovieIndexFile] = None
+    # 子串回退扫描用的小写文本（按排名顺序），首次回退时才构建
+    _lower_titles: Optional[List[str]] = None
+    _lower_genres: Optional[List[str]] = None
+    # 已加载索引数据文件的 (路径, mtime_ns, size)，用于发现批处理任务写出的新索引
+    _index_stamp: Optional[Tuple[str, int, int]] = None
+    _last_check: float = 0.0
     
     def __new__(cls):
         if cls._instance is None:
@@ -23,62 +32,171 @@ class MovieIndexService:
             cls._instance._load_index()
         return cls._instance
     
+    _index_path = Path("backend/data/movie_index.bin")
+    _legacy_path = Path("backend/data/movie_index.json")
+    
     def _load_index(self):
-        """加载电影索引"""
-        index_path = Path("backend/data/movie_index.json")
-        if not index_path.exists():
-            logger.warning(f"电影索引文件不存在: {index_path}")
-            return
+        """加载电影索引
+        
+        批处理任务更新 HBase 后最后一步才写出索引文件，因此每次（重新）加载
+        索引时同时清空电影缓存。
+        """
+        index_path = self._index_path
+        legacy_path = self._legacy_path
+        self._last_check = time.monotonic()
+        movie_cache.clear()
         
         try:
-            with open(index_path, 'r', encoding='utf-8') as f:
-                self._movies_index = json.load(f)
+            if current_index_file(index_path) is None:
+                if not legacy_path.exists():
+                    logger.warning(f"电影索引文件不存在: {index_path}")
+                    return
+                # 旧版 JSON 索引：转换一次，之后直接映射二进制文件
+                logger.info(f"转换旧版索引 {legacy_path} -> {index_path}")
+                convert_json_index(legacy_path, index_path)
             
-            # 构建 ID 映射
-            self._movies_by_id = {m['id']: m for m in self._movies_index}
-            logger.info(f"已加载电影索引: {len(self._movies_index)} 部电影")
+            self._index_stamp = self._file_stamp()
+            previous, self._index = self._index, MovieIndexFile(index_path)
+            self._lower_titles = None
+            self._lower_genres = None
+            if previous is not None:
+                # 释放旧映射，旧的代文件才能在下次写出索引时删除
+                previous.close()
+            logger.info(f"已加载电影索引: {len(self._index)} 部电影")
         except Exception as e:
             logger.error(f"加载电影索引失败: {e}")
     
-    def get_featured_movies(self, count: int = 8) -> List[dict]:
-        """获取固定推荐电影（ID 1-x）"""
-        featured = []
-        for i in range(1, count + 1):
-            movie_id = str(i)
-            if movie_id in self._movies_by_id:
-                featured.append(self._movies_by_id[movie_id])
-        return featured
+    def _file_stamp(self) -> Optional[Tuple[str, int, int]]:
+        """当前索引数据文件的 (路径, mtime_ns, size)，文件不存在返回 None"""
+        path = current_index_file(self._index_path)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return str(path), stat.st_mtime_ns, stat.st_size
+    
+    def check_for_update(self):
+        """索引文件被替换时重新加载（按 index_check_interval 节流）"""
+        now = time.monotonic()
+        if now - self._last_check < settings.index_check_interval:
+            return
+        self._last_check = now
+        stamp = self._file_stamp()
+        if stamp is not None and stamp != self._index_stamp:
+            logger.info("检测到索引文件已更新，重新加载")
+            self._load_index()
+    
+    def _ranked_movie(self, doc_id: int) -> dict:
+        """按排名位置读取电影"""
+        return self._index.movie(self._index.rank[doc_id])
+    
+    def get_featured_movies(self, count: int = 8) -> Optional[List[dict]]:
+        """获取固定推荐电影（ID 1-x），索引未加载返回 None"""
+        movies = self.get_movies([str(i) for i in range(1, count + 1)])
+        if movies is None:
+            return None
+        return [movie for movie in movies if movie is not None]
+    
+    def get_movies(self, movie_ids: List[str]) -> Optional[List[Optional[dict]]]:
+        """按 ID 批量从索引中获取电影（与 movie_ids 一一对应），索引未加载返回 None"""
+        self.check_for_update()
+        if self._index is None:
+            return None
+        rows = [self._index.find_row(movie_id) for movie_id in movie_ids]
+        return [self._index.movie(row) if row is not None else None for row in rows]
+    
+    def get_movie(self, movie_id: str) -> Optional[dict]:
+        """按 ID 从索引中获取电影，不存在返回 None"""
+        self.check_for_update()
+        if self._index is None:
+            return None
+        row = self._index.find_row(movie_id)
+        return self._index.movie(row) if row is not None else None
     
     def search(self, query: str, limit: int = 50) -> List[dict]:
-        """搜索电影（使用索引）"""
-        if not query or not query.strip():
-            return []
+        """搜索电影（使用倒排索引）
         
-        query_lower = query.lower().strip()
-        matched = []
+        标题匹配的电影排在前面，其次是类型匹配的电影，各自按评分降序。
+        多个词取交集，最后一个词按前缀匹配；倒排索引无结果时回退到子串扫描。
+        """
+        self.check_for_update()
+        if not query or not query.strip() or self._index is None:
+            return []
         
-        for movie in self._movies_index:
-            title_lower = movie['title'].lower()
-            genres_lower = movie['genres'].lower()
-            
-            if query_lower in title_lower or query_lower in genres_lower:
-                matched.append(movie)
-                if len(matched) >= limit:
+        terms, prefix = parse_query(query)
+        matched_ids: List[int] = []
+        if terms or prefix is not None:
+            for doc_id in self._index.title_index.match(terms, prefix):
+                matched_ids.append(doc_id)
+                if len(matched_ids) >= limit:
                     break
+            if len(matched_ids) < limit:
+                seen = set(matched_ids)
+                for doc_id in self._index.genre_index.match(terms, prefix):
+                    if doc_id in seen:
+                        continue
+                    matched_ids.append(doc_id)
+                    if len(matched_ids) >= limit:
+                        break
         
-        # 按相关度排序（标题匹配优先，然后按评分）
-        def sort_key(m):
-            title_match = query_lower in m['title'].lower()
-            return (not title_match, -m['avg_rating'], -m['rating_count'])
+        if not matched_ids:
+            matched_ids = self._substring_search(query.lower().strip(), limit)
+        
+        return [self._ranked_movie(doc_id) for doc_id in matched_ids]
+    
+    def _substring_search(self, query_lower: str, limit: int) -> List[int]:
+        """子串扫描（倒排索引无结果时的回退方案）"""
+        if self._lower_titles is None:
+            rank = self._index.rank
+            self._lower_titles = [self._index.titles[row].lower() for row in rank]
+            self._lower_genres = [self._index.genres[row].lower() for row in rank]
+        
+        title_matches = []
+        genre_matches = []
+        for doc_id, title in enumerate(self._lower_titles):
+            if query_lower in title:
+                title_matches.append(doc_id)
+                if len(title_matches) >= limit:
+                    break
+            elif len(genre_matches) < limit and query_lower in self._lower_genres[doc_id]:
+                genre_matches.append(doc_id)
+        return (title_matches + genre_matches)[:limit]
+    
+    def list_movies(self, sort: str, offset: int, limit: int) -> Optional[Tuple[List[dict], int]]:
+        """按预计算的排序排列分页读取电影，索引未加载时返回 None
         
-        matched.sort(key=sort_key)
-        return matched[:limit]
+        Returns:
+            Optional[tuple]: (电影列表, 总数)
+        """
+        self.check_for_update()
+        if self._index is None:
+            return None
+        rows = self._index.sort_order(sort)[offset:offset + limit]
+        return [self._index.movie(row) for row in rows], len(self._index)
+    
+    def top_movie_ids(self, sort: str, count: int) -> List[str]:
+        """某种排序下排在最前面的电影 ID，索引未加载时返回空列表"""
+        if self._index is None:
+            return []
+        return [str(self._index.ids[row]) for row in self._index.sort_order(sort)[:count]]
     
     def reload_index(self):
         """重新加载索引"""
         self._load_index()
 
 
+# 无索引时回退路径使用的排序键，与索引文件中预计算的排列保持一致
+_LIST_SORT_KEYS = {
+    'rating': lambda m: (-m.avg_rating, -m.rating_count),
+    'rating_count': lambda m: (-m.rating_count, -m.avg_rating),
+    'title': lambda m: m.title.casefold(),
+    'year': lambda m: (-parse_year(m.title), -m.avg_rating, -m.rating_count),
+    'id': lambda m: int(m.id),
+}
+
+
 class MovieService:
     """电影业务服务"""
     
@@ -87,48 +205,77 @@ class MovieService:
         self.rating_repo = RatingRepository()
         self.index_service = MovieIndexService()
     
-    def get_movies_list(self, page: int = 1, page_size: int = 20) -> tuple:
+    async def get_movies_list(self, page: int = 1, page_size: int = 20, sort: str = 'rating') -> tuple:
         """获取电影列表（分页）
         
+        索引已加载时直接在预计算的排序排列上切片，不访问 HBase；
+        否则回退到流式扫描 movies 表，只保留排序后前 page * page_size 部电影。
+        
         Args:
             page: 页码
             page_size: 每页数量
+            sort: 排序方式（rating / rating_count / title / year / id）
             
         Returns:
             tuple: (电影列表, 总数, 总页数)
         """
         try:
-            # 获取所有电影
-            all_movies_data = self.movie_repo.find_all()
-            
-            # 转换为领域模型
-            all_movies = [
-                Movie(
-                    id=m['id'],
-                    title=m['title'],
-                    genres=m['genres'],
-                    avg_rating=float(m['avg_rating']),
-                    rating_count=int(m['rating_count'])
-                )
-                for m in all_movies_data
-            ]
+            start_idx = (page - 1) * page_size
             
-            # 按评分排序
-            all_movies.sort(key=lambda x: (x.avg_rating, x.rating_count), reverse=True)
+            page_data = self.index_service.list_movies(sort, start_idx, page_size)
+            if page_data is not None:
+                movies_data, total = page_data
+                movies = [self._to_movie(m) for m in movies_data]
+            else:
+                # 逐页扫描，每页与当前的前 k 部合并后再截断（nsmallest 是稳定的）
+                sort_key = _LIST_SORT_KEYS[sort]
+                keep = start_idx + page_size
+                top: List[Movie] = []
+                page_movies: List[Movie] = []
+                total = 0
+                async for data in self.movie_repo.iter_all_async():
+                    page_movies.append(self._to_movie(data))
+                    total += 1
+                    if len(page_movies) >= settings.scan_page_size:
+                        top = heapq.nsmallest(keep, top + page_movies, key=sort_key)
+                        page_movies = []
+                top = heapq.nsmallest(keep, top + page_movies, key=sort_key)
+                movies = top[start_idx:]
             
-            # 分页处理
-            total = len(all_movies)
             total_pages = (total + page_size - 1) // page_size
-            start_idx = (page - 1) * page_size
-            end_idx = start_idx + page_size
-            movies = all_movies[start_idx:end_idx]
-            
             return movies, total, total_pages
         except Exception as e:
             logger.error(f"获取电影列表失败: {e}")
             raise
     
-    def get_movie_basic_info(self, movie_id: str) -> Optional[Movie]:
+    async def export_movies(self) -> AsyncIterator[dict]:
+        """按 ID 行键顺序流式导出所有电影（不含评分分布），内存占用与电影数量无关"""
+        async for data in self.movie_repo.iter_all_async():
+            yield data
+    
+    async def prewarm_cache(self, count: int) -> int:
+        """预热电影缓存：读取评分人数最多的前 count 部电影
+        
+        Returns:
+            int: 已缓存的电影数量
+        """
+        movie_ids = self.index_service.top_movie_ids('rating_count', count)
+        if not movie_ids:
+            return 0
+        return await self.movie_repo.prewarm_async(movie_ids)
+    
+    @staticmethod
+    def _to_movie(data: dict) -> Movie:
+        """电影字典转换为领域模型"""
+        return Movie(
+            id=data['id'],
+            title=data['title'],
+            genres=data['genres'],
+            avg_rating=float(data['avg_rating']),
+            rating_count=int(data['rating_count'])
+        )
+    
+    async def get_movie_basic_info(self, movie_id: str) -> Optional[Movie]:
         """根据ID获取电影基本信息（不获取评分列表）
         
         Args:
@@ -138,7 +285,8 @@ class MovieService:
             Optional[Movie]: 电影基本信息，不存在返回None
         """
         try:
-            movie_data = self.movie_repo.find_by_id(movie_id)
+            self.index_service.check_for_update()
+            movie_data = await self.movie_repo.find_by_id_async(movie_id)
             if not movie_data:
                 return None
             
@@ -153,7 +301,7 @@ class MovieService:
             logger.error(f"获取电影基本信息失败 movie_id={movie_id}: {e}")
             raise
     
-    def get_movie_by_id(self, movie_id: str) -> Optional[MovieDetail]:
+    async def get_movie_by_id(self, movie_id: str) -> Optional[MovieDetail]:
         """根据ID获取电影详情（包含评分列表，已弃用）
         
         Args:
@@ -164,17 +312,13 @@ class MovieService:
         """
         try:
             # 获取电影基本信息
-            movie_data = self.movie_repo.find_by_id(movie_id)
+            self.index_service.check_for_update()
+            movie_data = await self.movie_repo.find_by_id_async(movie_id)
             if not movie_data:
                 return None
             
-            # 获取最近评分（前10条）
-            # 设置较小的 max_scan_rows 限制扫描范围，提高响应速度
-            ratings_data = self.rating_repo.find_by_movie_id(
-                movie_id, 
-                limit=10, 
-                max_scan_rows=20000  # 最多扫描2万行，快速返回
-            )
+            # 获取最近评分（前10条），索引表按时间倒序排列
+            ratings_data = await self.rating_repo.find_by_movie_id_async(movie_id, limit=10)
             ratings = [
                 Rating(
                     user_id=r['user_id'],
@@ -198,7 +342,7 @@ class MovieService:
             logger.error(f"获取电影详情失败 movie_id={movie_id}: {e}")
             raise
     
-    def get_movie_ratings(self, movie_id: str, page: int = 1, page_size: int = 20) -> Tuple[List[Rating], int, int]:
+    async def get_movie_ratings(self, movie_id: str, page: int = 1, page_size: int = 20) -> Tuple[List[Rating], int, int]:
         """获取电影的所有评分（分页）
         
         Args:
@@ -210,43 +354,39 @@ class MovieService:
             tuple: (评分列表, 总数, 总页数)
         """
         try:
-            # 限制最大返回数量，防止性能问题
-            # 由于 rowkey 设计 (user_id_movie_id) 不支持按 movie_id 高效查询
-            # 这里设置一个合理的上限
-            max_ratings = 500
-            all_ratings_data = self.rating_repo.find_by_movie_id(
-                movie_id, 
-                limit=max_ratings,
-                max_scan_rows=100000  # 最多扫描10万行
-            )
+            # 评分总数取自预计算的统计，索引中有则不再读 HBase
+            movie_data = self.index_service.get_movie(movie_id)
+            if movie_data is None:
+                movie_data = await self.movie_repo.find_by_id_async(movie_id)
+            total = int(movie_data['rating_count']) if movie_data else 0
+            total_pages = (total + page_size - 1) // page_size if total > 0 else 0
             
-            # 转换为领域模型
-            all_ratings = [
+            start_idx = (page - 1) * page_size
+            if start_idx >= total:
+                return [], total, total_pages
+            
+            # 索引表按时间倒序排列，只扫描到当前页末尾
+            ratings_data = await self.rating_repo.find_by_movie_id_async(
+                movie_id,
+                limit=page_size,
+                offset=start_idx
+            )
+            ratings = [
                 Rating(
                     user_id=r['user_id'],
                     movie_id=r['movie_id'],
                     rating=float(r['rating']),
                     timestamp=r['timestamp']
                 )
-                for r in all_ratings_data
+                for r in ratings_data
             ]
             
-            # 按时间戳倒序排序（最新的在前）
-            all_ratings.sort(key=lambda x: x.timestamp, reverse=True)
-            
-            # 分页处理
-            total = len(all_ratings)
-            total_pages = (total + page_size - 1) // page_size if total > 0 else 0
-            start_idx = (page - 1) * page_size
-            end_idx = start_idx + page_size
-            ratings = all_ratings[start_idx:end_idx]
-            
             return ratings, total, total_pages
         except Exception as e:
             logger.error(f"获取电影评分列表失败 movie_id={movie_id}: {e}")
             raise
     
-    def get_rating_stats(self, movie_id: str) -> dict:
+    async def get_rating_stats(self, movie_id: str) -> dict:
         """获取电影评分统计
         
         Args:
@@ -256,14 +396,30 @@ class MovieService:
             dict: 评分统计信息
         """
         try:
-            return self.rating_repo.get_rating_stats(movie_id)
+            # 优先使用索引中预计算的直方图，其次是与详情页共用的电影缓存
+            movie = self.index_service.get_movie(movie_id)
+            if movie is None:
+                movie = await self.movie_repo.find_by_id_async(movie_id)
+            if movie is None:
+                return {
+                    'avg_rating': 0.0,
+                    'total_count': 0,
+                    'rating_distribution': {}
+                }
+            return {
+                'avg_rating': float(movie['avg_rating']),
+                'total_count': int(movie['rating_count']),
+                'rating_distribution': movie['rating_distribution']
+            }
         except Exception as e:
             logger.error(f"获取评分统计失败 movie_id={movie_id}: {e}")
             raise
     
-    def get_featured_movies(self, count: int = 8) -> List[Movie]:
+    async def get_featured_movies(self, count: int = 8) -> List[Movie]:
         """获取固定推荐电影（ID 1-x）
         
+        优先从索引读取；索引未加载时一次批量读取 HBase
+        
         Args:
             count: 返回数量
             
@@ -272,20 +428,36 @@ class MovieService:
         """
         try:
             featured_data = self.index_service.get_featured_movies(count)
-            return [
-                Movie(
-                    id=m['id'],
-                    title=m['title'],
-                    genres=m['genres'],
-                    avg_rating=float(m['avg_rating']),
-                    rating_count=int(m['rating_count'])
-                )
-                for m in featured_data
-            ]
+            if featured_data is None:
+                movies, _ = await self.get_movies_by_ids([str(i) for i in range(1, count + 1)])
+                return movies
+            return [self._to_movie(m) for m in featured_data]
         except Exception as e:
             logger.error(f"获取推荐电影失败: {e}")
             raise
     
+    async def get_movies_by_ids(self, movie_ids: List[str]) -> Tuple[List[Movie], List[str]]:
+        """按 ID 批量获取电影（读穿缓存，未命中的一次 multi-get）
+        
+        Args:
+            movie_ids: 电影ID列表
+            
+        Returns:
+            tuple: (按请求顺序排列的电影列表, 不存在的ID列表)
+        """
+        try:
+            self.index_service.check_for_update()
+            movies, missing = [], []
+            for movie_id, data in zip(movie_ids, await self.movie_repo.find_by_ids_async(movie_ids)):
+                if data is None:
+                    missing.append(movie_id)
+                else:
+                    movies.append(self._to_movie(data))
+            return movies, missing
+        except Exception as e:
+            logger.error(f"批量获取电影失败: {e}")
+            raise
+    
     def search_movies(self, query: str, limit: int = 50) -> List[Movie]:
         """搜索电影（使用 JSON 索引，不扫描 HBase）
         
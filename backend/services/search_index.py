@@ -0,0 +1,195 @@
+"""电影标题/类型的倒排索引
+
+每个规范化后的词对应一个按文档编号升序排列的倒排表。索引在生成索引文件时
+构建并持久化，API 进程直接在 mmap 视图上查询。
+文档编号就是电影在排名顺序（评分、评分人数降序）中的位置，所以按编号
+升序产出结果即是按排名产出结果，取前 N 条即可提前结束。
+"""
+
+import heapq
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+# 前缀展开的词数超过该值时，改为逐个检查候选文档的词表，避免合并大量倒排表
+MAX_PREFIX_EXPANSIONS = 64
+
+# 估算按排名扫描的代价时假设的结果条数
+SCAN_LIMIT_HINT = 64
+
+# 不超过该长度的单独前缀（用户刚开始输入时）缓存前若干条结果
+SHORT_PREFIX_LENGTH = 2
+SHORT_PREFIX_CACHE_SIZE = 128
+
+
+def tokenize(text: str) -> List[str]:
+    """把文本切分为小写的词（字母/数字连续串）"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def parse_query(query: str) -> Tuple[List[str], Optional[str]]:
+    """解析查询为 (完整词列表, 最后一个词的前缀)
+
+    查询以分隔符结尾（如空格）时最后一个词视为已输入完整，前缀为 None。
+    """
+    terms = tokenize(query)
+    if not terms:
+        return [], None
+    if _TOKEN_RE.match(query[-1]):
+        return terms[:-1], terms[-1]
+    return terms, None
+
+
+def build_postings(texts: Sequence[str]) -> Tuple[List[str], List[List[int]]]:
+    """按文档编号顺序传入字段文本，构建 (有序词表, 与词表对应的倒排表)"""
+    postings: Dict[str, List[int]] = defaultdict(list)
+    for doc_id, text in enumerate(texts):
+        # 去重，保证每个倒排表中文档编号严格递增
+        for token in dict.fromkeys(tokenize(text)):
+            postings[token].append(doc_id)
+    vocabulary = sorted(postings)
+    return vocabulary, [postings[token] for token in vocabulary]
+
+
+class TokenIndex:
+    """单个文本字段的倒排索引
+
+    词表、倒排表和文档文本都只要求支持下标访问和 len()，
+    既可以是内存中的列表，也可以是 mmap 索引文件上的视图。
+    """
+
+    def __init__(
+        self,
+        vocabulary: Sequence[str],
+        postings: Sequence[Sequence[int]],
+        doc_texts: Sequence[str],
+    ):
+        self._vocabulary = vocabulary
+        self._postings = postings
+        self._doc_texts = doc_texts
+        self._prefix_cache: Dict[str, List[int]] = {}
+
+    @classmethod
+    def from_texts(cls, texts: Sequence[str]) -> 'TokenIndex':
+        """在内存中由字段文本构建索引"""
+        vocabulary, postings = build_postings(texts)
+        return cls(vocabulary, postings, texts)
+
+    def __len__(self) -> int:
+        return len(self._doc_texts)
+
+    def _lookup(self, term: str) -> Optional[Sequence[int]]:
+        """精确查找词的倒排表，不存在返回 None"""
+        pos = bisect_left(self._vocabulary, term)
+        if pos < len(self._vocabulary) and self._vocabulary[pos] == term:
+            return self._postings[pos]
+        return None
+
+    def _expand_prefix(self, prefix: str) -> range:
+        """返回所有以 prefix 开头的词在词表中的下标范围"""
+        lo = bisect_left(self._vocabulary, prefix)
+        hi = bisect_left(self._vocabulary, prefix + '\U0010ffff', lo)
+        return range(lo, hi)
+
+    def _has_prefix(self, doc_id: int, prefix: str) -> bool:
+        """文档是否包含以 prefix 开头的词"""
+        return any(token.startswith(prefix) for token in tokenize(self._doc_texts[doc_id]))
+
+    def match(self, terms: List[str], prefix: Optional[str] = None) -> Iterator[int]:
+        """按文档编号升序惰性产出匹配的文档
+
+        文档需包含 terms 中的所有词，并且（prefix 不为 None 时）至少包含
+        一个以 prefix 开头的词。
+        """
+        if terms or prefix is None or len(prefix) > SHORT_PREFIX_LENGTH:
+            return self._match(terms, prefix)
+        return self._match_short_prefix(prefix)
+
+    def _match_short_prefix(self, prefix: str) -> Iterator[int]:
+        """短前缀匹配面大，缓存排名靠前的结果，超出缓存部分再实时计算"""
+        cached = self._prefix_cache.get(prefix)
+        if cached is None:
+            cached = list(islice(self._match([], prefix), SHORT_PREFIX_CACHE_SIZE + 1))
+            self._prefix_cache[prefix] = cached
+        yield from cached[:SHORT_PREFIX_CACHE_SIZE]
+        if len(cached) > SHORT_PREFIX_CACHE_SIZE:
+            yield from islice(self._match([], prefix), SHORT_PREFIX_CACHE_SIZE, None)
+
+    def _match(self, terms: List[str], prefix: Optional[str]) -> Iterator[int]:
+        """match 的实际实现"""
+        if not terms and prefix is None:
+            return
+
+        lists = []
+        for term in terms:
+            posting = self._lookup(term)
+            if posting is None:
+                return
+            lists.append(posting)
+
+        prefix_check = None
+        source: Iterator[int]
+        if prefix is not None:
+            expansions = self._expand_prefix(prefix)
+            if not expansions:
+                return
+            if len(expansions) == 1:
+                lists.append(self._postings[expansions.start])
+            elif lists:
+                # 已有更精确的候选：逐个候选检查前缀
+                prefix_check = prefix
+            elif len(expansions) <= MAX_PREFIX_EXPANSIONS:
+                merged = heapq.merge(*(self._postings[i] for i in expansions))
+                source = _unique(merged)
+            else:
+                total = sum(len(self._postings[i]) for i in expansions)
+                if total * total > SCAN_LIMIT_HINT * len(self._doc_texts):
+                    # 匹配很密集：按排名顺序扫描很快就能凑满结果
+                    prefix_check = prefix
+                else:
+                    # 匹配稀疏：直接合并所有展开词的倒排表
+                    merged_ids = set()
+                    for i in expansions:
+                        merged_ids.update(self._postings[i])
+                    source = iter(sorted(merged_ids))
+
+        if lists:
+            # 从最短的倒排表出发，其余表用递增游标做二分查找求交集
+            lists.sort(key=len)
+            source = iter(lists[0])
+            others = lists[1:]
+        elif prefix_check is not None:
+            source = iter(range(len(self._doc_texts)))
+            others = []
+        else:
+            others = []
+
+        cursors = [0] * len(others)
+        for doc_id in source:
+            matched = True
+            for i, posting in enumerate(others):
+                pos = bisect_left(posting, doc_id, cursors[i])
+                cursors[i] = pos
+                if pos == len(posting):
+                    return
+                if posting[pos] != doc_id:
+                    matched = False
+                    break
+            if not matched:
+                continue
+            if prefix_check is not None and not self._has_prefix(doc_id, prefix_check):
+                continue
+            yield doc_id
+
+
+def _unique(sorted_ids: Iterator[int]) -> Iterator[int]:
+    """去掉有序序列中的重复值"""
+    last = None
+    for doc_id in sorted_ids:
+        if doc_id != last:
+            yield doc_id
+            last = doc_id
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+用户评分读取基准测试
+对比两种布局读取单个用户全部评分的耗时:
+
+- tall：ratings 表按用户前缀扫描（每条评分一行）
+- wide：ratings_by_user 宽行表一次 row()（每个用户一行）
+
+用法:
+    python bench_user_ratings.py [--users 200] [--rounds 3] [--seed 0]
+
+用户从 ratings.csv 随机抽样，--seed 相同时抽到的用户相同。需要导入时开启 database.user_wide_rows。
+"""
+
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import happybase
+import yaml
+
+from backend.db.schema import RowKeyCodec
+from backend.db.table_spec import sample_csv_columns
+
+
+def _option(name: str, default: int) -> int:
+    """读取 --name <整数> 形式的命令行参数"""
+    if name not in sys.argv[1:]:
+        return default
+    return int(sys.argv[sys.argv.index(name) + 1])
+
+
+def _summary(name: str, timings: List[float], cells: int):
+    """打印单个布局的耗时分布（毫秒）"""
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"  {name:<5} 平均 {statistics.mean(timings) * 1000:7.2f} ms  "
+          f"P50 {statistics.median(timings) * 1000:7.2f} ms  P95 {p95 * 1000:7.2f} ms  "
+          f"（共读取 {cells:,} 条评分）")
+
+
+def main():
+    """主函数"""
+    with open("config.yaml", 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    database = config['database']
+    keys = RowKeyCodec(database.get('key_encoding', 'string'), database.get('ratings_salt_buckets', 0))
+    users = _option('--users', 200)
+    rounds = _option('--rounds', 3)
+    seed = _option('--seed', 0)
+
+    ratings_path = Path(config['data']['csv_dir']) / config['data']['ratings_file']
+    # 排序后再抽样：集合的迭代顺序随字符串哈希变化，同一 seed 也会抽到不同用户
+    candidates = sorted({user_id for user_id, in sample_csv_columns(ratings_path, ['userId'], users * 10)})
+    user_ids = random.Random(seed).sample(candidates, min(users, len(candidates)))
+    print(f"抽样 {len(user_ids)} 个用户，每种布局 {rounds} 轮")
+
+    connection = happybase.Connection(host=config['hbase']['host'], port=config['hbase']['port'])
+    try:
+        tall_table = connection.table(database['ratings_table'])
+        wide_table = connection.table(database.get('ratings_by_user_table', 'ratings_by_user'))
+
+        def tall(user_id: str) -> int:
+            return sum(1 for _ in tall_table.scan(row_prefix=keys.rating_user_prefix(user_id), batch_size=1000))
+
+        def wide(user_id: str) -> int:
+            return len(wide_table.row(keys.user_key(user_id)))
+
+        readers = [('tall', tall), ('wide', wide)]
+        for name, read in readers:
+            read(user_ids[0])  # 预热连接和 region 位置缓存
+            timings, cells = [], 0
+            for _ in range(rounds):
+                for user_id in user_ids:
+                    started = time.perf_counter()
+                    cells += read(user_id)
+                    timings.append(time.perf_counter() - started)
+            _summary(name, timings, cells // rounds)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
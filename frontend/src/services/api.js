@@ -35,9 +35,14 @@ export const adminApi = {
     return api.get('/admin/batch/logs')
   },
 
-  // 启动批处理
-  startBatch() {
-    return api.post('/admin/batch/start')
+  // 获取批处理各阶段完成情况
+  getBatchPipeline() {
+    return api.get('/admin/batch/pipeline')
+  },
+
+  // 启动批处理（可选 { full, stage }）
+  startBatch(params = {}) {
+    return api.post('/admin/batch/start', null, { params })
   },
 
   // 停止批处理
@@ -58,8 +63,8 @@ export const movieApi = {
   },
 
   // 获取电影列表
-  getMovies(page = 1, pageSize = 20) {
-    return api.get('/movies', { params: { page, page_size: pageSize } })
+  getMovies(page = 1, pageSize = 20, sort = 'rating') {
+    return api.get('/movies', { params: { page, page_size: pageSize, sort } })
   },
 
   // 搜索电影
@@ -67,6 +72,11 @@ export const movieApi = {
     return api.get('/movies/search', { params: { q: query, limit } })
   },
 
+  // 批量获取电影（按传入顺序返回）
+  getMoviesBatch(ids) {
+    return api.get('/movies/batch', { params: { ids: ids.join(',') } })
+  },
+
   // 获取电影详情
   getMovieDetail(id) {
     return api.get(`/movies/${id}`)
@@ -6,16 +6,255 @@ MovieLens 数据导入脚本
 
 import csv
 import json
+import os
+import queue
 import sys
+import threading
 import time
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import happybase
 import yaml
 from tqdm import tqdm
 
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    from backend.db.rating_stats import ArrayRatingStats
+    ARROW_AVAILABLE = True
+    ARROW_IMPORT_ERROR = None
+except ImportError as e:
+    ARROW_AVAILABLE = False
+    ARROW_IMPORT_ERROR = e
+
+from backend.db.schema import (
+    BINARY_KEY_MAX,
+    HISTOGRAM_COLUMNS,
+    MAX_TIMESTAMP,
+    RowKeyCodec,
+    rating_salt,
+    rating_salt_prefix,
+    rating_bucket,
+    empty_histogram,
+    histogram_cells,
+    histogram_from_row,
+    histogram_sum,
+    histogram_to_distribution,
+    pack_user_rating,
+)
+from backend.db.table_spec import TableSpec, create_table, sample_csv_columns, split_points
+from backend.services.index_file import current_index_file, read_movie_index, write_movie_index
+
+# 增量导入时每次批量读取（multi-get）的行数
+DELTA_GET_BATCH = 1000
+
+MOVIE_INDEX_PATH = Path("backend/data/movie_index.bin")
+
+# 批处理任务未提交的 aggregate 阶段结果（见 spark_batch.STAGES）
+BATCH_AGGREGATE_PATH = Path("backend/data/batch_work/aggregate.npz")
+
+
+def fixed_width_rows(matrix) -> List[bytes]:
+    """把 (行数, 宽度) 的 uint8 矩阵切成每行一个 bytes"""
+    data = np.ascontiguousarray(matrix).tobytes()
+    width = matrix.shape[1]
+    return [data[i:i + width] for i in range(0, len(data), width)]
+
+
+class RatingStats:
+    """逐行累计每部电影的评分总和、数量和直方图"""
+    
+    def __init__(self):
+        self._stats = defaultdict(lambda: {'sum': 0.0, 'count': 0, 'hist': empty_histogram()})
+    
+    def add(self, movie_id: str, score: float):
+        movie_stats = self._stats[movie_id]
+        movie_stats['sum'] += score
+        movie_stats['count'] += 1
+        movie_stats['hist'][rating_bucket(score)] += 1
+    
+    def result(self) -> Dict[str, Dict]:
+        """{movie_id: {'avg', 'count', 'hist'}}"""
+        return {
+            movie_id: {
+                'avg': data['sum'] / data['count'],
+                'count': data['count'],
+                'hist': data['hist']
+            }
+            for movie_id, data in self._stats.items()
+        }
+
+
+class ImportCheckpoint:
+    """评分导入的断点文件
+    
+    记录已连续写入完成的评分行数和对应的字节偏移（水位线）。写入线程
+    乱序完成数据块，只有当某个数据块之前的所有块都已写完时水位线才前进，
+    保证水位线之前的数据全部已经落盘。文件同时记录评分文件的大小和修改时间，
+    文件变化后断点失效。
+    """
+    
+    def __init__(self, path: Path, ratings_path: Path):
+        self.path = Path(path)
+        self.ratings_path = Path(ratings_path)
+        self.rows = 0
+        self.bytes = 0
+        self.ratings_done = False
+        self._last_save = 0.0
+    
+    def _fingerprint(self) -> dict:
+        stat = self.ratings_path.stat()
+        return {
+            'ratings_file': str(self.ratings_path),
+            'file_size': stat.st_size,
+            'file_mtime_ns': stat.st_mtime_ns,
+        }
+    
+    def load(self) -> bool:
+        """读取断点，文件不存在返回 False；评分文件已变化时抛出 ValueError"""
+        if not self.path.exists():
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        fingerprint = self._fingerprint()
+        if any(data.get(key) != value for key, value in fingerprint.items()):
+            raise ValueError(f"评分文件与断点记录不一致，无法续传: {self.path}")
+        self.rows = int(data['rows'])
+        self.bytes = int(data['bytes'])
+        self.ratings_done = bool(data.get('ratings_done', False))
+        return True
+    
+    def save(self, force: bool = True):
+        """写出断点（先写临时文件再原子替换）；force=False 时每秒最多写一次"""
+        now = time.time()
+        if not force and now - self._last_save < 1.0:
+            return
+        self._last_save = now
+        data = dict(self._fingerprint(), rows=self.rows, bytes=self.bytes,
+                    ratings_done=self.ratings_done, updated_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+    
+    def remove(self):
+        """导入完成后删除断点文件"""
+        self.path.unlink(missing_ok=True)
+
+
+class RatingWriter(threading.Thread):
+    """评分写入线程
+    
+    从有界队列中取出解析好的数据块，用自己的 HBase 连接和 batch 写入
+    ratings 表和 ratings_by_movie 索引表（启用宽行时还有 ratings_by_user 表）。
+    写入失败时重建连接并重试整个块
+    （put 是幂等的，重放不会产生重复数据）。
+    """
+    
+    def __init__(self, worker_id: int, importer: 'HBaseImporter', chunks: queue.Queue,
+                 on_written, failed: threading.Event, max_retries: int = 3):
+        super().__init__(name=f"rating-writer-{worker_id}", daemon=True)
+        self.worker_id = worker_id
+        self.importer = importer
+        self.chunks = chunks
+        self.on_written = on_written
+        self.failed = failed
+        self.max_retries = max_retries
+        self.connection = None
+        self.error: Optional[BaseException] = None
+        # 每个线程的统计：写入行数、数据块数、重试次数、写入耗时、取块时的队列深度
+        self.rows = 0
+        self.chunks_written = 0
+        self.retries = 0
+        self.busy_time = 0.0
+        self.max_queue_depth = 0
+        self.queue_depth_total = 0
+    
+    def _write_chunk(self, chunk: tuple):
+        """把一个数据块写入评分表和索引表
+        
+        数据块按列存放：(ratings 行键, 评分, 时间戳, 索引表行键)，均为 bytes 列表。
+        宽行表的行键和列名从 ratings 行键切分得到，块内同一用户的评分合并为一次 put。
+        """
+        if self.connection is None:
+            self.connection = self.importer.open_connection()
+        ratings_table = self.connection.table(self.importer.ratings_table_name)
+        index_table = self.connection.table(self.importer.ratings_by_movie_table_name)
+        row_keys, ratings, timestamps, index_keys = chunk
+        with ratings_table.batch() as batch, index_table.batch() as index_batch:
+            for row_key, rating, timestamp, index_key in zip(row_keys, ratings, timestamps, index_keys):
+                batch.put(row_key, {b'data:rating': rating, b'data:timestamp': timestamp})
+                index_batch.put(index_key, {b'data:rating': rating})
+        
+        if self.importer.ratings_by_user_table_name:
+            keys = self.importer.keys
+            user_rows: Dict[bytes, Dict[bytes, bytes]] = defaultdict(dict)
+            for row_key, rating, timestamp in zip(row_keys, ratings, timestamps):
+                user_key, qualifier = keys.split_rating_key(row_key)
+                user_rows[user_key][b'data:' + qualifier] = pack_user_rating(rating, timestamp)
+            with self.connection.table(self.importer.ratings_by_user_table_name).batch() as user_batch:
+                for user_key, data in user_rows.items():
+                    user_batch.put(user_key, data)
+    
+    def _reset_connection(self):
+        """丢弃当前连接，下次写入时重新建立"""
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+    
+    def run(self):
+        try:
+            while True:
+                depth = self.chunks.qsize()
+                item = self.chunks.get()
+                if item is None:
+                    break
+                if self.failed.is_set():
+                    # 其他线程已失败，导入会中止，丢弃剩余数据块
+                    continue
+                seq, chunk, size_bytes = item
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+                self.queue_depth_total += depth
+                
+                started = time.time()
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        self._write_chunk(chunk)
+                        break
+                    except Exception as e:
+                        self._reset_connection()
+                        if attempt == self.max_retries:
+                            raise
+                        self.retries += 1
+                        print(f"\n   [警告] {self.name} 写入失败，重试 {attempt + 1}/{self.max_retries}: {e}")
+                        time.sleep(min(2 ** attempt, 30))
+                self.busy_time += time.time() - started
+                
+                rows = len(chunk[0])
+                self.rows += rows
+                self.chunks_written += 1
+                self.on_written(seq, rows, size_bytes)
+        except BaseException as e:
+            self.error = e
+            self.failed.set()
+        finally:
+            self._reset_connection()
+    
+    def summary(self) -> str:
+        """单个线程的统计信息"""
+        speed = self.rows / self.busy_time if self.busy_time else 0
+        avg_depth = self.queue_depth_total / self.chunks_written if self.chunks_written else 0
+        return (f"{self.name}: {self.rows:,} 条 / {self.chunks_written} 块, "
+                f"重试 {self.retries} 次, 写入 {speed:.0f}条/s, "
+                f"队列深度 平均 {avg_depth:.1f} 最大 {self.max_queue_depth}")
+
 
 class HBaseImporter:
     """HBase数据导入器"""
@@ -26,8 +265,32 @@ class HBaseImporter:
             self.config = yaml.safe_load(f)
         
         self.connection = None
+        self.connection_options = None
         self.movies_table = None
         self.ratings_table = None
+        self.ratings_by_movie_table = None
+        self.ratings_table_name = None
+        self.ratings_by_movie_table_name = None
+        self.ratings_by_user_table = None
+        self.ratings_by_user_table_name = None
+        # 行键编码和 ratings 行键的盐桶数（API 读取时须使用同一配置）
+        self.salt_buckets = int(self.config['database'].get('ratings_salt_buckets', 0))
+        self.keys = RowKeyCodec(self.config['database'].get('key_encoding', 'string'), self.salt_buckets)
+        # 是否同时写入每用户一行的 ratings_by_user 宽行表
+        self.user_wide_rows = bool(self.config['database'].get('user_wide_rows', False))
+        
+        # 评分导入并发配置：解析线程 -> 有界队列 -> N 个写入线程
+        import_config = self.config.get('import', {})
+        self.writer_workers = max(1, int(import_config.get('workers', 4)))
+        self.chunk_size = int(import_config.get('chunk_size', 10000))
+        self.queue_size = int(import_config.get('queue_size', self.writer_workers * 2))
+        self.max_retries = int(import_config.get('max_retries', 8))
+        # 断点文件：记录已写入的评分水位线，--resume 时从这里继续
+        self.checkpoint_path = Path(import_config.get('checkpoint_file', 'backend/data/import_checkpoint.json'))
+        # 评分解析引擎：stream（逐行）/ arrow（按块向量化）/ auto（装有 pyarrow 时用 arrow）
+        self.engine = import_config.get('engine', 'auto')
+        # 批处理任务保存的每部电影累计统计，增量导入的评分要同步合并进去
+        self.batch_state_path = Path((self.config.get('batch') or {}).get('state_file', 'backend/data/batch_state.npz'))
     
     def _check_hbase_service(self):
         """检查 HBase 服务状态"""
@@ -90,6 +353,7 @@ class HBaseImporter:
                 # 测试连接
                 print("   正在测试连接...")
                 tables = self.connection.tables()
+                self.connection_options = config
                 print(f"   ✓ 连接成功！(当前有 {len(tables)} 个表)")
                 print(f"   使用配置: transport={config['transport']}, protocol={config['protocol']}")
                 
@@ -123,6 +387,88 @@ class HBaseImporter:
         
         return False
     
+    def open_connection(self) -> happybase.Connection:
+        """按 connect() 中测试通过的配置新建一个连接（供写入线程使用）"""
+        return happybase.Connection(
+            host=self.config['hbase']['host'],
+            port=self.config['hbase']['port'],
+            **self.connection_options
+        )
+    
+    def _table_specs(self) -> Dict[str, TableSpec]:
+        """config.yaml tables 段中各表的定义（逻辑表名 -> TableSpec）
+        
+        启用宽行时包含 ratings_by_user 表
+        """
+        database = self.config['database']
+        specs = {
+            'movies': TableSpec.from_config(
+                self.config, 'movies', database['movies_table'], {'info': {}}),
+            'ratings': TableSpec.from_config(
+                self.config, 'ratings', database['ratings_table'], {'data': {}}),
+            'ratings_by_movie': TableSpec.from_config(
+                self.config, 'ratings_by_movie',
+                database.get('ratings_by_movie_table', 'ratings_by_movie'), {'data': {}}),
+        }
+        if self.user_wide_rows:
+            specs['ratings_by_user'] = TableSpec.from_config(
+                self.config, 'ratings_by_user',
+                database.get('ratings_by_user_table', 'ratings_by_user'), {'data': {}})
+        return specs
+    
+    def _split_keys(self, logical_name: str, spec: TableSpec) -> List[bytes]:
+        """对输入 CSV 抽样生成预分区切分点"""
+        if spec.regions <= 1:
+            return []
+        csv_dir = Path(self.config['data']['csv_dir'])
+        sample_size = int((self.config.get('tables') or {}).get('sample_size', 100000))
+        
+        if logical_name == 'movies':
+            path = csv_dir / self.config['data']['movies_file']
+            if not path.exists():
+                return []
+            keys = [self.keys.movie_key(movie_id) for movie_id, in sample_csv_columns(path, ['movieId'], sample_size)]
+        else:
+            path = csv_dir / self.config['data']['ratings_file']
+            if not path.exists():
+                return []
+            rows = sample_csv_columns(path, ['userId', 'movieId', 'timestamp'], sample_size)
+            if logical_name == 'ratings':
+                keys = [self.keys.rating_key(user_id, movie_id) for user_id, movie_id, _ in rows]
+            elif logical_name == 'ratings_by_user':
+                keys = [self.keys.user_key(user_id) for user_id, _, _ in rows]
+            else:
+                keys = [self.keys.by_movie_key(movie_id, ts, user_id) for user_id, movie_id, ts in rows]
+        
+        points = split_points(keys, spec.regions)
+        print(f"   抽样 {len(keys):,} 个行键，生成 {len(points)} 个切分点")
+        return points
+    
+    def _create_table(self, logical_name: str, spec: TableSpec):
+        """按表定义建表（含预分区）"""
+        use_shell = (self.config.get('tables') or {}).get('use_shell', True)
+        create_table(self.connection, spec, self._split_keys(logical_name, spec), use_shell=use_shell)
+    
+    def _recreate_table(self, logical_name: str, spec: TableSpec):
+        """删除（如存在）并重新创建表"""
+        table_name = spec.name
+        if table_name.encode() in self.connection.tables():
+            print(f"   表已存在，准备删除...")
+            try:
+                # 先禁用
+                print(f"   正在禁用表...")
+                self.connection.disable_table(table_name)
+                print(f"   正在删除表...")
+                self.connection.delete_table(table_name)
+                print(f"   ✓ 删除成功")
+            except Exception as e:
+                print(f"   [警告] 删除表时出错: {e}")
+                print(f"   尝试强制重建...")
+        
+        print(f"   正在创建表...")
+        self._create_table(logical_name, spec)
+        print(f"   ✓ 创建成功: {table_name}")
+    
     def create_tables(self):
         """创建HBase表"""
         print("\n[创建] HBase 表...")
@@ -133,57 +479,28 @@ class HBaseImporter:
             existing_tables = [t.decode('utf-8') for t in self.connection.tables()]
             print(f"   当前表列表: {existing_tables if existing_tables else '(空)'}")
             
-            # 创建 movies 表
-            movies_table_name = self.config['database']['movies_table']
-            print(f"\n[步骤2] 处理 {movies_table_name} 表...")
-            
-            if movies_table_name.encode() in self.connection.tables():
-                print(f"   表已存在，准备删除...")
-                try:
-                    # 先禁用
-                    print(f"   正在禁用表...")
-                    self.connection.disable_table(movies_table_name)
-                    print(f"   正在删除表...")
-                    self.connection.delete_table(movies_table_name)
-                    print(f"   ✓ 删除成功")
-                except Exception as e:
-                    print(f"   [警告] 删除表时出错: {e}")
-                    print(f"   尝试强制重建...")
+            specs = self._table_specs()
             
-            print(f"   正在创建表...")
-            self.connection.create_table(
-                movies_table_name,
-                {'info': dict()}
-            )
-            print(f"   ✓ 创建成功: {movies_table_name}")
+            # 创建 movies 表
+            print(f"\n[步骤2] 处理 {specs['movies'].name} 表...")
+            self._recreate_table('movies', specs['movies'])
             
             # 创建 ratings 表
-            ratings_table_name = self.config['database']['ratings_table']
-            print(f"\n[步骤3] 处理 {ratings_table_name} 表...")
+            print(f"\n[步骤3] 处理 {specs['ratings'].name} 表...")
+            self._recreate_table('ratings', specs['ratings'])
             
-            if ratings_table_name.encode() in self.connection.tables():
-                print(f"   表已存在，准备删除...")
-                try:
-                    print(f"   正在禁用表...")
-                    self.connection.disable_table(ratings_table_name)
-                    print(f"   正在删除表...")
-                    self.connection.delete_table(ratings_table_name)
-                    print(f"   ✓ 删除成功")
-                except Exception as e:
-                    print(f"   [警告] 删除表时出错: {e}")
-                    print(f"   尝试强制重建...")
+            # 创建 ratings_by_movie 索引表（按电影检索评分）
+            print(f"\n[步骤4] 处理 {specs['ratings_by_movie'].name} 表...")
+            self._recreate_table('ratings_by_movie', specs['ratings_by_movie'])
             
-            print(f"   正在创建表...")
-            self.connection.create_table(
-                ratings_table_name,
-                {'data': dict()}
-            )
-            print(f"   ✓ 创建成功: {ratings_table_name}")
+            # 创建 ratings_by_user 宽行表（每用户一行）
+            if 'ratings_by_user' in specs:
+                print(f"\n[步骤4b] 处理 {specs['ratings_by_user'].name} 表...")
+                self._recreate_table('ratings_by_user', specs['ratings_by_user'])
             
             # 获取表对象
-            print(f"\n[步骤4] 获取表对象...")
-            self.movies_table = self.connection.table(movies_table_name)
-            self.ratings_table = self.connection.table(ratings_table_name)
+            print(f"\n[步骤5] 获取表对象...")
+            self.open_tables()
             print(f"   ✓ 表对象获取成功")
             
             print(f"\n[成功] 所有表创建完成！")
@@ -194,24 +511,52 @@ class HBaseImporter:
             traceback.print_exc()
             raise
     
-    def import_movies(self, csv_path: str):
-        """导入电影数据"""
+    def open_tables(self, create_missing: bool = False):
+        """获取各表的表对象
+        
+        Args:
+            create_missing: 表不存在时创建（续传时使用，已有的表保持不变）
+        """
+        specs = self._table_specs()
+        movies_table_name = specs['movies'].name
+        ratings_table_name = specs['ratings'].name
+        by_movie_table_name = specs['ratings_by_movie'].name
+        
+        if create_missing:
+            existing = set(self.connection.tables())
+            for logical_name, spec in specs.items():
+                if spec.name.encode() not in existing:
+                    print(f"   表不存在，创建: {spec.name}")
+                    self._create_table(logical_name, spec)
+        
+        self.movies_table = self.connection.table(movies_table_name)
+        self.ratings_table = self.connection.table(ratings_table_name)
+        self.ratings_by_movie_table = self.connection.table(by_movie_table_name)
+        self.ratings_table_name = ratings_table_name
+        self.ratings_by_movie_table_name = by_movie_table_name
+        if 'ratings_by_user' in specs:
+            self.ratings_by_user_table_name = specs['ratings_by_user'].name
+            self.ratings_by_user_table = self.connection.table(self.ratings_by_user_table_name)
+    
+    def import_movies(self, csv_path: str, rating_stats: Dict[str, Dict]):
+        """导入电影数据
+        
+        Args:
+            csv_path: movies.csv 路径
+            rating_stats: import_ratings 在导入评分时同步算出的每部电影评分统计
+        """
         print(f"\n[导入] 电影数据: {csv_path}")
         
         if not Path(csv_path).exists():
             print(f"[错误] 文件不存在: {csv_path}")
             return False
         
-        # 先统计总行数用于进度显示
+        # 先统计总行数用于进度显示（movies.csv 很小）
         print("[准备] 统计数据量...")
         total_movies = sum(1 for _ in open(csv_path, 'r', encoding='utf-8')) - 1  # 减去header
         
-        # 计算评分统计
-        print("[步骤1] 计算评分统计...")
-        rating_stats = self._calculate_rating_stats()
-        
         # 导入电影数据
-        print(f"[步骤2] 导入电影信息 (总计 {total_movies:,} 部)...")
+        print(f"[导入] 电影信息 (总计 {total_movies:,} 部，{len(rating_stats):,} 部有评分)...")
         movies_count = 0
         start_time = time.time()
         
@@ -243,15 +588,20 @@ class HBaseImporter:
                         stats = rating_stats[movie_id]
                         avg_rating = stats['avg']
                         rating_count = stats['count']
+                        histogram = stats['hist']
                         data[b'info:avg_rating'] = f"{avg_rating:.2f}".encode('utf-8')
                         data[b'info:rating_count'] = str(rating_count).encode('utf-8')
                     else:
                         avg_rating = 0.0
                         rating_count = 0
+                        histogram = empty_histogram()
                         data[b'info:avg_rating'] = b'0.00'
                         data[b'info:rating_count'] = b'0'
                     
-                    batch.put(movie_id.encode('utf-8'), data)
+                    # 半星粒度的评分直方图
+                    data.update(histogram_cells(histogram))
+                    
+                    batch.put(self.keys.movie_key(movie_id), data)
                     movies_count += 1
                     pbar.update(1)
                     
@@ -261,7 +611,8 @@ class HBaseImporter:
                         'title': title,
                         'genres': genres,
                         'avg_rating': round(avg_rating, 2),
-                        'rating_count': rating_count
+                        'rating_count': rating_count,
+                        'rating_distribution': histogram_to_distribution(histogram)
                     })
                     
                     # 每5000条显示一次统计
@@ -281,131 +632,513 @@ class HBaseImporter:
         return True
     
     def _generate_movie_index(self, movie_list: List[Dict]):
-        """生成电影搜索索引 JSON 文件"""
+        """生成电影搜索索引文件（mmap 二进制格式）"""
         print(f"\n[索引] 生成搜索索引文件...")
         
         # 确保目录存在
         index_dir = Path("backend/data")
         index_dir.mkdir(parents=True, exist_ok=True)
         
-        index_path = index_dir / "movie_index.json"
-        
-        # 按 ID 排序（确保数字顺序）
-        movie_list.sort(key=lambda x: int(x['id']))
+        index_path = MOVIE_INDEX_PATH
         
-        # 写入 JSON 文件
-        with open(index_path, 'w', encoding='utf-8') as f:
-            json.dump(movie_list, f, ensure_ascii=False)
+        # 写入二进制索引（内部按 ID 数字顺序排列，并生成倒排索引）
+        write_movie_index(index_path, movie_list)
         
-        file_size_mb = index_path.stat().st_size / (1024 * 1024)
-        print(f"[成功] 索引文件已生成: {index_path}")
+        index_file = current_index_file(index_path)
+        file_size_mb = index_file.stat().st_size / (1024 * 1024)
+        print(f"[成功] 索引文件已生成: {index_file}")
         print(f"   电影数量: {len(movie_list):,}")
         print(f"   文件大小: {file_size_mb:.2f} MB")
     
-    def _calculate_rating_stats(self) -> Dict[str, Dict]:
-        """计算每个电影的评分统计"""
-        ratings_path = Path(self.config['data']['csv_dir']) / self.config['data']['ratings_file']
+    def _resolve_engine(self) -> str:
+        """确定评分解析引擎
+        
+        显式配置 arrow 而 pyarrow/numpy 不可用时报错；auto 不可用时回退到逐行解析并给出原因
+        """
+        if self.engine == 'arrow' and not ARROW_AVAILABLE:
+            raise RuntimeError(f"import.engine 配置为 arrow，但无法导入 pyarrow/numpy: {ARROW_IMPORT_ERROR}"
+                               f"（pip install -r requirements.txt）")
+        if self.engine == 'auto':
+            if ARROW_AVAILABLE:
+                print("[策略] import.engine=auto：已安装 pyarrow，使用 arrow 向量化解析")
+                return 'arrow'
+            print(f"[警告] import.engine=auto：无法导入 pyarrow/numpy（{ARROW_IMPORT_ERROR}），改用逐行解析")
+            return 'stream'
+        return self.engine
+    
+    def _stream_rating_chunks(self, f, stats: RatingStats):
+        """逐行解析评分文件，按 chunk_size 产出 (数据块, 字节数)"""
+        header = f.readline().decode('utf-8').strip().split(',')
+        user_col = header.index('userId')
+        movie_col = header.index('movieId')
+        rating_col = header.index('rating')
+        ts_col = header.index('timestamp')
+        
+        row_keys, ratings, timestamps, index_keys = [], [], [], []
+        chunk_bytes = 0
+        for line in f:
+            chunk_bytes += len(line)
+            fields = line.decode('utf-8').rstrip('\r\n').split(',')
+            if len(fields) < len(header):
+                continue
+            user_id = fields[user_col]
+            movie_id = fields[movie_col]
+            rating_text = fields[rating_col]
+            timestamp = fields[ts_col]
+            
+            # 行键：[盐_]userId_movieId；索引表行键：movieId_倒序时间戳_userId
+            row_keys.append(self.keys.rating_key(user_id, movie_id))
+            ratings.append(rating_text.encode('utf-8'))
+            timestamps.append(timestamp.encode('utf-8'))
+            index_keys.append(self.keys.by_movie_key(movie_id, timestamp, user_id))
+            
+            # 同一遍中累计电影评分统计
+            stats.add(movie_id, float(rating_text))
+            
+            if len(row_keys) >= self.chunk_size:
+                yield (row_keys, ratings, timestamps, index_keys), chunk_bytes
+                row_keys, ratings, timestamps, index_keys = [], [], [], []
+                chunk_bytes = 0
+        
+        if row_keys:
+            yield (row_keys, ratings, timestamps, index_keys), chunk_bytes
+    
+    def _arrow_rating_chunks(self, f, stats: 'ArrayRatingStats'):
+        """用 pyarrow 的 CSV 读取器按块解析评分文件，整块编码行键并累计统计
+        
+        四列都按原始文本读入，行键整列拼接：string 编码用 Arrow 计算函数，
+        binary 编码用 numpy 按大端定宽拼接。格式与 schema.RowKeyCodec 一致
+        （首个数据块会与逐行编码的结果比对一次）。
+        """
+        text_columns = ['userId', 'movieId', 'rating', 'timestamp']
+        reader = pa_csv.open_csv(
+            f,
+            read_options=pa_csv.ReadOptions(block_size=1 << 22),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=text_columns,
+                column_types={name: pa.binary() for name in text_columns},
+            ),
+        )
+        position = 0
+        checked = False
+        for record_batch in reader:
+            for start in range(0, record_batch.num_rows, self.chunk_size):
+                batch = record_batch.slice(start, self.chunk_size)
+                users = batch.column('userId')
+                movies = batch.column('movieId')
+                ratings = batch.column('rating')
+                timestamps = batch.column('timestamp')
+                
+                movie_ids = pc.cast(movies, pa.int64()).to_numpy()
+                rating_values = pc.cast(ratings, pa.float64()).to_numpy()
+                if self.keys.binary:
+                    row_keys, index_keys = self._binary_key_columns(users, movie_ids, timestamps)
+                else:
+                    row_keys, index_keys = self._string_key_columns(users, movies, timestamps)
+                
+                if not checked:
+                    user_id, movie_id, timestamp = (
+                        users[0].as_py().decode(), movies[0].as_py().decode(), timestamps[0].as_py().decode()
+                    )
+                    # 向量化生成的行键必须与 RowKeyCodec 一致，否则 API 读不到
+                    for name, built, expected in (
+                        ('ratings', row_keys[0], self.keys.rating_key(user_id, movie_id)),
+                        ('ratings_by_movie', index_keys[0], self.keys.by_movie_key(movie_id, timestamp, user_id)),
+                    ):
+                        if built != expected:
+                            raise RuntimeError(f"arrow 生成的 {name} 行键 {built!r} 与 RowKeyCodec 的 {expected!r} 不一致")
+                    checked = True
+                
+                stats.add(movie_ids, rating_values)
+                
+                # 读取器按块预读，文件位置只是近似的已处理字节数
+                chunk_bytes = f.tell() - position
+                position += chunk_bytes
+                yield (row_keys, ratings.to_pylist(), timestamps.to_pylist(), index_keys), chunk_bytes
+    
+    def _salt_column(self, users):
+        """每行的盐桶号：按块内去重后的用户计算，再按下标展开到每一行"""
+        unique_users = pc.unique(users)
+        salts = pa.array([
+            rating_salt(user.decode('utf-8'), self.salt_buckets) for user in unique_users.to_pylist()
+        ], pa.int64())
+        return pc.take(salts, pc.index_in(users, value_set=unique_users))
+    
+    def _string_key_columns(self, users, movies, timestamps):
+        """整列拼接十进制文本行键，返回 (ratings 行键, 索引表行键)"""
+        reversed_ts = pc.ascii_lpad(
+            pa.array(MAX_TIMESTAMP - pc.cast(timestamps, pa.int64()).to_numpy()).cast(pa.string()),
+            10, '0'
+        ).cast(pa.binary())
+        
+        row_keys = pc.binary_join_element_wise(users, movies, b'_')
+        if self.salt_buckets:
+            prefixes = pa.array([
+                rating_salt_prefix(salt, self.salt_buckets) for salt in range(self.salt_buckets)
+            ], pa.binary())
+            row_keys = pc.binary_join_element_wise(
+                pc.take(prefixes, self._salt_column(users)), row_keys, b''
+            )
+        index_keys = pc.binary_join_element_wise(movies, reversed_ts, users, b'_')
+        return row_keys.to_pylist(), index_keys.to_pylist()
+    
+    def _binary_key_columns(self, users, movie_ids, timestamps):
+        """用 numpy 整列拼接大端定宽行键，返回 (ratings 行键, 索引表行键)"""
+        user_ids = pc.cast(users, pa.int64()).to_numpy()
+        ts = pc.cast(timestamps, pa.int64()).to_numpy()
+        for values in (user_ids, movie_ids, ts):
+            if len(values) and (values.min() < 0 or values.max() > BINARY_KEY_MAX):
+                raise ValueError("评分文件中有超出二进制行键范围的 ID 或时间戳")
+        
+        def u32(values):
+            return values.astype('>u4').view(np.uint8).reshape(-1, 4)
+        
+        row_parts = [u32(user_ids), u32(movie_ids)]
+        if self.salt_buckets:
+            salts = self._salt_column(users).to_numpy().astype(np.uint8)
+            row_parts.insert(0, salts.reshape(-1, 1))
+        row_keys = fixed_width_rows(np.hstack(row_parts))
+        index_keys = fixed_width_rows(np.hstack([u32(movie_ids), u32(BINARY_KEY_MAX - ts), u32(user_ids)]))
+        return row_keys, index_keys
+    
+    def import_ratings(self, csv_path: str, checkpoint: Optional[ImportCheckpoint] = None) -> Dict[str, Dict]:
+        """单遍流式导入评分数据，同时累计每部电影的评分统计
+        
+        ratings.csv 只读一遍。主线程解析并累加电影的评分总和、数量和直方图，
+        把编码好的行按 chunk_size 分块放入有界队列；writer_workers 个写入线程
+        各用自己的连接和 batch 写入 ratings 表和 ratings_by_movie 索引表。
+        队列满时解析线程阻塞，内存占用有上限。
+        
+        解析引擎为 arrow 时按块向量化解析、编码行键并用 bincount 聚合统计，
+        否则逐行解析。进度按已写入的字节数显示，不需要预先统计行数。
+        
+        每写完一个数据块都会推进断点水位线。从断点续传时，水位线之前的评分
+        只解析、累计统计（电影统计需要完整数据），不再写入 HBase。
+        
+        Args:
+            csv_path: ratings.csv 路径
+            checkpoint: 断点，为 None 时不记录断点
+            
+        Returns:
+            Dict[str, Dict]: {movie_id: {'avg', 'count', 'hist'}}，文件不存在返回空字典
+        """
+        print(f"\n[导入] 评分数据: {csv_path}")
         
-        if not ratings_path.exists():
-            print(f"[警告] 评分文件不存在，跳过统计: {ratings_path}")
+        if not Path(csv_path).exists():
+            print(f"[错误] 文件不存在: {csv_path}")
             return {}
         
-        # 统计总行数
-        total_ratings = sum(1 for _ in open(ratings_path, 'r', encoding='utf-8')) - 1
-        print(f"   总评分数: {total_ratings:,} 条")
+        file_size = Path(csv_path).stat().st_size
+        engine = self._resolve_engine()
+        print(f"   文件大小: {file_size / (1024 * 1024):,.1f} MB")
+        print(f"[策略] {engine} 解析，{self.writer_workers} 个写入线程，"
+              f"每块 {self.chunk_size:,} 条，队列上限 {self.queue_size} 块")
+        if self.salt_buckets:
+            print(f"[策略] ratings 行键加盐，{self.salt_buckets} 个盐桶")
+        if self.keys.binary:
+            print("[策略] 行键使用二进制定宽编码")
+        if self.ratings_by_user_table_name:
+            print(f"[策略] 同时写入宽行表 {self.ratings_by_user_table_name}（每用户一行）")
         
-        stats = defaultdict(lambda: {'sum': 0.0, 'count': 0})
+        stats = ArrayRatingStats() if engine == 'arrow' else RatingStats()
+        ratings_count = 0
         start_time = time.time()
         
-        with open(ratings_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            
-            with tqdm(total=total_ratings, desc="统计评分", unit="条",
+        # 续传：水位线之前的评分已写入，只需要重新累计统计
+        skip_rows = checkpoint.rows if checkpoint is not None else 0
+        if skip_rows:
+            print(f"[续传] 跳过已写入的 {skip_rows:,} 条评分（约 {checkpoint.bytes / (1024 * 1024):,.1f} MB），仅重算统计")
+        
+        chunks: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        failed = threading.Event()
+        progress_lock = threading.Lock()
+        written = {'rows': 0}
+        # 数据块序号 -> (结束行号, 结束字节偏移)，用于推进连续完成的水位线
+        chunk_ends: Dict[int, tuple] = {}
+        completed = set()
+        watermark = {'next_seq': 0}
+        
+        # 二进制方式读取，按字节偏移驱动进度条
+        with open(csv_path, 'rb') as f:
+            with tqdm(total=file_size, desc="导入评分", unit="B",
+                     unit_scale=True, unit_divisor=1024,
                      bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]') as pbar:
                 
-                processed = 0
-                for row in reader:
-                    movie_id = row['movieId']
-                    rating = float(row['rating'])
-                    stats[movie_id]['sum'] += rating
-                    stats[movie_id]['count'] += 1
-                    processed += 1
-                    pbar.update(1)
-                    
-                    # 显示速度
-                    if processed % 50000 == 0:
+                def on_written(seq: int, rows: int, size_bytes: int):
+                    with progress_lock:
+                        written['rows'] += rows
+                        pbar.update(size_bytes)
+                        if checkpoint is not None:
+                            completed.add(seq)
+                            advanced = False
+                            while watermark['next_seq'] in completed:
+                                completed.discard(watermark['next_seq'])
+                                checkpoint.rows, checkpoint.bytes = chunk_ends.pop(watermark['next_seq'])
+                                watermark['next_seq'] += 1
+                                advanced = True
+                            if advanced:
+                                checkpoint.save(force=False)
                         elapsed = time.time() - start_time
-                        speed = processed / elapsed
-                        pbar.set_postfix({'速度': f'{speed:.0f}条/s'})
+                        pbar.set_postfix({
+                            '速度': f"{written['rows'] / elapsed:.0f}条/s",
+                            '已完成': f"{written['rows']:,}",
+                            '队列': chunks.qsize()
+                        })
+                
+                writers = [
+                    RatingWriter(i, self, chunks, on_written, failed, self.max_retries)
+                    for i in range(self.writer_workers)
+                ]
+                for writer in writers:
+                    writer.start()
+                
+                def enqueue(item) -> bool:
+                    """放入队列；有写入线程失败时放弃并返回 False"""
+                    while not failed.is_set():
+                        try:
+                            chunks.put(item, timeout=1)
+                            return True
+                        except queue.Full:
+                            continue
+                    return False
+                
+                try:
+                    if engine == 'arrow':
+                        source = self._arrow_rating_chunks(f, stats)
+                    else:
+                        source = self._stream_rating_chunks(f, stats)
+                    seq = 0
+                    bytes_read = 0
+                    for chunk, chunk_bytes in source:
+                        chunk_start = ratings_count
+                        ratings_count += len(chunk[0])
+                        bytes_read += chunk_bytes
+                        if ratings_count <= skip_rows:
+                            pbar.update(chunk_bytes)
+                            continue
+                        if chunk_start < skip_rows:
+                            # 数据块跨过水位线：只写入水位线之后的部分
+                            chunk = tuple(column[skip_rows - chunk_start:] for column in chunk)
+                        with progress_lock:
+                            chunk_ends[seq] = (ratings_count, bytes_read)
+                        if not enqueue((seq, chunk, chunk_bytes)):
+                            break
+                        seq += 1
+                finally:
+                    # 通知写入线程结束并等待队列中剩余的数据块写完
+                    for _ in writers:
+                        while True:
+                            try:
+                                chunks.put(None, timeout=1)
+                                break
+                            except queue.Full:
+                                if not any(w.is_alive() for w in writers):
+                                    break
+                    for writer in writers:
+                        writer.join()
+                    # 写入线程都已结束，水位线不再变化；解析出错时也要保存最后推进的水位
+                    if checkpoint is not None:
+                        checkpoint.save()
+                pbar.update(file_size - pbar.n)
         
-        # 计算平均值
-        result = {}
-        for movie_id, data in stats.items():
-            result[movie_id] = {
-                'avg': data['sum'] / data['count'],
-                'count': data['count']
-            }
+        print("[统计] 写入线程:")
+        for writer in writers:
+            print(f"   {writer.summary()}")
+        
+        errors = [w.error for w in writers if w.error is not None]
+        if errors:
+            raise RuntimeError(f"评分写入失败: {errors[0]}（已写入 {checkpoint.rows if checkpoint else 0:,} 条，可使用 --resume 续传）") from errors[0]
         
         elapsed = time.time() - start_time
-        print(f"   统计完成: {len(result):,} 部电影，耗时 {elapsed:.1f}秒")
+        print(f"[成功] 导入评分完成: {ratings_count:,} 条，耗时 {elapsed:.1f}秒，平均 {ratings_count/elapsed:.0f}条/秒")
+        
+        result = stats.result()
+        print(f"   评分统计: {len(result):,} 部电影")
         return result
     
-    def import_ratings(self, csv_path: str):
-        """导入评分数据 - 使用多线程优化"""
-        print(f"\n[导入] 评分数据: {csv_path}")
+    def import_delta(self, csv_path: str) -> bool:
+        """增量导入评分（upsert），不重建表
+        
+        delta 文件与 ratings.csv 格式相同。同一 (userId, movieId) 在文件中出现
+        多次时以最后一次为准。已存在的评分会被覆盖：先批量读出旧评分，从电影
+        直方图中减去旧档位，并删除索引表中按旧时间戳生成的行。
+        电影聚合只更新涉及的电影：在原有直方图上合并增量，评分总和由直方图
+        精确还原。耗时与增量大小成正比，与全量数据无关。
+        启用宽行时同时覆盖 ratings_by_user 表中对应的列。
+        """
+        print(f"\n[增量] 评分数据: {csv_path}")
         
         if not Path(csv_path).exists():
             print(f"[错误] 文件不存在: {csv_path}")
             return False
         
-        # 统计总行数
-        print("[准备] 统计数据量...")
-        total_ratings = sum(1 for _ in open(csv_path, 'r', encoding='utf-8')) - 1
-        print(f"   总评分数: {total_ratings:,} 条")
-        
-        ratings_count = 0
         start_time = time.time()
         
-        # 分块大小：10万条一批，可根据内存调整
-        chunk_size = 100000
-        max_workers = 4  # 并发线程数
+        # 行键 -> (userId, movieId, rating, timestamp)，后出现的覆盖先出现的
+        latest: Dict[bytes, tuple] = {}
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                latest[self.keys.rating_key(row['userId'], row['movieId'])] = (
+                    row['userId'], row['movieId'], row['rating'], row['timestamp']
+                )
+        print(f"   增量评分: {len(latest):,} 条")
         
-        # 读取所有数据并分块
-        print(f"[策略] 使用 {max_workers} 线程并发导入，每批 {chunk_size:,} 条...")
+        # 每部电影直方图的增量（可以为负）
+        hist_deltas: Dict[str, List[int]] = defaultdict(empty_histogram)
+        replaced = 0
+        keys = list(latest)
         
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            
-            with tqdm(total=total_ratings, desc="导入评分", unit="条",
-                     bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]') as pbar:
+        user_batch = self.ratings_by_user_table.batch(batch_size=10000) if self.ratings_by_user_table else None
+        with self.ratings_table.batch(batch_size=10000) as batch, \
+                self.ratings_by_movie_table.batch(batch_size=10000) as index_batch:
+            for i in tqdm(range(0, len(keys), DELTA_GET_BATCH), desc="写入评分", unit="批"):
+                part = keys[i:i + DELTA_GET_BATCH]
+                existing = dict(self.ratings_table.rows(part, columns=[b'data:rating', b'data:timestamp']))
                 
-                # 使用更大的batch提升性能
-                batch = self.ratings_table.batch(batch_size=10000)
+                for key in part:
+                    user_id, movie_id, rating_text, timestamp = latest[key]
+                    index_key = self.keys.by_movie_key(movie_id, timestamp, user_id)
+                    
+                    old = existing.get(key)
+                    if old and b'data:rating' in old:
+                        # 覆盖旧评分：撤销其统计贡献，删除旧的索引行
+                        hist_deltas[movie_id][rating_bucket(float(old[b'data:rating']))] -= 1
+                        old_timestamp = old.get(b'data:timestamp', b'').decode('utf-8')
+                        if old_timestamp:
+                            old_index_key = self.keys.by_movie_key(movie_id, old_timestamp, user_id)
+                            if old_index_key != index_key:
+                                index_batch.delete(old_index_key)
+                        replaced += 1
+                    
+                    hist_deltas[movie_id][rating_bucket(float(rating_text))] += 1
+                    rating = rating_text.encode('utf-8')
+                    batch.put(key, {b'data:rating': rating, b'data:timestamp': timestamp.encode('utf-8')})
+                    index_batch.put(index_key, {b'data:rating': rating})
+                    if user_batch is not None:
+                        user_key, qualifier = self.keys.split_rating_key(key)
+                        user_batch.put(user_key, {b'data:' + qualifier: pack_user_rating(rating_text, timestamp)})
+            if user_batch is not None:
+                user_batch.send()
+        
+        print(f"   新增 {len(keys) - replaced:,} 条，覆盖 {replaced:,} 条，涉及 {len(hist_deltas):,} 部电影")
+        
+        updated = self._merge_movie_aggregates(hist_deltas)
+        self._update_movie_index(updated)
+        self._merge_batch_state(hist_deltas, csv_path)
+        
+        elapsed = time.time() - start_time
+        print(f"[成功] 增量导入完成，耗时 {elapsed:.1f}秒")
+        return True
+    
+    def _merge_movie_aggregates(self, hist_deltas: Dict[str, List[int]]) -> Dict[str, Dict]:
+        """把直方图增量合并到 movies 表中已有的电影聚合
+        
+        movies 表中没有的电影（不在 movies.csv 中）跳过。
+        
+        Returns:
+            Dict[str, Dict]: {movie_id: {'title', 'genres', 'avg', 'count', 'hist'}}
+        """
+        columns = [b'info:title', b'info:genres', b'info:avg_rating', b'info:rating_count'] + HISTOGRAM_COLUMNS
+        movie_ids = list(hist_deltas)
+        updated = {}
+        legacy = 0
+        unknown = 0
+        
+        with self.movies_table.batch(batch_size=5000) as batch:
+            for i in range(0, len(movie_ids), DELTA_GET_BATCH):
+                part = movie_ids[i:i + DELTA_GET_BATCH]
+                rows = dict(self.movies_table.rows([self.keys.movie_key(m) for m in part], columns=columns))
                 
-                for row in reader:
-                    # 行键：userId_movieId
-                    row_key = f"{row['userId']}_{row['movieId']}".encode('utf-8')
+                for movie_id in part:
+                    row = rows.get(self.keys.movie_key(movie_id), {})
+                    if not row.get(b'info:title'):
+                        # movies 表中没有这部电影，不写入只有统计的孤立行
+                        unknown += 1
+                        continue
+                    delta = hist_deltas[movie_id]
+                    old_hist = histogram_from_row(row)
+                    old_count = int(row.get(b'info:rating_count', b'0') or b'0')
+                    
+                    if old_count and sum(old_hist) != old_count:
+                        # 没有直方图列的旧数据：按平均分和数量合并，直方图只保证非负
+                        legacy += 1
+                        old_avg = float(row.get(b'info:avg_rating', b'0') or b'0')
+                        hist = [max(a + b, 0) for a, b in zip(old_hist, delta)]
+                        count = max(old_count + sum(delta), 0)
+                        total = old_avg * old_count + histogram_sum(delta)
+                    else:
+                        hist = [a + b for a, b in zip(old_hist, delta)]
+                        count = sum(hist)
+                        total = histogram_sum(hist)
+                    avg = total / count if count else 0.0
                     
                     data = {
-                        b'data:rating': row['rating'].encode('utf-8'),
-                        b'data:timestamp': row['timestamp'].encode('utf-8'),
+                        b'info:avg_rating': f"{avg:.2f}".encode('utf-8'),
+                        b'info:rating_count': str(count).encode('utf-8'),
                     }
+                    data.update(histogram_cells(hist))
+                    batch.put(self.keys.movie_key(movie_id), data)
                     
-                    batch.put(row_key, data)
-                    ratings_count += 1
-                    pbar.update(1)
-                    
-                    # 显示实时速度
-                    if ratings_count % 50000 == 0:
-                        elapsed = time.time() - start_time
-                        speed = ratings_count / elapsed
-                        pbar.set_postfix({'速度': f'{speed:.0f}条/s', '已完成': f'{ratings_count:,}'})
-                
-                batch.send()
+                    updated[movie_id] = {
+                        'title': row.get(b'info:title', b'').decode('utf-8'),
+                        'genres': row.get(b'info:genres', b'').decode('utf-8'),
+                        'avg': avg,
+                        'count': count,
+                        'hist': hist,
+                    }
         
-        elapsed = time.time() - start_time
-        print(f"[成功] 导入评分完成: {ratings_count:,} 条，耗时 {elapsed:.1f}秒，平均 {ratings_count/elapsed:.0f}条/秒")
-        return True
+        if unknown:
+            print(f"   [警告] {unknown:,} 部电影不在 movies 表中，跳过其评分统计")
+        if legacy:
+            print(f"   [警告] {legacy:,} 部电影缺少直方图列，已按平均分合并（建议重新运行批处理）")
+        print(f"   ✓ 已更新 {len(updated):,} 部电影的评分统计")
+        return updated
+    
+    def _merge_batch_state(self, hist_deltas: Dict[str, List[int]], csv_path: str):
+        """把直方图增量合并到批处理任务的累计统计（水位不变）
+        
+        delta 评分不在 ratings.csv 中，不合并的话下次增量批处理会用只来自
+        ratings.csv 的统计覆盖这些电影。未提交的 aggregate 阶段结果同样合并。
+        合并过的 delta 文件记录在元数据 deltas 中，批处理全量重算时会提示它们将被丢弃。
+        """
+        paths = [path for path in (self.batch_state_path, BATCH_AGGREGATE_PATH) if path.exists()]
+        if not paths:
+            return
+        try:
+            from backend.db.rating_stats import ArrayRatingStats
+        except ImportError:
+            print("   [警告] 未安装 numpy，无法更新批处理统计，下次批处理前请先合并 delta 到 ratings.csv 并使用 --full")
+            return
+        
+        for path in paths:
+            stats, meta = ArrayRatingStats.load(path)
+            stats.add_histograms(hist_deltas)
+            meta['deltas'] = meta.get('deltas', []) + [str(Path(csv_path).resolve())]
+            stats.save(path, meta)
+            print(f"   ✓ 批处理统计已合并: {path}")
+    
+    def _update_movie_index(self, updated: Dict[str, Dict]):
+        """只更新索引中涉及的电影，其余条目保持不变"""
+        if current_index_file(MOVIE_INDEX_PATH) is None:
+            print(f"   [警告] 索引文件不存在，跳过: {MOVIE_INDEX_PATH}")
+            return
+        
+        movies = {m['id']: m for m in read_movie_index(MOVIE_INDEX_PATH)}
+        added = 0
+        for movie_id, stats in updated.items():
+            movie = movies.get(movie_id)
+            if movie is None:
+                if not stats['title']:
+                    # movies 表中也没有这部电影，无法生成索引条目
+                    continue
+                movie = movies[movie_id] = {'id': movie_id, 'title': stats['title'], 'genres': stats['genres']}
+                added += 1
+            movie['avg_rating'] = round(stats['avg'], 2)
+            movie['rating_count'] = stats['count']
+            movie['rating_distribution'] = histogram_to_distribution(stats['hist'])
+        
+        write_movie_index(MOVIE_INDEX_PATH, movies.values())
+        print(f"   ✓ 索引已更新: {len(updated):,} 部电影（新增 {added:,} 部）")
     
     def verify_import(self):
         """验证导入结果"""
@@ -420,7 +1153,7 @@ class HBaseImporter:
         # 显示示例
         print("\n[示例] 电影表数据:")
         for key, data in list(self.movies_table.scan(limit=3)):
-            movie_id = key.decode('utf-8')
+            movie_id = self.keys.parse_movie_key(key)
             title = data.get(b'info:title', b'').decode('utf-8')
             genres = data.get(b'info:genres', b'').decode('utf-8')
             avg_rating = data.get(b'info:avg_rating', b'0').decode('utf-8')
@@ -439,10 +1172,10 @@ class HBaseImporter:
         
         print("\n[示例] 评分表数据:")
         for key, data in list(self.ratings_table.scan(limit=3)):
-            user_movie = key.decode('utf-8')
+            user_id, movie_id = self.keys.parse_rating_key(key)
             rating = data.get(b'data:rating', b'').decode('utf-8')
             timestamp = data.get(b'data:timestamp', b'').decode('utf-8')
-            print(f"  {user_movie}: {rating} (时间戳: {timestamp})")
+            print(f"  {user_id}_{movie_id}: {rating} (时间戳: {timestamp})")
     
     def close(self):
         """关闭连接"""
@@ -450,23 +1183,44 @@ class HBaseImporter:
             self.connection.close()
             print("\n[成功] HBase 连接已关闭")
     
-    def run(self):
-        """执行完整导入流程"""
+    def run(self, resume: bool = False):
+        """执行完整导入流程
+        
+        Args:
+            resume: 从断点续传：不重建表，跳过断点之前已写入的评分
+        """
         try:
             # 连接
             if not self.connect():
                 return False
             
-            # 创建表
-            self.create_tables()
-            
-            # 导入数据
             csv_dir = Path(self.config['data']['csv_dir'])
             movies_csv = csv_dir / self.config['data']['movies_file']
             ratings_csv = csv_dir / self.config['data']['ratings_file']
             
-            self.import_movies(str(movies_csv))
-            self.import_ratings(str(ratings_csv))
+            checkpoint = None
+            if ratings_csv.exists():
+                checkpoint = ImportCheckpoint(self.checkpoint_path, ratings_csv)
+            
+            if resume:
+                if checkpoint is not None and checkpoint.load():
+                    print(f"\n[续传] 断点: 已写入 {checkpoint.rows:,} 条评分"
+                          f"{'（评分已全部写入）' if checkpoint.ratings_done else ''}")
+                else:
+                    print("\n[续传] 没有断点记录，在现有表上从头写入")
+                self.open_tables(create_missing=True)
+            else:
+                # 创建表
+                self.create_tables()
+            
+            # 评分只读一遍，导入的同时算出电影统计，再写入带统计的电影行
+            rating_stats = self.import_ratings(str(ratings_csv), checkpoint)
+            if checkpoint is not None:
+                checkpoint.ratings_done = True
+                checkpoint.save()
+            self.import_movies(str(movies_csv), rating_stats)
+            if checkpoint is not None:
+                checkpoint.remove()
             
             # 验证
             self.verify_import()
@@ -483,6 +1237,23 @@ class HBaseImporter:
             self.close()
 
 
+def run_delta(csv_path: str) -> bool:
+    """增量导入入口：连接、打开已有的表并 upsert 评分"""
+    importer = HBaseImporter()
+    try:
+        if not importer.connect():
+            return False
+        importer.open_tables()
+        return importer.import_delta(csv_path)
+    except Exception as e:
+        print(f"\n[错误] 增量导入出错: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        importer.close()
+
+
 def check_hbase_service():
     """快速检查 HBase 服务状态"""
     print("\n" + "=" * 60)
@@ -533,8 +1304,17 @@ def main():
         check_hbase_service()
         sys.exit(0)
     
+    # --delta <文件>：增量导入评分，不重建表
+    if '--delta' in sys.argv[1:]:
+        position = sys.argv.index('--delta')
+        if position + 1 >= len(sys.argv):
+            print("用法: python import_data.py --delta <ratings_delta.csv>")
+            sys.exit(2)
+        sys.exit(0 if run_delta(sys.argv[position + 1]) else 1)
+    
+    # --resume：从上次中断的断点继续导入，不重建表
     importer = HBaseImporter()
-    success = importer.run()
+    success = importer.run(resume='--resume' in sys.argv[1:])
     
     sys.exit(0 if success else 1)
 
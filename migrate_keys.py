@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+行键编码迁移脚本
+把 movies / ratings / ratings_by_movie（以及 ratings_by_user 宽行表）的行键
+从一种编码重写为另一种
+
+用法:
+    python migrate_keys.py --to binary      # string -> binary
+    python migrate_keys.py --to string      # binary -> string
+
+源编码取 config.yaml 的 database.key_encoding（也可用 --from 指定）。每张表先按
+目标编码复制到临时表 <表名>__rekey，再按 tables 段的定义重建原表（切分点取复制
+时抽样的新行键）并复制回来，最后删除临时表。每张表完成的阶段记录在
+backend/data/migrate_keys_state.json，中途失败可以直接重新运行：临时表复制完整
+之后，重新运行只会从临时表继续重建和复制回原表，不会再删除临时表。
+
+迁移完成后把 database.key_encoding 改成目标编码，再重启 API 服务。
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import happybase
+import yaml
+
+from backend.db import filters
+from backend.db.schema import KEY_ENCODINGS, RowKeyCodec
+from backend.db.table_spec import DEFAULT_SAMPLE_SIZE, TableSpec, create_table, split_points
+
+# 临时表名后缀
+TEMP_SUFFIX = "__rekey"
+
+# 扫描时每次 RPC 取回的行数
+SCAN_BATCH = 1000
+
+# 各表迁移阶段的记录文件
+STATE_FILE = Path("backend/data/migrate_keys_state.json")
+
+# 迁移阶段：copied = 临时表已复制完整（原表可以删除重建），
+# copy_back = 原表已按目标编码重建，正在从临时表复制回来
+PHASE_COPIED = "copied"
+PHASE_COPY_BACK = "copy_back"
+
+
+class _Reservoir:
+    """行键的蓄水池抽样"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.keys = []
+        self.seen = 0
+        self._rng = random.Random(0)
+
+    def add(self, key: bytes):
+        if len(self.keys) < self.size:
+            self.keys.append(key)
+        else:
+            slot = self._rng.randrange(self.seen + 1)
+            if slot < self.size:
+                self.keys[slot] = key
+        self.seen += 1
+
+
+class KeyMigrator:
+    """按表重写行键"""
+
+    def __init__(self, source: str, target: str, config_path: str = "config.yaml"):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            self.config = yaml.safe_load(f)
+
+        database = self.config['database']
+        salt_buckets = int(database.get('ratings_salt_buckets', 0))
+        self.source = RowKeyCodec(source, salt_buckets)
+        self.target = RowKeyCodec(target, salt_buckets)
+        self.sample_size = int((self.config.get('tables') or {}).get('sample_size', DEFAULT_SAMPLE_SIZE))
+        self.use_shell = (self.config.get('tables') or {}).get('use_shell', True)
+        self.connection = None
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        """读取迁移阶段记录；编码方向不同的旧记录不可续用"""
+        if not STATE_FILE.exists():
+            return {'source': self.source.encoding, 'target': self.target.encoding, 'tables': {}}
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if (state['source'], state['target']) != (self.source.encoding, self.target.encoding) and state['tables']:
+            raise RuntimeError(f"{STATE_FILE} 记录的是 {state['source']} -> {state['target']} 的未完成迁移，"
+                               f"请用相同方向重新运行")
+        return state
+
+    def _set_phase(self, table_name: str, phase: str = None):
+        """记录（phase 为 None 时清除）某张表的迁移阶段"""
+        if phase is None:
+            self.state['tables'].pop(table_name, None)
+        else:
+            self.state['tables'][table_name] = phase
+        STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = STATE_FILE.with_name(STATE_FILE.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temp_path, STATE_FILE)
+
+    def connect(self):
+        """连接 HBase"""
+        print(f"连接 HBase: {self.config['hbase']['host']}:{self.config['hbase']['port']}")
+        self.connection = happybase.Connection(
+            host=self.config['hbase']['host'],
+            port=self.config['hbase']['port'],
+            timeout=60000,
+            transport='buffered',
+            protocol='binary'
+        )
+
+    def _tables(self) -> List[tuple]:
+        """(表定义, 行转换函数)，行转换函数把 (行键, 数据) 转为新的 (行键, 数据)"""
+        database = self.config['database']
+        source, target = self.source, self.target
+
+        def rekey(convert_key: Callable[[bytes], bytes]):
+            return lambda key, data: (convert_key(key), data)
+
+        def user_row(key: bytes, data: dict) -> tuple:
+            # 宽行表：行键是用户，列名是 movies 表行键，两者都要转换
+            user_id = source.parse_user_key(key)
+            columns = {
+                b'data:' + target.movie_key(source.parse_movie_key(column.split(b':', 1)[1])): value
+                for column, value in data.items()
+            }
+            return target.user_key(user_id), columns
+
+        return [
+            (TableSpec.from_config(self.config, 'movies', database['movies_table'], {'info': {}}),
+             rekey(lambda key: target.movie_key(source.parse_movie_key(key)))),
+            (TableSpec.from_config(self.config, 'ratings', database['ratings_table'], {'data': {}}),
+             rekey(lambda key: target.rating_key(*source.parse_rating_key(key)))),
+            (TableSpec.from_config(self.config, 'ratings_by_movie',
+                                   database.get('ratings_by_movie_table', 'ratings_by_movie'), {'data': {}}),
+             rekey(lambda key: target.by_movie_key(*source.parse_by_movie_key(key)))),
+            (TableSpec.from_config(self.config, 'ratings_by_user',
+                                   database.get('ratings_by_user_table', 'ratings_by_user'), {'data': {}}),
+             user_row),
+        ]
+
+    def _exists(self, table_name: str) -> bool:
+        return table_name.encode('utf-8') in self.connection.tables()
+
+    def _drop(self, table_name: str):
+        self.connection.disable_table(table_name)
+        self.connection.delete_table(table_name)
+
+    def _copy(self, source_name: str, target_name: str, convert: Callable = None) -> List[bytes]:
+        """逐行复制，convert 不为空时转换行；返回写入行键的随机抽样"""
+        sample = _Reservoir(self.sample_size)
+        source_table = self.connection.table(source_name)
+        with self.connection.table(target_name).batch(batch_size=10000) as batch:
+            for key, data in source_table.scan(batch_size=SCAN_BATCH):
+                new_key, data = convert(key, data) if convert else (key, data)
+                batch.put(new_key, data)
+                sample.add(new_key)
+                if sample.seen % 100000 == 0:
+                    print(f"   已复制 {sample.seen:,} 行...")
+        print(f"   ✓ {source_name} -> {target_name}: {sample.seen:,} 行")
+        return sample.keys
+
+    def _sample_keys(self, table_name: str) -> List[bytes]:
+        """对整张表的行键做蓄水池抽样（只传回行键）"""
+        sample = _Reservoir(self.sample_size)
+        for key, _ in self.connection.table(table_name).scan(
+                filter=filters.all_of(filters.first_key_only(), filters.key_only()), batch_size=SCAN_BATCH):
+            sample.add(key)
+        return sample.keys
+
+    def migrate_table(self, spec: TableSpec, convert: Callable):
+        """重写单张表的行键"""
+        table_name = spec.name
+        temp_name = table_name + TEMP_SUFFIX
+        phase = self.state['tables'].get(table_name)
+        print(f"\n[迁移] {table_name}")
+
+        sample = None
+        if phase is None:
+            if not self._exists(table_name):
+                print(f"   表不存在，跳过")
+                return
+            # 临时表没有复制完整（或是上次迁移残留），重新复制
+            if self._exists(temp_name):
+                self._drop(temp_name)
+            temp_spec = TableSpec(temp_name, spec.families)
+            create_table(self.connection, temp_spec, use_shell=False, log=print)
+            sample = self._copy(table_name, temp_name, convert)
+            self._set_phase(table_name, PHASE_COPIED)
+            phase = PHASE_COPIED
+        else:
+            print(f"   从上次中断处继续（阶段: {phase}），临时表 {temp_name} 已复制完整")
+
+        if phase == PHASE_COPIED:
+            # 此时原表可能是旧编码的原表，也可能是上次中断时刚建好的空表，都可以删除
+            if self._exists(table_name):
+                self._drop(table_name)
+            if sample is None:
+                sample = self._sample_keys(temp_name)
+            create_table(self.connection, spec, split_points(sample, spec.regions), use_shell=self.use_shell)
+            self._set_phase(table_name, PHASE_COPY_BACK)
+
+        # 原表已是目标编码，复制回来是幂等的，中断后重新复制即可
+        self._copy(temp_name, table_name)
+        self._drop(temp_name)
+        self._set_phase(table_name)
+
+    def run(self) -> bool:
+        """执行迁移"""
+        start_time = time.time()
+        print(f"行键编码: {self.source.encoding} -> {self.target.encoding}")
+        try:
+            self.connect()
+            for spec, convert in self._tables():
+                self.migrate_table(spec, convert)
+        except Exception as e:
+            print(f"\n[错误] 迁移失败: {e}")
+            print("修复问题后重新运行即可继续")
+            return False
+        finally:
+            if self.connection:
+                self.connection.close()
+
+        print(f"\n迁移完成，耗时 {time.time() - start_time:.1f} 秒")
+        print(f"请把 config.yaml 中的 database.key_encoding 改为 \"{self.target.encoding}\" 后重启 API 服务")
+        return True
+
+
+def _option(name: str, default: str = None) -> str:
+    """读取 --name <值> 形式的命令行参数"""
+    if name not in sys.argv[1:]:
+        return default
+    position = sys.argv.index(name)
+    return sys.argv[position + 1] if position + 1 < len(sys.argv) else None
+
+
+def main():
+    """主函数"""
+    with open("config.yaml", 'r', encoding='utf-8') as f:
+        configured = (yaml.safe_load(f).get('database') or {}).get('key_encoding', 'string')
+
+    source = _option('--from', configured)
+    target = _option('--to')
+    if source not in KEY_ENCODINGS or target not in KEY_ENCODINGS:
+        print("用法: python migrate_keys.py --to {string,binary} [--from {string,binary}]")
+        sys.exit(2)
+    if source == target:
+        print(f"源编码与目标编码相同（{source}），无需迁移")
+        sys.exit(0)
+
+    sys.exit(0 if KeyMigrator(source, target).run() else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,24 @@
 """
 Spark 批处理任务
 计算电影评分统计并更新 HBase
+
+用法:
+    python spark_batch.py                    # 增量：只累加评分文件新追加的行
+    python spark_batch.py --full             # 全量重算
+    python spark_batch.py --stage <阶段>     # 只执行一个阶段（见 STAGES）
+
+任务分为多个阶段，中间结果保存在 backend/data/batch_work，
+失败后重新运行从第一个未完成的阶段继续。
 """
 
+import hashlib
+import io
 import json
+import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from datetime import datetime
 import yaml
@@ -22,6 +35,71 @@ except ImportError:
 
 import happybase
 
+from backend.db.schema import (
+    RATING_BUCKETS,
+    RowKeyCodec,
+    histogram_cells,
+    histogram_to_distribution,
+)
+from backend.db.rating_stats import ArrayRatingStats
+from backend.db.table_spec import TableSpec, create_table, sample_csv_columns, split_points
+from backend.services.batch_stages import STAGES
+from backend.services.index_file import current_index_file, read_movie_index, write_movie_index
+
+# 评分文件指纹覆盖的开头字节数（增量模式下判断文件是否被整体替换）
+FINGERPRINT_BYTES = 64 * 1024
+
+# ratings.csv 的列
+RATING_COLUMNS = ['userId', 'movieId', 'rating', 'timestamp']
+
+
+class _ByteRange(io.RawIOBase):
+    """只读文件 [start, end) 字节区间的文件对象，供 pandas 按区间解析 CSV"""
+    
+    def __init__(self, path: Path, start: int, end: int):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+    
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def movie_cells(stats: dict) -> dict:
+    """一部电影的统计写入 movies 表的单元格（也用于与已发布快照比较）"""
+    data = {
+        b'info:avg_rating': f"{stats['avg']:.2f}".encode('utf-8'),
+        b'info:rating_count': str(stats['count']).encode('utf-8')
+    }
+    data.update(histogram_cells(stats['hist']))
+    return data
+
+
+def _write_by_movie_partition(hbase_options: dict, table_name: str, keys: RowKeyCodec, rows):
+    """在 Spark executor 上把一个分区的评分写入 ratings_by_movie 索引表"""
+    connection = happybase.Connection(**hbase_options)
+    try:
+        with connection.table(table_name).batch(batch_size=10000) as batch:
+            for row in rows:
+                batch.put(
+                    keys.by_movie_key(row['movieId'], row['timestamp'], row['userId']),
+                    {b'data:rating': row['rating'].encode('utf-8')}
+                )
+    finally:
+        connection.close()
+
 
 class BatchProcessor:
     """批处理器"""
@@ -38,13 +116,41 @@ class BatchProcessor:
         self.spark = None
         self.connection = None
         
+        # 计算引擎：pandas / spark / auto（评分文件超过 spark_threshold_mb 且装有 PySpark 时用 spark）
+        batch_config = self.config.get('batch') or {}
+        self.engine = batch_config.get('engine', 'auto')
+        self.spark_threshold_mb = float(batch_config.get('spark_threshold_mb', 512))
+        self.spark_master = batch_config.get('spark_master', 'local[*]')
+        self.spark_driver_memory = batch_config.get('spark_driver_memory', '2g')
+        
+        # 增量模式：保存每部电影的累计统计和已处理到的字节位置（水位），
+        # 下次只读取评分文件新追加的部分；full_rebuild 为 True 时忽略已有状态
+        self.incremental = batch_config.get('incremental', True)
+        self.state_file = self.project_root / batch_config.get('state_file', 'backend/data/batch_state.npz')
+        self.full_rebuild = False
+        
+        # 只写入与上次发布的快照（即增量状态）不同的电影，write_workers 个连接并行写入
+        self.diff_updates = batch_config.get('diff_updates', True)
+        self.write_workers = max(1, int(batch_config.get('write_workers', 4)))
+        
+        # 行键编码须与导入时一致
+        database = self.config['database']
+        self.keys = RowKeyCodec(database.get('key_encoding', 'string'), database.get('ratings_salt_buckets', 0))
+        
         # 使用绝对路径
         data_dir = self.project_root / "backend" / "data"
         self.log_file = data_dir / "batch_log.txt"
         self.status_file = data_dir / "batch_status.json"
         
+        # 各阶段的中间结果和完成情况，失败后重新运行从第一个未完成的阶段继续
+        self.work_dir = data_dir / "batch_work"
+        self.pipeline_file = self.work_dir / "pipeline.json"
+        self.aggregate_file = self.work_dir / "aggregate.npz"
+        
+        self.ratings_path = self.project_root / self.config['data']['csv_dir'] / self.config['data']['ratings_file']
+        
         # 确保目录存在
-        data_dir.mkdir(parents=True, exist_ok=True)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
     
     def log(self, message: str, level: str = "INFO"):
         """写日志"""
@@ -74,40 +180,62 @@ class BatchProcessor:
         with open(self.log_file, 'w', encoding='utf-8') as f:
             f.write("")
     
+    def resolve_engine(self, ratings_path: Path) -> str:
+        """确定计算引擎"""
+        engine = self.engine
+        if engine == 'auto':
+            size_mb = ratings_path.stat().st_size / (1024 * 1024)
+            engine = 'spark' if SPARK_AVAILABLE and size_mb >= self.spark_threshold_mb else 'pandas'
+            self.log(f"评分文件 {size_mb:,.1f} MB，自动选择 {engine} 引擎")
+        if engine == 'spark' and not SPARK_AVAILABLE:
+            self.log("PySpark 不可用，使用 Pandas 模式", "WARN")
+            engine = 'pandas'
+        return engine
+    
     def init_spark(self):
-        """初始化 Spark"""
+        """初始化 Spark
+        
+        shuffle 分区数与可用核数一致，聚合和写入阶段每个核处理一个分区；
+        executor 的 PYTHONPATH 指向项目根目录，以便分区写入函数导入 backend 包
+        """
         if not SPARK_AVAILABLE:
             self.log("PySpark 不可用，使用 Pandas 模式", "WARN")
             return False
         
         try:
-            self.log("初始化 Spark Session...")
+            self.log(f"初始化 Spark Session（master={self.spark_master}）...")
             self.spark = SparkSession.builder \
                 .appName("MovieLens Rating Calculator") \
-                .master("local[*]") \
-                .config("spark.driver.memory", "2g") \
-                .config("spark.sql.shuffle.partitions", "4") \
+                .master(self.spark_master) \
+                .config("spark.driver.memory", self.spark_driver_memory) \
+                .config("spark.executorEnv.PYTHONPATH", str(self.project_root)) \
                 .getOrCreate()
             
             self.spark.sparkContext.setLogLevel("WARN")
-            self.log("Spark Session 初始化成功")
+            parallelism = self.spark.sparkContext.defaultParallelism
+            self.spark.conf.set("spark.sql.shuffle.partitions", str(parallelism))
+            self.log(f"Spark Session 初始化成功，并行度 {parallelism}")
             return True
         except Exception as e:
             self.log(f"Spark 初始化失败: {e}", "ERROR")
             return False
     
+    def hbase_options(self) -> dict:
+        """happybase.Connection 的参数（driver 和 executor 共用）"""
+        return {
+            'host': self.config['hbase']['host'],
+            'port': self.config['hbase']['port'],
+            'timeout': 60000,
+            'transport': 'buffered',
+            'protocol': 'binary',
+        }
+    
     def connect_hbase(self):
         """连接 HBase"""
         self.log(f"连接 HBase: {self.config['hbase']['host']}:{self.config['hbase']['port']}")
         
         try:
-            self.connection = happybase.Connection(
-                host=self.config['hbase']['host'],
-                port=self.config['hbase']['port'],
-                timeout=60000,
-                transport='buffered',
-                protocol='binary'
-            )
+            self.connection = happybase.Connection(**self.hbase_options())
             tables = self.connection.tables()
             self.log(f"HBase 连接成功，当前有 {len(tables)} 个表")
             return True
@@ -115,117 +243,267 @@ class BatchProcessor:
             self.log(f"HBase 连接失败: {e}", "ERROR")
             return False
     
-    def calculate_with_spark(self, ratings_path: str):
-        """使用 Spark 计算评分统计"""
-        self.log(f"使用 Spark 读取评分数据: {ratings_path}")
+    def read_ratings_spark(self, ratings_path: str):
+        """用 Spark 读取评分文件，四列都按字符串读取（保持评分原始文本，且不需要 inferSchema 多扫一遍）"""
+        schema = StructType([
+            StructField(name, StringType(), True) for name in ('userId', 'movieId', 'rating', 'timestamp')
+        ])
+        return self.spark.read.csv(ratings_path, header=True, schema=schema)
+    
+    def calculate_with_spark(self, ratings_df):
+        """使用 Spark 计算评分统计
         
-        # 读取 CSV
-        df = self.spark.read.csv(ratings_path, header=True, inferSchema=True)
-        total_ratings = df.count()
-        self.log(f"总评分数: {total_ratings:,}")
+        按电影一次聚合得到总和、数量和半星直方图
         
-        # 计算每个电影的统计
+        Returns:
+            DataFrame: movieId, sum, count, hist_0 ... hist_9（已缓存）
+        """
         self.log("开始计算评分统计...")
-        stats_df = df.groupBy("movieId").agg(
-            F.avg("rating").alias("avg_rating"),
-            F.count("rating").alias("rating_count")
-        )
+        rating = F.col('rating').cast('double')
+        # 与 schema.rating_bucket 相同的半星档位
+        bucket = F.least(F.greatest(F.round(rating * 2).cast('int') - 1, F.lit(0)),
+                         F.lit(len(RATING_BUCKETS) - 1))
+        stats_df = ratings_df.groupBy('movieId').agg(
+            F.sum(rating).alias('sum'),
+            F.count(F.lit(1)).alias('count'),
+            *[F.sum(F.when(bucket == i, 1).otherwise(0)).alias(f'hist_{i}') for i in range(len(RATING_BUCKETS))]
+        ).cache()
+        self.log(f"计算完成，共 {stats_df.count():,} 部电影")
+        return stats_df
+    
+    @staticmethod
+    def collect_spark_stats(stats_df) -> dict:
+        """把每部电影一行的聚合结果取回 driver，保存为 aggregate 阶段的结果"""
+        return {
+            row['movieId']: {
+                'avg': row['sum'] / row['count'],
+                'count': int(row['count']),
+                'hist': [int(row[f'hist_{i}']) for i in range(len(RATING_BUCKETS))]
+            }
+            for row in stats_df.toLocalIterator()
+        }
+    
+    @staticmethod
+    def header_end(ratings_path: Path) -> int:
+        """表头行之后的字节位置"""
+        with open(ratings_path, 'rb') as f:
+            f.readline()
+            return f.tell()
+    
+    @staticmethod
+    def complete_lines_end(ratings_path: Path) -> int:
+        """最后一个完整行（以换行结尾）之后的字节位置，正在追加的半行留到下次处理"""
+        with open(ratings_path, 'rb') as f:
+            end = f.seek(0, os.SEEK_END)
+            while end > 0:
+                step = min(end, 64 * 1024)
+                f.seek(end - step)
+                position = f.read(step).rfind(b'\n')
+                if position >= 0:
+                    return end - step + position + 1
+                end -= step
+        return 0
+    
+    @staticmethod
+    def fingerprint(ratings_path: Path, length: int) -> str:
+        """评分文件开头 length 字节的 SHA-1"""
+        with open(ratings_path, 'rb') as f:
+            return hashlib.sha1(f.read(length)).hexdigest()
+    
+    def load_state(self, ratings_path: Path):
+        """读取增量状态，返回 (统计, 元数据)；不存在或与当前评分文件不匹配时返回 (None, None)"""
+        if not self.incremental or self.full_rebuild:
+            return None, None
+        if not self.state_file.exists():
+            self.log("没有增量状态，执行全量计算")
+            return None, None
         
-        # 收集结果
-        results = stats_df.collect()
-        self.log(f"计算完成，共 {len(results)} 部电影")
+        try:
+            stats, meta = ArrayRatingStats.load(self.state_file)
+        except Exception as e:
+            self.log(f"增量状态读取失败（{e}），执行全量计算", "WARN")
+            return None, None
         
+        offset = meta['offset']
+        if (meta.get('ratings_file') != str(ratings_path)
+                or ratings_path.stat().st_size < offset
+                or self.fingerprint(ratings_path, meta['fingerprint_bytes']) != meta['fingerprint']):
+            self.log("评分文件已被替换或截断，执行全量计算", "WARN")
+            return None, None
+        return stats, meta
+    
+    def applied_deltas(self) -> list:
+        """已合并到增量状态、但不在评分文件中的 delta 文件（import_data.py --delta）"""
+        if not self.state_file.exists():
+            return []
+        
+        try:
+            return ArrayRatingStats.load(self.state_file)[1].get('deltas', [])
+        except Exception:
+            return []
+    
+    def load_published(self) -> dict:
+        """上次发布到 HBase 的快照 {movie_id: 单元格}
+        
+        增量状态在 HBase 和索引更新成功后才保存，因此就是上次发布的统计；
+        没有状态或关闭了 diff_updates 时返回空字典（全部写入）
+        """
+        if not self.diff_updates or not self.state_file.exists():
+            return {}
+        
+        try:
+            stats, _ = ArrayRatingStats.load(self.state_file)
+        except Exception as e:
+            self.log(f"已发布快照读取失败（{e}），写入全部电影", "WARN")
+            return {}
+        return {movie_id: movie_cells(s) for movie_id, s in stats.result().items()}
+    
+    @staticmethod
+    def changed_movies(rating_stats: dict, published: dict) -> dict:
+        """rating_stats 中单元格与已发布快照不同的电影"""
         return {
-            str(row.movieId): {
-                "avg": float(row.avg_rating),
-                "count": int(row.rating_count)
-            }
-            for row in results
+            movie_id: stats for movie_id, stats in rating_stats.items()
+            if published.get(movie_id) != movie_cells(stats)
+        }
+    
+    def state_meta(self, ratings_path: Path, offset: int) -> dict:
+        """增量状态的元数据：评分文件、水位和文件开头的指纹"""
+        fingerprint_bytes = min(offset, FINGERPRINT_BYTES)
+        return {
+            'ratings_file': str(ratings_path),
+            'offset': offset,
+            'fingerprint_bytes': fingerprint_bytes,
+            'fingerprint': self.fingerprint(ratings_path, fingerprint_bytes),
+            'updated_at': datetime.now().isoformat(),
         }
     
-    def calculate_with_pandas(self, ratings_path: str):
-        """使用 Pandas 计算评分统计（备选方案）"""
+    def calculate_with_pandas(self, ratings_path: Path, stats, start: int, end: int) -> int:
+        """使用 Pandas 计算评分统计（备选方案）
+        
+        只解析评分文件 [start, end) 字节区间内的行，读取 movieId / rating 两列
+        （int32 / float32），每块用 bincount 累加到 stats
+        
+        Returns:
+            int: 本次读取的评分条数
+        """
+        import numpy as np
         import pandas as pd
         
-        self.log(f"使用 Pandas 读取评分数据: {ratings_path}")
+        self.log(f"使用 Pandas 读取评分数据: {ratings_path}（字节 {start:,} - {end:,}）")
+        if end <= start:
+            return 0
         
-        # 分块读取大文件
-        chunk_size = 100000
-        stats = {}
+        # 分块读取大文件，每块约 8 字节/行
+        chunk_size = 1000000
         total_ratings = 0
         
-        for chunk in pd.read_csv(ratings_path, chunksize=chunk_size):
-            total_ratings += len(chunk)
-            
-            # 按电影分组计算
-            grouped = chunk.groupby('movieId')['rating'].agg(['sum', 'count'])
-            
-            for movie_id, row in grouped.iterrows():
-                movie_id = str(movie_id)
-                if movie_id in stats:
-                    stats[movie_id]['sum'] += row['sum']
-                    stats[movie_id]['count'] += row['count']
-                else:
-                    stats[movie_id] = {
-                        'sum': row['sum'],
-                        'count': int(row['count'])
-                    }
-            
-            self.log(f"已处理 {total_ratings:,} 条评分...")
+        with io.BufferedReader(_ByteRange(ratings_path, start, end)) as reader:
+            for chunk in pd.read_csv(reader, header=None, names=RATING_COLUMNS, usecols=['movieId', 'rating'],
+                                     dtype={'movieId': np.int32, 'rating': np.float32},
+                                     chunksize=chunk_size, engine='c'):
+                total_ratings += len(chunk)
+                stats.add(chunk['movieId'].to_numpy(), chunk['rating'].to_numpy())
+                self.log(f"已处理 {total_ratings:,} 条评分...")
         
         self.log(f"总评分数: {total_ratings:,}")
-        
-        # 计算平均值
-        results = {
-            movie_id: {
-                "avg": data['sum'] / data['count'],
-                "count": data['count']
-            }
-            for movie_id, data in stats.items()
-        }
-        
-        self.log(f"计算完成，共 {len(results)} 部电影")
-        return results
+        return total_ratings
     
     def update_hbase(self, rating_stats: dict):
-        """更新 HBase 中的评分统计"""
-        self.log("开始更新 HBase...")
-        
-        movies_table = self.connection.table(self.config['database']['movies_table'])
-        batch = movies_table.batch(batch_size=1000)
+        """更新 HBase 中的评分统计
         
-        updated = 0
+        电影按 write_workers 分片，每个线程使用独立的连接和 batch 并行写入
+        """
         total = len(rating_stats)
+        workers = min(self.write_workers, total)
+        self.log(f"开始更新 HBase（{workers} 个连接并行写入）...")
         
-        for movie_id, stats in rating_stats.items():
-            data = {
-                b'info:avg_rating': f"{stats['avg']:.2f}".encode('utf-8'),
-                b'info:rating_count': str(stats['count']).encode('utf-8')
-            }
-            batch.put(movie_id.encode('utf-8'), data)
-            updated += 1
-            
-            if updated % 5000 == 0:
+        items = list(rating_stats.items())
+        table_name = self.config['database']['movies_table']
+        
+        def write(shard: list) -> int:
+            connection = happybase.Connection(**self.hbase_options())
+            try:
+                with connection.table(table_name).batch(batch_size=1000) as batch:
+                    for movie_id, stats in shard:
+                        batch.put(self.keys.movie_key(movie_id), movie_cells(stats))
+            finally:
+                connection.close()
+            return len(shard)
+        
+        updated = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for written in pool.map(write, [items[i::workers] for i in range(workers)]):
+                updated += written
                 self.log(f"已更新 {updated:,}/{total:,} 部电影 ({updated*100//total}%)")
-                self.update_status("running", updated * 80 // total + 10, f"更新 HBase: {updated}/{total}")
         
-        batch.send()
         self.log(f"HBase 更新完成: {updated:,} 部电影")
     
+    def sync_ratings_by_movie(self, ratings_path: str, ratings_df=None):
+        """维护按电影检索评分的索引表
+        
+        导入脚本会同步写入该表；对引入索引表之前导入的数据，
+        在表不存在时创建并从评分文件回填。传入 Spark 的评分 DataFrame 时
+        在各 executor 上并行回填。
+        """
+        table_name = self.config['database'].get('ratings_by_movie_table', 'ratings_by_movie')
+        if table_name.encode('utf-8') in self.connection.tables():
+            self.log(f"评分索引表 {table_name} 已存在，跳过回填")
+            return
+        
+        self.log(f"评分索引表 {table_name} 不存在，开始创建并回填...")
+        spec = TableSpec.from_config(self.config, 'ratings_by_movie', table_name, {'data': {}})
+        split_keys = []
+        if spec.regions > 1:
+            rows = sample_csv_columns(ratings_path, ['userId', 'movieId', 'timestamp'])
+            split_keys = split_points(
+                [self.keys.by_movie_key(movie_id, ts, user_id) for user_id, movie_id, ts in rows],
+                spec.regions
+            )
+        create_table(self.connection, spec, split_keys, log=self.log,
+                     use_shell=(self.config.get('tables') or {}).get('use_shell', True))
+        if ratings_df is not None:
+            ratings_df.foreachPartition(partial(_write_by_movie_partition, self.hbase_options(), table_name, self.keys))
+            self.log("评分索引表回填完成")
+            return
+        
+        import pandas as pd
+        
+        table = self.connection.table(table_name)
+        written = 0
+        with table.batch(batch_size=10000) as batch:
+            # 按字符串读取，保持评分原始文本格式
+            for chunk in pd.read_csv(ratings_path, chunksize=100000, dtype=str):
+                for user_id, movie_id, rating, timestamp in zip(
+                        chunk['userId'], chunk['movieId'], chunk['rating'], chunk['timestamp']):
+                    batch.put(
+                        self.keys.by_movie_key(movie_id, timestamp, user_id),
+                        {b'data:rating': rating.encode('utf-8')}
+                    )
+                written += len(chunk)
+                self.log(f"已回填 {written:,} 条评分...")
+        
+        self.log(f"评分索引表回填完成: {written:,} 条")
+    
     def update_index(self, rating_stats: dict):
-        """更新 JSON 索引文件"""
-        self.log("开始更新 JSON 索引...")
+        """更新电影索引文件（mmap 二进制格式）"""
+        self.log("开始更新电影索引...")
         
         # 使用绝对路径
-        index_path = self.project_root / "backend" / "data" / "movie_index.json"
-        if not index_path.exists():
+        data_dir = self.project_root / "backend" / "data"
+        index_path = data_dir / "movie_index.bin"
+        legacy_path = data_dir / "movie_index.json"
+        
+        # 读取现有索引（兼容旧版 JSON 索引）
+        if current_index_file(index_path) is not None:
+            movies = read_movie_index(index_path)
+        elif legacy_path.exists():
+            self.log("使用旧版 JSON 索引作为基础，将转换为二进制格式", "WARN")
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                movies = json.load(f)
+        else:
             self.log("索引文件不存在，跳过更新", "WARN")
             return
         
-        # 读取现有索引
-        with open(index_path, 'r', encoding='utf-8') as f:
-            movies = json.load(f)
-        
         # 更新评分
         updated = 0
         for movie in movies:
@@ -234,16 +512,169 @@ class BatchProcessor:
                 stats = rating_stats[movie_id]
                 movie['avg_rating'] = round(stats['avg'], 2)
                 movie['rating_count'] = stats['count']
+                movie['rating_distribution'] = histogram_to_distribution(stats['hist'])
                 updated += 1
         
-        # 写回索引
-        with open(index_path, 'w', encoding='utf-8') as f:
-            json.dump(movies, f, ensure_ascii=False)
+        # 写回索引（重新生成排名和倒排索引）
+        write_movie_index(index_path, movies)
         
         self.log(f"索引更新完成: {updated} 部电影")
     
-    def run(self):
-        """执行批处理"""
+    def load_pipeline(self) -> dict:
+        """读取未完成的流水线；没有时返回新的流水线"""
+        if self.pipeline_file.exists():
+            with open(self.pipeline_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'engine': None, 'completed': [], 'started_at': datetime.now().isoformat()}
+    
+    def save_pipeline(self, pipeline: dict):
+        """保存流水线进度"""
+        temp_path = self.pipeline_file.with_name(self.pipeline_file.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(pipeline, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.pipeline_file)
+    
+    def load_aggregate(self):
+        """读取 aggregate 阶段的结果，返回 ({movie_id: 统计}（仅有变化的电影）, 元数据)"""
+        if not self.aggregate_file.exists():
+            raise FileNotFoundError(f"缺少 aggregate 阶段的结果: {self.aggregate_file}，请先运行 aggregate 阶段")
+        
+        stats, meta = ArrayRatingStats.load(self.aggregate_file)
+        results = stats.result()
+        return {movie_id: results[movie_id] for movie_id in meta['changed']}, meta
+    
+    def spark_engine(self, pipeline: dict) -> bool:
+        """本次流水线是否使用 Spark（续跑时按需重新初始化 Spark Session）"""
+        if pipeline['engine'] != 'spark':
+            return False
+        return self.spark is not None or self.init_spark()
+    
+    def stage_aggregate(self, pipeline: dict):
+        """计算评分统计（增量或全量），与已发布快照比较后保存结果"""
+        ratings_path = self.ratings_path
+        if not ratings_path.exists():
+            raise FileNotFoundError(f"评分文件不存在: {ratings_path}")
+        
+        end = max(self.complete_lines_end(ratings_path), self.header_end(ratings_path))
+        published = self.load_published()
+        stats, state = self.load_state(ratings_path)
+        if stats is not None:
+            # 新增部分通常很小，直接用 Pandas 解析
+            engine = 'pandas'
+            offset, deltas = state['offset'], state.get('deltas', [])
+            mode = f"增量，从字节 {offset:,} 开始，新增 {end - offset:,} 字节"
+        else:
+            deltas = []
+            for path in self.applied_deltas():
+                self.log(f"全量计算只使用评分文件，增量导入的 {path} 中的评分将被丢弃", "WARN")
+            engine = self.resolve_engine(ratings_path)
+            if engine == 'spark' and not self.init_spark():
+                engine = 'pandas'
+            mode = "全量"
+            # 增量时末尾的半行留到下次处理；全量时把文件结尾当作行结束，
+            # 否则末尾没有换行的最后一行在之后的增量中也永远不会被统计
+            size = ratings_path.stat().st_size
+            if size > end:
+                self.log(f"评分文件末尾没有换行，最后 {size - end:,} 字节按完整行统计，"
+                         "之后追加的数据需以换行开头", "WARN")
+                end = size
+        pipeline['engine'] = engine
+        
+        self.log(f"计算引擎: {'Spark' if engine == 'spark' else 'Pandas'}（{mode}）")
+        self.log(f"评分文件: {ratings_path}")
+        
+        if engine == 'spark':
+            stats_df = self.calculate_with_spark(self.read_ratings_spark(str(ratings_path)))
+            stats = ArrayRatingStats.from_result(self.collect_spark_stats(stats_df))
+            stats_df.unpersist()
+            # Spark 读取整个文件：若文件在水位之后还有数据（运行期间追加的行），
+            # 这些行已被计入，下次增量又会计入一次，改用 Pandas 按字节区间重算
+            if ratings_path.stat().st_size != end:
+                self.log("评分文件在水位之后还有数据，Spark 结果可能包含这些行，改用 Pandas 按水位重算", "WARN")
+                pipeline['engine'] = engine = 'pandas'
+                stats = None
+        if engine != 'spark':
+            if stats is None:
+                stats, offset = ArrayRatingStats(), self.header_end(ratings_path)
+            self.calculate_with_pandas(ratings_path, stats, offset, end)
+        
+        # 只输出本次有新评分、且与已发布快照不同的电影；关闭 diff_updates 时输出全部电影
+        changed = self.changed_movies(stats.result(changed_only=self.diff_updates), published)
+        self.log(f"计算完成，{len(changed)} 部电影的统计有变化")
+        meta = dict(self.state_meta(ratings_path, end), changed=sorted(changed), deltas=deltas)
+        stats.save(self.aggregate_file, meta)
+        # commit 阶段据此判断 aggregate.npz 是否已替换为增量状态
+        pipeline['watermark'] = {'offset': meta['offset'], 'fingerprint': meta['fingerprint']}
+    
+    def stage_movies(self, pipeline: dict):
+        """把有变化的电影写入 movies 表
+        
+        aggregate 阶段的结果保存在 driver 本地（每部电影一行），两种引擎都由
+        write_workers 个线程写入
+        """
+        rating_stats, _ = self.load_aggregate()
+        if not rating_stats:
+            self.log("统计没有变化，跳过 HBase 更新")
+        else:
+            self.update_hbase(rating_stats)
+    
+    def stage_ratings_by_movie(self, pipeline: dict):
+        """确保按电影检索评分的索引表存在（Spark 引擎下在各 executor 上回填）"""
+        if not self.connection and not self.connect_hbase():
+            raise ConnectionError("无法连接 HBase")
+        ratings_df = self.read_ratings_spark(str(self.ratings_path)) if self.spark_engine(pipeline) else None
+        self.sync_ratings_by_movie(str(self.ratings_path), ratings_df)
+    
+    def stage_index(self, pipeline: dict):
+        """更新电影索引文件"""
+        rating_stats, _ = self.load_aggregate()
+        if rating_stats:
+            self.update_index(rating_stats)
+        else:
+            self.log("统计没有变化，跳过索引更新")
+    
+    def stage_commit(self, pipeline: dict):
+        """用 aggregate 阶段的结果替换增量状态，推进水位
+        
+        可重复执行：替换后、删除流水线文件前中断时，aggregate.npz 已不存在而
+        增量状态的水位与流水线记录一致，视为已提交
+        """
+        if not self.aggregate_file.exists() and self.state_file.exists():
+            _, meta = ArrayRatingStats.load(self.state_file)
+            watermark = pipeline.get('watermark')
+            if watermark == {'offset': meta['offset'], 'fingerprint': meta['fingerprint']}:
+                self.log(f"增量状态已是本次结果（水位 {meta['offset']:,} 字节），无需重复提交")
+                return
+        _, meta = self.load_aggregate()
+        os.replace(self.aggregate_file, self.state_file)
+        self.log(f"增量状态已保存，水位 {meta['offset']:,} 字节")
+    
+    def run_stage(self, stage: str, pipeline: dict):
+        """执行单个阶段并记录完成"""
+        position = STAGES.index(stage)
+        self.update_status("running", position * 100 // len(STAGES), f"阶段 {position + 1}/{len(STAGES)}: {stage}")
+        self.log(f"[阶段 {position + 1}/{len(STAGES)}] {stage}")
+        stage_start = time.time()
+        
+        getattr(self, f"stage_{stage}")(pipeline)
+        
+        if stage == 'aggregate':
+            # 重新计算后，后续阶段都要基于新结果重做
+            pipeline['completed'] = []
+        if stage not in pipeline['completed']:
+            pipeline['completed'].append(stage)
+        if stage == 'commit':
+            self.pipeline_file.unlink(missing_ok=True)
+        else:
+            self.save_pipeline(pipeline)
+        self.log(f"[阶段 {position + 1}/{len(STAGES)}] {stage} 完成，耗时 {time.time() - stage_start:.1f} 秒")
+    
+    def run(self, stage: str = None):
+        """执行批处理
+        
+        依次执行各阶段，跳过上次已完成的阶段；stage 不为空时只执行该阶段
+        （要求之前的阶段都已完成，aggregate 除外）
+        """
         start_time = time.time()
         
         try:
@@ -251,37 +682,27 @@ class BatchProcessor:
             self.clear_log()
             self.update_status("running", 0, "初始化...")
             
+            if self.full_rebuild:
+                self.pipeline_file.unlink(missing_ok=True)
+            pipeline = self.load_pipeline()
+            
             self.log("=" * 60)
-            self.log("批处理任务开始（使用 Pandas）")
+            if stage is not None:
+                missing = [s for s in STAGES[:STAGES.index(stage)] if s not in pipeline['completed']]
+                if stage != 'aggregate' and missing:
+                    raise RuntimeError(f"阶段 {stage} 需要先完成: {', '.join(missing)}")
+                self.log(f"批处理任务开始（只执行阶段 {stage}）")
+                stages = [stage]
+            else:
+                stages = [s for s in STAGES if s not in pipeline['completed']]
+                if pipeline['completed']:
+                    self.log(f"批处理任务开始（从阶段 {stages[0]} 继续，已完成: {', '.join(pipeline['completed'])}）")
+                else:
+                    self.log("批处理任务开始")
             self.log("=" * 60)
             
-            # 检查数据文件（使用绝对路径）
-            csv_dir = self.project_root / self.config['data']['csv_dir']
-            ratings_path = csv_dir / self.config['data']['ratings_file']
-            
-            if not ratings_path.exists():
-                raise FileNotFoundError(f"评分文件不存在: {ratings_path}")
-            
-            self.log(f"评分文件: {ratings_path}")
-            self.update_status("running", 5, "读取数据...")
-            
-            # 直接使用 Pandas 计算（更快更稳定）
-            # Spark 在本地环境初始化很慢，对于这个任务 Pandas 足够了
-            self.update_status("running", 10, "计算评分统计...")
-            rating_stats = self.calculate_with_pandas(str(ratings_path))
-            
-            self.update_status("running", 50, "连接 HBase...")
-            
-            # 连接 HBase
-            if not self.connect_hbase():
-                raise ConnectionError("无法连接 HBase")
-            
-            # 更新 HBase
-            self.update_hbase(rating_stats)
-            self.update_status("running", 90, "更新索引...")
-            
-            # 更新索引
-            self.update_index(rating_stats)
+            for name in stages:
+                self.run_stage(name, pipeline)
             
             elapsed = time.time() - start_time
             self.log("=" * 60)
@@ -302,6 +723,8 @@ class BatchProcessor:
             if self.connection:
                 self.connection.close()
                 self.log("HBase 连接已关闭")
+            if self.spark is not None:
+                self.spark.stop()
 
 
 def main():
@@ -319,7 +742,11 @@ def main():
     
     try:
         processor = BatchProcessor()
-        success = processor.run()
+        processor.full_rebuild = '--full' in sys.argv[1:]
+        stage = sys.argv[sys.argv.index('--stage') + 1] if '--stage' in sys.argv[1:-1] else None
+        if stage is not None and stage not in STAGES:
+            raise ValueError(f"未知阶段: {stage}，可选: {', '.join(STAGES)}")
+        success = processor.run(stage)
         sys.exit(0 if success else 1)
     except Exception as e:
         # 确保错误被记录
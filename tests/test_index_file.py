@@ -0,0 +1,88 @@
+"""电影索引文件写入 -> 读取往返测试"""
+
+from backend.services import index_file
+from backend.services.index_file import (
+    MovieIndexFile, current_index_file, sort_permutations, write_movie_index,
+)
+
+MOVIES = [
+    {'id': '3', 'title': 'Grumpier Old Men (1995)', 'genres': 'Comedy|Romance',
+     'avg_rating': 3.25, 'rating_count': 4, 'rating_distribution': {'3.0': 3, '4.0': 1}},
+    {'id': '1', 'title': 'Toy Story (1995)', 'genres': 'Adventure|Animation|Children',
+     'avg_rating': 4.5, 'rating_count': 2, 'rating_distribution': {'4.0': 1, '5.0': 1}},
+    {'id': '10', 'title': 'alien (1979)', 'genres': 'Horror|Sci-Fi',
+     'avg_rating': 4.0, 'rating_count': 7, 'rating_distribution': {'4.0': 7}},
+]
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'movie_index.bin'
+    assert write_movie_index(path, MOVIES) == len(MOVIES)
+
+    index = MovieIndexFile(path)
+    assert len(index) == len(MOVIES)
+    assert [m['id'] for m in index.movies()] == ['1', '3', '10']
+    assert index.movie(index.find_row('3')) == MOVIES[0]
+    assert index.find_row('2') is None
+
+
+def test_sort_sections_are_loaded_from_file(tmp_path, monkeypatch):
+    path = tmp_path / 'movie_index.bin'
+    write_movie_index(path, MOVIES)
+    expected = sort_permutations(
+        ['Toy Story (1995)', 'Grumpier Old Men (1995)', 'alien (1979)'], [4.5, 3.25, 4.0], [2, 4, 7]
+    )
+
+    # 排序段齐全时加载不应重新计算
+    def fail(*args, **kwargs):
+        raise AssertionError("加载时重新计算了排序")
+    monkeypatch.setattr(index_file, 'sort_permutations', fail)
+
+    index = MovieIndexFile(path)
+    for key, order in expected.items():
+        assert list(index.sort_order(key)) == list(order)
+    assert list(index.sort_order('rating')) == [0, 2, 1]
+    assert list(index.sort_order('id')) == [0, 1, 2]
+
+
+def test_section_names_fit_directory():
+    assert all(len(name) <= index_file._SECTION_NAME_SIZE for name in index_file._SORT_SECTIONS.values())
+
+
+def test_rewrite_while_mapped(tmp_path):
+    path = tmp_path / 'movie_index.bin'
+    write_movie_index(path, MOVIES)
+    old = MovieIndexFile(path)
+    rank_slice = old.sort_order('rating')[:2]
+
+    # 旧映射仍打开时写出新索引：写到新的代文件，不替换被映射的文件
+    updated = [dict(m, avg_rating=1.0) if m['id'] == '1' else m for m in MOVIES]
+    write_movie_index(path, updated)
+    assert current_index_file(path) != old.path
+
+    new = MovieIndexFile(path)
+    assert new.movie(new.find_row('1'))['avg_rating'] == 1.0
+    assert old.movie(old.find_row('1'))['avg_rating'] == 4.5
+
+    # 重新加载后关闭旧映射；调用方仍持有的切片不影响关闭
+    old.close()
+    assert list(rank_slice) == [0, 2]
+    del rank_slice
+
+    write_movie_index(path, MOVIES)
+    remaining = sorted(p.name for p in tmp_path.iterdir())
+    assert remaining == ['movie_index.3.bin', 'movie_index.current']
+    new.close()
+
+
+def test_reads_legacy_single_file(tmp_path):
+    path = tmp_path / 'movie_index.bin'
+    write_movie_index(path, MOVIES)
+    current_index_file(path).replace(path)
+    (tmp_path / 'movie_index.current').unlink()
+
+    with MovieIndexFile(path) as index:
+        assert index.path == path
+        assert len(index) == len(MOVIES)
+    write_movie_index(path, MOVIES)
+    assert not path.exists()